@@ -1,15 +1,26 @@
 from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.parallel import ParallelScanMixin, ScanSource, split_file, read_csv_header, read_csv_range
 from postgres_proto.flow import PostgresError, catch_all_as_postgres_error_context
 from contextlib import contextmanager
+from functools import partial
 import csv
 
 
-class CSVRequestHandler(PostgresRequestHandler):
+class CSVRequestHandler(ParallelScanMixin, PostgresRequestHandler):
     @contextmanager
     def csv_reader(self):
         with catch_all_as_postgres_error_context(), open(self.server.csv_filename, newline='') as csvfile:
             yield csv.DictReader(csvfile)
 
+    def get_scan_source(self, table):
+        # single table queries are executed in parallel on ranges of the file
+        if table.name != 'csv':
+            return None
+        with catch_all_as_postgres_error_context():
+            fieldnames, start = read_csv_header(self.server.csv_filename)
+            ranges = split_file(self.server.csv_filename, self.scan_chunk_size, start)
+        return ScanSource(partial(read_csv_range, fieldnames=fieldnames), ranges, fieldnames)
+
     def query_tables(self, stmt_info):
         if len(stmt_info.tables) != 1 or stmt_info.tables[0].name != 'csv':
             raise PostgresError('unknown table')
@@ -27,4 +38,5 @@ class CSVRequestHandler(PostgresRequestHandler):
 if __name__ == '__main__':
     from postgres_proto.server import start_server, cli_arg_parser
     cli_arg_parser.add_argument('csv_filename')
+    cli_arg_parser.add_argument('--scan-workers', type=int, help='Number of processes scanning the file')
     start_server(CSVRequestHandler, **vars(cli_arg_parser.parse_args()))
@@ -1,32 +1,20 @@
 from postgres_proto.socket_handler import PostgresRequestHandler
-from postgres_proto.flow import PostgresError
+from postgres_proto.socket_handler.memory_tables import MemoryTablesMixin, MemoryTable
 
 
 DATABASE = {
-    'table1': [
+    'table1': MemoryTable(['id', 'title'], [
         {'id': 1, 'title': 'hello world'},
         {'id': 2, 'title': 'my second row'}
-    ],
-    'table2': [
+    ], hash_indexes=['id'], sorted_indexes=['title']),
+    'table2': MemoryTable(['id', 'name'], [
         {'id': 1, 'name': 'first row, second table'}
-    ]
+    ], hash_indexes=['id'])
 }
 
 
-class StaticRequestHandler(PostgresRequestHandler):
-    def query_tables(self, stmt_info):
-        if len(stmt_info.tables) != 1:
-            raise PostgresError('can query only one table at a time')
-        table_name = stmt_info.tables[0].name
-        if table_name not in DATABASE:
-            raise PostgresError('unknown table')
-        return DATABASE[table_name], DATABASE[table_name][0].keys()
-
-    def list_tables(self):
-        return DATABASE.keys()
-
-    def describe_table(self, table_name):
-        return DATABASE[table_name][0].keys()
+class StaticRequestHandler(MemoryTablesMixin, PostgresRequestHandler):
+    memory_tables = DATABASE
 
 
 if __name__ == '__main__':
@@ -1,23 +1,30 @@
 from postgres_proto.socket_handler import PostgresRequestHandler
-from postgres_proto.flow import PostgresError, catch_all_as_postgres_error_context
-from postgres_proto.sql import tokenize_where_expr
+from postgres_proto.socket_handler.federated import FederatedQueryMixin, TableSource
+from postgres_proto.flow import catch_all_as_postgres_error_context
+from postgres_proto.sql import tokenize_where_expr, resolve_param
 import urllib.request
 import urllib.parse
 import json
 
 
-class WebRequestRequestHandler(PostgresRequestHandler):
-    def query_tables(self, table_names, where_cond):
+class WebRequestSource(TableSource):
+    def __init__(self, url, timeout=None):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch_table(self, table, stmt_info):
         with catch_all_as_postgres_error_context():
-            url = next(iter(table_names))
-            if where_cond:
+            url = self.url
+            if stmt_info.where and len(stmt_info.tables) == 1:
                 query_params = []
-                for left_expr, op, right_expr in tokenize_where_expr(where_cond):
-                    right_expr = urllib.parse.quote_plus(right_expr)
+                for left_expr, op, right_expr in tokenize_where_expr(stmt_info.where):
+                    # bound parameters ($1, ...) are sent as their values
+                    right_expr = resolve_param(right_expr, stmt_info.params)
+                    right_expr = urllib.parse.quote_plus('' if right_expr is None else str(right_expr))
                     query_params.append(f"{left_expr}={right_expr}")
                 url += '?' + '&'.join(query_params)
 
-            data = urllib.request.urlopen(url).read().decode()
+            data = urllib.request.urlopen(url, timeout=self.timeout).read().decode()
             try:
                 data = json.loads(data)
             except:
@@ -32,6 +39,16 @@ class WebRequestRequestHandler(PostgresRequestHandler):
             return [{'item': i} for i in data], ['item']
 
 
+class WebRequestRequestHandler(FederatedQueryMixin, PostgresRequestHandler):
+    """Each table is mapped to a url using --source table_name=url
+       Querying multiple tables fetches all urls concurrently.
+    """
+    def get_table_sources(self):
+        return {name: WebRequestSource(url, self.server.source_timeout) for name, url in self.server.sources}
+
+
 if __name__ == '__main__':
     from postgres_proto.server import start_server, cli_arg_parser
+    cli_arg_parser.add_argument('--source', dest='sources', action='append', default=[], type=lambda v: v.split('=', 1))
+    cli_arg_parser.add_argument('--source-timeout', type=float)
     start_server(WebRequestRequestHandler, **vars(cli_arg_parser.parse_args()))
@@ -0,0 +1,3 @@
+"""
+Ready to use request handlers for existing databases
+"""
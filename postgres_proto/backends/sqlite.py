@@ -0,0 +1,252 @@
+import sqlite3
+from contextlib import contextmanager
+from decimal import Decimal
+from ..flow import PostgresError
+from ..sql import resolve_param, SqlExpr
+from ..stream import ColumnDef
+from ..socket_handler import PostgresRequestHandler, stmt_handler
+from ..socket_handler.sorting import parse_limit
+
+
+def quote_identifier(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def translate_table(table):
+    if table.subquery:
+        raise PostgresError('subqueries in FROM are not supported', code='0A000')
+    # postgres schemas have no equivalent in sqlite
+    sql = quote_identifier(table.name)
+    if table.alias:
+        sql += ' AS ' + quote_identifier(table.alias)
+    for join in table.joins or ():
+        sql += ' %s JOIN %s ON %s' % (join.type, translate_table(join.table),
+                                      ' AND '.join(f"{left} = {right}" for left, right in join.on))
+    return sql
+
+
+def adapt_param(value):
+    # types not supported by the sqlite3 module are sent as text
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def translate_select(stmt_info):
+    """Translates a SelectStmt to a SQLite query. Returns a tuple (sql, args) where args are named parameters
+    """
+    args = {str(i + 1): adapt_param(value) for i, value in enumerate(stmt_info.params or ())}
+    cols = []
+    for col in stmt_info.columns:
+        cols.append((col.expr or col.name) + (' AS ' + quote_identifier(col.alias) if col.alias else ''))
+    sql = 'SELECT ' + ', '.join(cols)
+    if stmt_info.tables:
+        sql += ' FROM ' + ', '.join(translate_table(t) for t in stmt_info.tables)
+    if stmt_info.where:
+        # parameters ($1, $2, ...) are also supported by sqlite as named parameters
+        sql += ' WHERE ' + stmt_info.where
+    if stmt_info.group_by:
+        sql += ' GROUP BY ' + stmt_info.group_by
+    if stmt_info.order_by:
+        sql += ' ORDER BY ' + stmt_info.order_by
+    limit = parse_limit(resolve_param(stmt_info.limit, stmt_info.params), 'LIMIT')
+    offset = parse_limit(resolve_param(stmt_info.offset, stmt_info.params), 'OFFSET')
+    if limit is not None or offset:
+        sql += ' LIMIT %d' % (-1 if limit is None else limit)
+    if offset:
+        sql += ' OFFSET %d' % offset
+    return sql, args
+
+
+def translate_value(value, args):
+    if isinstance(value, SqlExpr):
+        return value.sql
+    args[f"v{len(args)}"] = adapt_param(value)
+    return f":v{len(args) - 1}"
+
+
+def translate_insert(table, cols, exprs):
+    if not cols:
+        return f"INSERT INTO {quote_identifier(table.name)} DEFAULT VALUES"
+    return 'INSERT INTO %s (%s) VALUES (%s)' % (quote_identifier(table.name), ', '.join(quote_identifier(c) for c in cols),
+                                                ', '.join('?' if expr is None else expr for expr in exprs))
+
+
+def translate_write_args(stmt_info):
+    return {str(i + 1): adapt_param(value) for i, value in enumerate(stmt_info.params or ())}
+
+
+def translate_update(table, assignments, stmt_info):
+    args = translate_write_args(stmt_info)
+    sets = ', '.join(f"{quote_identifier(col)} = {translate_value(value, args)}" for col, value in assignments.items())
+    sql = f"UPDATE {translate_table(table)} SET {sets}"
+    if stmt_info.tables:
+        sql += ' FROM ' + ', '.join(translate_table(t) for t in stmt_info.tables)
+    if stmt_info.where:
+        sql += ' WHERE ' + stmt_info.where
+    return sql, args
+
+
+def translate_delete(table, stmt_info):
+    sql = f"DELETE FROM {translate_table(table)}"
+    if stmt_info.where:
+        sql += ' WHERE ' + stmt_info.where
+    return sql, translate_write_args(stmt_info)
+
+
+def cursor_dicts(cursor):
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
+
+
+def iter_cursor(cursor, size):
+    try:
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cursor.close()
+
+
+# SQLSTATE codes of sqlite errors, by exception type and message prefix
+SQLITE_ERROR_CODES = [
+    (sqlite3.IntegrityError, 'UNIQUE constraint failed', '23505'),
+    (sqlite3.IntegrityError, 'NOT NULL constraint failed', '23502'),
+    (sqlite3.IntegrityError, 'FOREIGN KEY constraint failed', '23503'),
+    (sqlite3.IntegrityError, 'CHECK constraint failed', '23514'),
+    (sqlite3.IntegrityError, '', '23000'),
+    (sqlite3.OperationalError, 'no such table', '42P01'),
+    (sqlite3.OperationalError, 'no such column', '42703'),
+    (sqlite3.OperationalError, 'no such function', '42883'),
+    (sqlite3.OperationalError, 'near ', '42601'),
+    (sqlite3.OperationalError, 'database is locked', '55P03'),
+    (sqlite3.DataError, '', '22000'),
+    (sqlite3.Error, '', 'XX000')
+]
+
+
+def sqlite_error(e):
+    message = str(e)
+    code = next(code for error_type, prefix, code in SQLITE_ERROR_CODES
+                if isinstance(e, error_type) and message.startswith(prefix))
+    return PostgresError(message, code=code)
+
+
+class SQLiteRequestHandler(PostgresRequestHandler):
+    """Serves a SQLite database. SELECT statements are translated to SQLite queries so that filtering, joins,
+       aggregation, sorting and limits are performed by SQLite. INSERT, UPDATE and DELETE are executed in a
+       transaction, unless the session started one using BEGIN. Connections are shared by all sessions using
+       the resource pool (see pool_size). Set the database path using the sqlite_database property of the server.
+    """
+    fetch_size = 1000
+
+    def create_pooled_resource(self):
+        # transactions are explicit, see sqlite_transaction()
+        return sqlite3.connect(self.server.sqlite_database, check_same_thread=False, isolation_level=None)
+
+    def reset_pooled_resource(self, conn):
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+
+    def get_connection(self):
+        return self.pooled_resource
+
+    def execute_sqlite(self, sql, args=()):
+        try:
+            return self.get_connection().execute(sql, args)
+        except sqlite3.Error as e:
+            raise sqlite_error(e)
+
+    def begin_transaction(self):
+        self.execute_sqlite('BEGIN')
+
+    def commit_transaction(self):
+        self.execute_sqlite('COMMIT')
+
+    def rollback_transaction(self):
+        if self.get_connection().in_transaction:
+            self.execute_sqlite('ROLLBACK')
+
+    @contextmanager
+    def sqlite_transaction(self):
+        conn = self.get_connection()
+        if conn.in_transaction:
+            # part of the transaction of the session
+            try:
+                yield conn
+            except sqlite3.Error as e:
+                raise sqlite_error(e)
+            return
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        except BaseException as e:
+            conn.execute('ROLLBACK')
+            if isinstance(e, sqlite3.Error):
+                raise sqlite_error(e)
+            raise
+        conn.execute('COMMIT')
+
+    def insert_rows(self, table, rows, stmt_info):
+        # rows are inserted using one executemany() per set of columns
+        groups = {}
+        for row in rows:
+            exprs = tuple(v.sql if isinstance(v, SqlExpr) else None for v in row.values())
+            args = tuple(adapt_param(v) for v in row.values() if not isinstance(v, SqlExpr))
+            groups.setdefault((tuple(row), exprs), []).append(args)
+        inserted = []
+        count = 0
+        with self.sqlite_transaction() as conn:
+            for (cols, exprs), args in groups.items():
+                sql = translate_insert(table, cols, exprs)
+                if stmt_info.returning:
+                    for row_args in args:
+                        inserted.extend(cursor_dicts(conn.execute(sql + ' RETURNING *', row_args)))
+                else:
+                    count += conn.executemany(sql, args).rowcount
+        return inserted if stmt_info.returning else count
+
+    def update_rows(self, table, assignments, stmt_info):
+        return self.execute_write(*translate_update(table, assignments, stmt_info), stmt_info.returning)
+
+    def delete_rows(self, table, stmt_info):
+        return self.execute_write(*translate_delete(table, stmt_info), stmt_info.returning)
+
+    def execute_write(self, sql, args, returning):
+        with self.sqlite_transaction() as conn:
+            if returning:
+                return cursor_dicts(conn.execute(sql + ' RETURNING *', args))
+            return conn.execute(sql, args).rowcount
+
+    @stmt_handler('SELECT')
+    def handle_select(self, stmt_info):
+        with self.stage('query_tables') as stage:
+            sql, args = translate_select(stmt_info)
+            cursor = self.execute_sqlite(sql, args)
+            cols = [ColumnDef(d[0], str) for d in cursor.description]
+            return stage.output(iter_cursor(cursor, self.fetch_size)), cols
+
+    def explain_stages(self, stmt_type, stmt_info):
+        if stmt_type == 'SELECT':
+            return ['query_tables']
+        return super().explain_stages(stmt_type, stmt_info)
+
+    def explain_pushdown(self, stmt_info):
+        return ['SQLite query: ' + translate_select(stmt_info)[0]]
+
+    def list_tables(self):
+        cursor = self.execute_sqlite("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'")
+        return [row[0] for row in cursor]
+
+    def describe_table(self, table_name):
+        return [row[1] for row in self.execute_sqlite(f"PRAGMA table_info({quote_identifier(table_name)})")]
+
+
+if __name__ == '__main__':
+    from ..server import start_server, cli_arg_parser
+    cli_arg_parser.add_argument('sqlite_database')
+    start_server(SQLiteRequestHandler, **vars(cli_arg_parser.parse_args()))
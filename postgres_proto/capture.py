@@ -0,0 +1,182 @@
+import gzip
+import hashlib
+import itertools
+import struct
+import threading
+import time
+
+
+CAPTURE_MAGIC = b'PGCAPTURE1\n'
+
+# kind, session id, seconds since the start of the capture, payload length
+RECORD_HEADER = struct.Struct('!cIdI')
+
+SESSION_START = b'O'
+MESSAGE = b'M' # payload: a frontend message
+RESPONSE = b'R' # payload: digest and length of the backend messages sent since the previous response
+SESSION_END = b'C'
+
+RESPONSE_DIGEST_SIZE = 16
+
+REDACTED_PASSWORD_MESSAGE = b'p' + struct.pack('!i', 5) + b'\x00'
+
+
+def open_capture_file(path, mode):
+    return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode)
+
+
+def new_response_digest():
+    return hashlib.blake2b(digest_size=RESPONSE_DIGEST_SIZE)
+
+
+def encode_response(digest, length):
+    return digest + struct.pack('!Q', length)
+
+
+def decode_response(payload):
+    return payload[:RESPONSE_DIGEST_SIZE], struct.unpack('!Q', payload[RESPONSE_DIGEST_SIZE:])[0]
+
+
+class WireCapture(object):
+    """Records the frontend messages received by all sessions of a server, with their arrival time, and digests
+       of the responses (from one ReadyForQuery to the next), to a file (gzip compressed if its name ends with .gz)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open_capture_file(path, 'wb')
+        self.file.write(CAPTURE_MAGIC)
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.session_ids = itertools.count(1)
+
+    def clock(self):
+        return time.monotonic() - self.start
+
+    def write_record(self, kind, session_id, payload=b'', timestamp=None):
+        timestamp = self.clock() if timestamp is None else timestamp
+        with self.lock:
+            if self.file.closed: # sessions still running when the server is shut down
+                return
+            self.file.write(RECORD_HEADER.pack(kind, session_id, timestamp, len(payload)) + payload)
+
+    def flush(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+
+    def session(self):
+        return CaptureSession(self, next(self.session_ids))
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class CaptureSession(object):
+    """Capture of one session, fed by the reader and writer wrapping the streams of a PostgresStream
+    """
+    def __init__(self, capture, session_id):
+        self.capture = capture
+        self.id = session_id
+        self.message = bytearray()
+        self.message_time = None
+        self.response = new_response_digest()
+        self.response_length = 0
+        capture.write_record(SESSION_START, session_id)
+
+    def reader(self, rfile):
+        return CapturingReader(rfile, self)
+
+    def writer(self, wfile):
+        return CapturingWriter(wfile, self)
+
+    def record_read(self, data):
+        if self.message_time is None:
+            self.message_time = self.capture.clock()
+        self.message += data
+
+    def record_write(self, data):
+        if data[:1] in (b'A', b'R'):
+            # notifications are sent asynchronously and authentication requests depend on the method used
+            # (eg: SCRAM once the user is cached), neither is part of responses
+            return
+        self.response.update(data)
+        self.response_length += len(data)
+
+    def flush_message(self):
+        """Records the frontend message read so far, called before reading the next one
+        """
+        if self.message:
+            message = bytes(self.message)
+            if message[:1] == b'p': # passwords are not recorded
+                message = REDACTED_PASSWORD_MESSAGE
+            self.capture.write_record(MESSAGE, self.id, message, self.message_time)
+        self.message.clear()
+        self.message_time = None
+
+    def end_response(self):
+        self.flush_message()
+        self.capture.write_record(RESPONSE, self.id, encode_response(self.response.digest(), self.response_length))
+        self.response = new_response_digest()
+        self.response_length = 0
+
+    def close(self):
+        self.flush_message()
+        if self.response_length:
+            self.end_response()
+        self.capture.write_record(SESSION_END, self.id)
+        self.capture.flush()
+
+
+class CapturingReader(object):
+    def __init__(self, stream, session):
+        self.stream = stream
+        self.session = session
+
+    def read(self, n=-1):
+        data = self.stream.read(n)
+        self.session.record_read(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class CapturingWriter(object):
+    def __init__(self, stream, session):
+        self.stream = stream
+        self.session = session
+
+    def write(self, value):
+        self.session.record_write(value)
+        return self.stream.write(value)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def read_capture(path):
+    """Yields the records of a capture file as tuples (kind, session id, timestamp, payload). Files still being
+       written (or not closed properly) are read up to their last complete record.
+    """
+    with open_capture_file(path, 'rb') as f:
+        try:
+            magic = f.read(len(CAPTURE_MAGIC))
+        except EOFError:
+            return
+        if magic != CAPTURE_MAGIC:
+            if CAPTURE_MAGIC.startswith(magic): # nothing written yet
+                return
+            raise ValueError(f"{path} is not a capture file")
+        while True:
+            try:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                kind, session_id, timestamp, length = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+            except EOFError: # compressed stream not terminated
+                return
+            if len(payload) < length:
+                return
+            yield kind, session_id, timestamp, payload
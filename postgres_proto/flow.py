@@ -2,6 +2,7 @@ from io import BytesIO
 import struct
 from contextlib import contextmanager
 from .sql import split_sql_queries
+from .scram import SCRAM_MECHANISM, ScramServerExchange, ScramError
 
 
 EXPECTED_PARAMETERS_STATUS = {
@@ -26,6 +27,10 @@ ENCRYPTION_REQUESTS = {
 }
 
 
+# messages of the extended query protocol, discarded after an error until Sync
+EXTENDED_QUERY_COMMANDS = ('P', 'B', 'D', 'E', 'C', 'H')
+
+
 def is_encrypted_request(msglen, version):
     if msglen == 8 and version in ENCRYPTION_REQUESTS:
         return ENCRYPTION_REQUESTS[version]
@@ -47,6 +52,24 @@ def catch_all_as_postgres_error_context():
         raise PostgresError(str(e))
 
 
+_decorated_methods = {}
+
+
+def get_decorated_methods(cls, attr):
+    """Returns a dict mapping the values of attr set by decorators (eg: pgcommand()) to method names,
+       methods of subclasses taking precedence
+    """
+    key = (cls, attr)
+    if key not in _decorated_methods:
+        methods = {}
+        for klass in reversed(cls.__mro__):
+            for name, func in vars(klass).items():
+                if hasattr(func, attr):
+                    methods[getattr(func, attr)] = name
+        _decorated_methods[key] = methods
+    return _decorated_methods[key]
+
+
 def pgcommand(name):
     def decorator(func):
         func.__pgcommand__ = name
@@ -56,6 +79,9 @@ def pgcommand(name):
 
 class PostgresServerFlowMixin(object):
     application_name = 'postgres-proto'
+    current_command = None
+    ignore_till_sync = False
+    authenticated = False # whether the password of the user was checked
 
     def perform_session_init(self):
         version, startup_params = self.perform_startup_flow()
@@ -89,33 +115,76 @@ class PostgresServerFlowMixin(object):
         return False
 
     def perform_authentication_flow(self, startup_params):
-        if self.is_authentication_needed(startup_params['user'], startup_params.get('database')):
-            password = self.stream.send_authentication_request()
-            user = self.authenticate(startup_params['user'], password, startup_params.get('database'))
+        username, database = startup_params['user'], startup_params.get('database')
+        if self.is_authentication_needed(username, database):
+            verifier = self.get_scram_verifier(username, database)
+            if verifier is not None:
+                user = self.perform_scram_authentication(username, database, verifier)
+            else:
+                user = self.authenticate_password(username, self.stream.send_authentication_request(), database)
             if not user:
                 raise PostgresError("authentication failure", "FATAL", "28000")
+            self.authenticated = True
         else:
-            user = startup_params['user']
+            user = username
         self.stream.send_authentication_ok()
         return user
 
     def is_authentication_needed(self, username, database):
         return False
 
+    def authenticate_password(self, username, password, database):
+        """Checks the cleartext password sent by the client using authenticate()
+        """
+        user = self.authenticate(username, password, database)
+        if user:
+            self.handle_password_authenticated(username, database, password, user)
+        return user
+
     def authenticate(self, username, password, database):
         return username
 
+    def get_scram_verifier(self, username, database):
+        """Returns a ScramVerifier to authenticate the user using SCRAM-SHA-256, or None to ask for a cleartext
+           password checked using authenticate()
+        """
+        return None
+
+    def perform_scram_authentication(self, username, database, verifier):
+        """Returns the user if the client proves it knows the password of the verifier, None otherwise
+        """
+        exchange = ScramServerExchange(verifier)
+        try:
+            initial_response = self.stream.send_authentication_sasl([SCRAM_MECHANISM])
+            if initial_response is None or initial_response[0] != SCRAM_MECHANISM:
+                raise PostgresError("unsupported SASL mechanism", "FATAL", "28000")
+            client_final = self.stream.send_authentication_sasl_continue(exchange.handle_client_first(initial_response[1]))
+            server_final = exchange.handle_client_final(client_final or '')
+        except ScramError as e:
+            raise PostgresError(str(e), "FATAL", "08P01")
+        if server_final is None:
+            return None
+        self.stream.send_authentication_sasl_final(server_final)
+        return username
+
+    def handle_password_authenticated(self, username, database, password, user):
+        pass
+
     def send_parameters_status(self):
         self.stream.send_parameters_status(EXPECTED_PARAMETERS_STATUS)
         self.stream.send_parameters_status({'application_name': self.application_name})
 
     def get_supported_commands(self):
-        return {getattr(self, f).__pgcommand__: getattr(self, f) for f in dir(self) if hasattr(getattr(self, f), '__pgcommand__')}
+        return {code: getattr(self, name) for code, name in get_decorated_methods(type(self), '__pgcommand__').items()}
 
     def get_command_handler(self, code):
-        return self.get_supported_commands().get(code)
+        name = get_decorated_methods(type(self), '__pgcommand__').get(code)
+        return getattr(self, name) if name else None
 
     def execute_command(self, code):
+        if self.ignore_till_sync and code in EXTENDED_QUERY_COMMANDS:
+            self.stream.skip_message()
+            return
         with self.error_context():
             handler = self.get_command_handler(code)
             if not handler:
@@ -126,6 +195,7 @@ class PostgresServerFlowMixin(object):
         code = self.stream.read_command()
         if not code or code == 'X': # no data or Terminate
             return False
+        self.current_command = code
         self.execute_command(code)
         return True
 
@@ -134,7 +204,7 @@ class PostgresServerFlowMixin(object):
         queries = self.stream.read_query().rstrip('\x00').strip().rstrip(';')
         for query in split_sql_queries(queries):
             self.perform_query_flow(query)
-        self.stream.send_ready_for_query()
+        self.stream.send_ready_for_query(self.get_transaction_status())
 
     def perform_query_flow(self, query, send_row_description=True):
         if not query:
@@ -151,8 +221,14 @@ class PostgresServerFlowMixin(object):
             self.stream.send_row_data(rows)
         self.stream.send_command_complete(command)
 
-    def execute_query(self):
-        """Must return a tuple as follow: (command_name, rows, columns)
+    def get_transaction_status(self):
+        """Status sent with ReadyForQuery: b'I' (idle), b'T' (in a transaction) or b'E' (in a failed transaction)
+        """
+        return b'I'
+
+    def execute_query(self, query, params=None):
+        """params are the decoded values of bound parameters when executing prepared statements.
+           Must return a tuple as follow: (command_name, rows, columns)
            Where:
             - command_name is the SQL command that was executed (eg: "SELECT"), see https://www.postgresql.org/docs/current/protocol-message-formats.html#commandcomplete
             - rows: a list where each item is a a tuple of the same length as the columns with the cell value
@@ -183,11 +259,11 @@ class PostgresServerFlowMixin(object):
     def execute_prepared_statement(self, portal, max_rows):
         raise NotImplementedError()
 
-    @pgcommand('F')
+    @pgcommand('H')
     def perform_flush_prepared_statements_flow(self):
         self.stream.read_flush()
         with self.error_context():
-            self.flush_prepared_statement()
+            self.flush_prepared_statements()
 
     def flush_prepared_statements(self):
         raise NotImplementedError()
@@ -195,9 +271,10 @@ class PostgresServerFlowMixin(object):
     @pgcommand('S')
     def perform_sync_flow(self):
         self.stream.read_sync()
+        self.ignore_till_sync = False
         with self.error_context():
             self.sync_prepared_statement()
-            self.stream.send_ready_for_query()
+            self.stream.send_ready_for_query(self.get_transaction_status())
 
     def sync_prepared_statement(self):
         raise NotImplementedError()
@@ -245,4 +322,7 @@ class PostgresServerFlowMixin(object):
                     raise PostgresError(str(e))
                 raise
         except PostgresError as e:
+            if self.current_command in EXTENDED_QUERY_COMMANDS:
+                # as postgres does, remaining messages of the pipeline are discarded
+                self.ignore_till_sync = True
             self.stream.send_error(e.message, e.severity, e.code)
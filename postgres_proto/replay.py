@@ -0,0 +1,267 @@
+from collections import namedtuple
+import argparse
+import socket
+import struct
+import sys
+import threading
+import time
+from .capture import (read_capture, new_response_digest, decode_response, SESSION_START, MESSAGE, RESPONSE,
+                      SESSION_END, REDACTED_PASSWORD_MESSAGE)
+from .flow import is_encrypted_request
+from .scram import SCRAM_MECHANISM, ScramClientExchange, ScramError
+
+
+# messages: list of (timestamp, message), response: (digest, length) or None when no response is expected
+Exchange = namedtuple('Exchange', ['messages', 'response', 'start', 'end'])
+
+ExchangeResult = namedtuple('ExchangeResult', ['session_id', 'index', 'label', 'original_latency', 'latency',
+                                               'matched', 'error'])
+
+
+class ReplayError(Exception):
+    pass
+
+
+class CapturedSession(object):
+    def __init__(self, session_id, start):
+        self.id = session_id
+        self.start = start
+        self.exchanges = []
+        self.pending = [] # messages not followed by a response yet
+
+    def add_exchange(self, response, timestamp):
+        start = self.pending[0][0] if self.pending else timestamp
+        self.exchanges.append(Exchange(self.pending, response, start, timestamp))
+        self.pending = []
+
+
+def load_sessions(path):
+    """Returns the sessions of a capture file, ordered by start time
+    """
+    sessions = {}
+    for kind, session_id, timestamp, payload in read_capture(path):
+        session = sessions.get(session_id)
+        if session is None:
+            session = sessions[session_id] = CapturedSession(session_id, timestamp)
+        if kind == MESSAGE:
+            session.pending.append((timestamp, payload))
+        elif kind == RESPONSE:
+            session.add_exchange(decode_response(payload), timestamp)
+        elif kind == SESSION_END and session.pending:
+            session.add_exchange(None, timestamp)
+    return sorted(sessions.values(), key=lambda s: s.start)
+
+
+def is_encryption_request_message(message):
+    return len(message) == 8 and bool(is_encrypted_request(*struct.unpack('!ii', message)))
+
+
+def describe_exchange(exchange, index):
+    if not exchange.messages:
+        return ''
+    message = exchange.messages[0][1]
+    if index == 0:
+        return 'startup'
+    if message[:1] == b'Q':
+        return message[5:].rstrip(b'\x00').decode(errors='replace')
+    if message[:1] == b'P':
+        return message[5:].split(b'\x00')[1].decode(errors='replace')
+    return message[:1].decode(errors='replace')
+
+
+def password_message(payload):
+    return b'p' + struct.pack('!i', len(payload) + 4) + payload
+
+
+class ReplayAuthenticator(object):
+    """Answers the authentication requests of the server (cleartext password or SCRAM-SHA-256), as passwords
+       are not recorded
+    """
+    def __init__(self, sock, password):
+        self.sock = sock
+        self.password = password
+        self.scram = None
+
+    def handle_request(self, body):
+        code = struct.unpack('!i', body[:4])[0]
+        if code == 3: # AuthenticationCleartextPassword
+            self.sock.sendall(password_message(self.password.encode() + b'\x00'))
+        elif code == 10: # AuthenticationSASL
+            if SCRAM_MECHANISM.encode() not in body[4:].split(b'\x00'):
+                raise ReplayError('unsupported SASL mechanisms')
+            self.scram = ScramClientExchange(self.password)
+            client_first = self.scram.client_first().encode()
+            self.sock.sendall(password_message(SCRAM_MECHANISM.encode() + b'\x00' +
+                                               struct.pack('!i', len(client_first)) + client_first))
+        elif code == 11 and self.scram is not None: # AuthenticationSASLContinue
+            self.sock.sendall(password_message(self.scram.handle_server_first(body[4:].decode()).encode()))
+        elif code == 12 and self.scram is not None: # AuthenticationSASLFinal
+            self.scram.verify_server_final(body[4:].decode())
+        elif code != 0:
+            raise ReplayError(f"unsupported authentication request ({code})")
+
+
+class ReplayClock(object):
+    """Maps capture timestamps to replay times, speed being None to replay as fast as possible
+    """
+    def __init__(self, origin, speed=1.0):
+        self.origin = origin
+        self.speed = speed
+        self.start = time.perf_counter()
+
+    def wait(self, timestamp):
+        if self.speed is None:
+            return
+        delay = (timestamp - self.origin) / self.speed - (time.perf_counter() - self.start)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def read_response(rfile, authenticator, encryption_requests=0):
+    """Reads backend messages until ReadyForQuery or the end of the connection, returns (digest, length)
+    """
+    digest = new_response_digest()
+    length = 0
+    for _ in range(encryption_requests):
+        answer = rfile.read(1)
+        if answer != b'N':
+            raise ReplayError('encrypted sessions cannot be replayed')
+        digest.update(answer)
+        length += 1
+    while True:
+        header = rfile.read(5)
+        if not header:
+            break
+        if len(header) < 5:
+            raise ReplayError('connection closed in the middle of a message')
+        code = header[:1]
+        body = rfile.read(struct.unpack('!i', header[1:])[0] - 4)
+        if code == b'R':
+            authenticator.handle_request(body)
+        elif code != b'A': # notifications are not part of responses
+            digest.update(header)
+            digest.update(body)
+            length += len(header) + len(body)
+        if code == b'Z':
+            break
+    return digest.digest(), length
+
+
+def replay_session(session, address, clock, password='', timeout=30):
+    """Replays the exchanges of a session in order, each message being sent at its capture time (unless
+       replaying as fast as possible) and after the responses preceding it. Returns a list of ExchangeResult.
+    """
+    results = []
+    clock.wait(session.start)
+    try:
+        sock = socket.create_connection(address, timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # as libpq
+    except OSError as e:
+        return [ExchangeResult(session.id, 0, 'startup', None, None, False, str(e))]
+    rfile = sock.makefile('rb')
+    authenticator = ReplayAuthenticator(sock, password)
+    try:
+        for index, exchange in enumerate(session.exchanges):
+            label = describe_exchange(exchange, index)
+            start = None
+            encryption_requests = 0
+            try:
+                for timestamp, message in exchange.messages:
+                    if message == REDACTED_PASSWORD_MESSAGE:
+                        continue # authentication requests are answered while reading the response
+                    clock.wait(timestamp)
+                    if index == 0 and is_encryption_request_message(message):
+                        encryption_requests += 1
+                    sock.sendall(message)
+                    start = start or time.perf_counter()
+                if exchange.response is None:
+                    continue
+                response = read_response(rfile, authenticator, encryption_requests)
+            except (OSError, ReplayError, ScramError) as e:
+                results.append(ExchangeResult(session.id, index, label, None, None, False, str(e)))
+                break
+            results.append(ExchangeResult(session.id, index, label, exchange.end - exchange.start,
+                                          time.perf_counter() - (start or time.perf_counter()),
+                                          response == exchange.response, None))
+    finally:
+        rfile.close()
+        sock.close()
+    return results
+
+
+def replay(sessions, address, speed=1.0, password='', timeout=30, max_concurrency=None):
+    """Replays sessions concurrently, returns the list of ExchangeResult
+    """
+    clock = ReplayClock(sessions[0].start if sessions else 0, speed)
+    semaphore = threading.Semaphore(max_concurrency) if max_concurrency else None
+    results = []
+    lock = threading.Lock()
+
+    def run(session):
+        if semaphore is not None:
+            semaphore.acquire()
+        try:
+            session_results = replay_session(session, address, clock, password, timeout)
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+        with lock:
+            results.extend(session_results)
+
+    threads = [threading.Thread(target=run, args=(session,), daemon=True) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def format_latencies(name, latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return f"{name:<10} {0:>8}"
+    return f"{name:<10} {len(latencies):>8}" + ''.join(f" {v * 1000:>9.3f}" for v in (
+        sum(latencies) / len(latencies), percentile(latencies, 50), percentile(latencies, 90),
+        percentile(latencies, 99), latencies[-1]))
+
+
+def print_report(results, elapsed, max_differences=20, file=sys.stdout):
+    measured = [r for r in results if r.error is None]
+    differences = [r for r in measured if not r.matched]
+    errors = [r for r in results if r.error is not None]
+    print(f"{len(measured)} exchanges replayed in {elapsed:.3f}s", file=file)
+    print(f"{'latency':<10} {'count':>8} {'mean ms':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}", file=file)
+    print(format_latencies('original', [r.original_latency for r in measured]), file=file)
+    print(format_latencies('replay', [r.latency for r in measured]), file=file)
+    print(f"{len(differences)} responses differ", file=file)
+    for r in differences[:max_differences]:
+        print(f"  session {r.session_id} #{r.index}: {r.label[:100]}", file=file)
+    if errors:
+        print(f"{len(errors)} sessions failed", file=file)
+        for r in errors[:max_differences]:
+            print(f"  session {r.session_id} #{r.index}: {r.error} ({r.label[:100]})", file=file)
+    return not differences and not errors
+
+
+cli_arg_parser = argparse.ArgumentParser(description='Replays sessions recorded using the capture_file server property')
+cli_arg_parser.add_argument('capture_file')
+cli_arg_parser.add_argument('--host', default='127.0.0.1')
+cli_arg_parser.add_argument('--port', type=int, default=55432)
+cli_arg_parser.add_argument('--speed', type=float, default=1.0, help='Speed factor applied to the captured timing')
+cli_arg_parser.add_argument('--fast', action='store_true', help='Replay as fast as possible')
+cli_arg_parser.add_argument('--password', default='', help='Password used to authenticate sessions (not recorded)')
+cli_arg_parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for a response')
+cli_arg_parser.add_argument('--max-concurrency', type=int, help='Max number of sessions replayed at once')
+
+
+if __name__ == '__main__':
+    args = cli_arg_parser.parse_args()
+    sessions = load_sessions(args.capture_file)
+    start = time.perf_counter()
+    results = replay(sessions, (args.host, args.port), None if args.fast else args.speed, args.password,
+                     args.timeout, args.max_concurrency)
+    sys.exit(0 if print_report(results, time.perf_counter() - start) else 1)
@@ -0,0 +1,143 @@
+from base64 import b64encode, b64decode
+from collections import namedtuple
+import hashlib
+import hmac
+import os
+
+
+SCRAM_MECHANISM = 'SCRAM-SHA-256'
+SCRAM_DEFAULT_ITERATIONS = 4096 # as postgres
+
+ScramVerifier = namedtuple('ScramVerifier', ['salt', 'iterations', 'stored_key', 'server_key'])
+
+
+class ScramError(Exception):
+    pass
+
+
+def scram_hmac(key, msg):
+    return hmac.new(key, msg, hashlib.sha256).digest()
+
+
+def xor_bytes(a, b):
+    return bytes(x ^ y for x, y in zip(a, b))
+
+
+def salt_password(password, salt, iterations):
+    # passwords are not normalized using SASLprep, which only matters for non ASCII passwords
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+
+
+def create_scram_verifier(password, salt=None, iterations=SCRAM_DEFAULT_ITERATIONS):
+    salt = salt or os.urandom(16)
+    salted_password = salt_password(password, salt, iterations)
+    return ScramVerifier(salt, iterations, hashlib.sha256(scram_hmac(salted_password, b'Client Key')).digest(),
+                         scram_hmac(salted_password, b'Server Key'))
+
+
+def check_scram_password(verifier, password):
+    """Returns True if the cleartext password is the one the verifier was created from
+    """
+    stored_key = create_scram_verifier(password, verifier.salt, verifier.iterations).stored_key
+    return hmac.compare_digest(stored_key, verifier.stored_key)
+
+
+def parse_scram_verifier(value):
+    """Parses verifiers stored as by postgres: SCRAM-SHA-256$<iterations>:<salt>$<StoredKey>:<ServerKey>
+    """
+    try:
+        mechanism, params, keys = value.split('$')
+        iterations, salt = params.split(':')
+        stored_key, server_key = keys.split(':')
+        if mechanism != SCRAM_MECHANISM:
+            raise ValueError()
+        return ScramVerifier(b64decode(salt), int(iterations), b64decode(stored_key), b64decode(server_key))
+    except ValueError:
+        raise ScramError('invalid SCRAM verifier')
+
+
+def format_scram_verifier(verifier):
+    return (f"{SCRAM_MECHANISM}${verifier.iterations}:{b64encode(verifier.salt).decode()}$"
+            f"{b64encode(verifier.stored_key).decode()}:{b64encode(verifier.server_key).decode()}")
+
+
+def parse_scram_attributes(message):
+    try:
+        return dict(attr.split('=', 1) for attr in message.split(','))
+    except ValueError:
+        raise ScramError('malformed SCRAM message')
+
+
+def create_nonce():
+    return b64encode(os.urandom(18)).decode()
+
+
+class ScramServerExchange(object):
+    """Server side of a SCRAM-SHA-256 exchange (RFC 5802 / 7677) without channel binding
+    """
+    def __init__(self, verifier):
+        self.verifier = verifier
+        self.gs2_header = None
+        self.nonce = None
+        self.client_first_bare = None
+        self.server_first = None
+
+    def handle_client_first(self, message):
+        """Returns the server-first-message
+        """
+        gs2_cbind_flag, authzid, client_first_bare = (message.split(',', 2) + ['', ''])[:3]
+        if gs2_cbind_flag not in ('n', 'y'):
+            raise ScramError('channel binding is not supported')
+        client_nonce = parse_scram_attributes(client_first_bare).get('r')
+        if not client_nonce:
+            raise ScramError('malformed SCRAM message')
+        self.gs2_header = f"{gs2_cbind_flag},{authzid},"
+        self.client_first_bare = client_first_bare
+        self.nonce = client_nonce + create_nonce()
+        self.server_first = f"r={self.nonce},s={b64encode(self.verifier.salt).decode()},i={self.verifier.iterations}"
+        return self.server_first
+
+    def handle_client_final(self, message):
+        """Returns the server-final-message, None if the client proof is invalid
+        """
+        without_proof, _, proof = message.rpartition(',p=')
+        attrs = parse_scram_attributes(without_proof)
+        if attrs.get('c') != b64encode(self.gs2_header.encode()).decode() or attrs.get('r') != self.nonce:
+            raise ScramError('malformed SCRAM message')
+        auth_message = f"{self.client_first_bare},{self.server_first},{without_proof}".encode()
+        client_signature = scram_hmac(self.verifier.stored_key, auth_message)
+        try:
+            client_key = xor_bytes(b64decode(proof, validate=True), client_signature)
+        except ValueError:
+            raise ScramError('malformed SCRAM message')
+        if not hmac.compare_digest(hashlib.sha256(client_key).digest(), self.verifier.stored_key):
+            return None
+        return f"v={b64encode(scram_hmac(self.verifier.server_key, auth_message)).decode()}"
+
+
+class ScramClientExchange(object):
+    """Client side of a SCRAM-SHA-256 exchange, used to replay sessions
+    """
+    def __init__(self, password):
+        self.password = password
+        self.client_first_bare = f"n=,r={create_nonce()}"
+        self.server_signature = None
+
+    def client_first(self):
+        return f"n,,{self.client_first_bare}"
+
+    def handle_server_first(self, message):
+        """Returns the client-final-message
+        """
+        attrs = parse_scram_attributes(message)
+        salted_password = salt_password(self.password, b64decode(attrs['s']), int(attrs['i']))
+        client_key = scram_hmac(salted_password, b'Client Key')
+        without_proof = f"c={b64encode(b'n,,').decode()},r={attrs['r']}"
+        auth_message = f"{self.client_first_bare},{message},{without_proof}".encode()
+        proof = xor_bytes(client_key, scram_hmac(hashlib.sha256(client_key).digest(), auth_message))
+        self.server_signature = scram_hmac(scram_hmac(salted_password, b'Server Key'), auth_message)
+        return f"{without_proof},p={b64encode(proof).decode()}"
+
+    def verify_server_final(self, message):
+        if parse_scram_attributes(message).get('v') != b64encode(self.server_signature).decode():
+            raise ScramError('invalid server signature')
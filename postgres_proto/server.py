@@ -1,7 +1,9 @@
 import socketserver
 import ssl
+import signal
 import argparse
 from importlib import import_module
+from .socket_handler.profiler import get_profiler
 
 
 class ThreadingTCPServer(socketserver.ThreadingTCPServer):
@@ -35,11 +37,19 @@ def create_server(request_handler, port, listen_addr='0.0.0.0', ssl_context=None
     return server
 
 
-def start_server(request_handler, port, listen_addr='0.0.0.0', ssl_cert=None, ssl_key=None, max_clients=None, **server_properties):
+def toggle_profiler(server):
+    path = get_profiler(server).toggle()
+    print(f"Profile written to {path}" if path else "Profiler started")
+
+
+def start_server(request_handler, port, listen_addr='0.0.0.0', ssl_cert=None, ssl_key=None, max_clients=None,
+                 profile_signal=None, **server_properties):
     ssl_context = create_ssl_context(ssl_cert, ssl_key) if ssl_cert and ssl_key else None
     server = create_server(request_handler, port, listen_addr, ssl_context, max_clients)
     for prop, value in server_properties.items():
         setattr(server, prop, value)
+    if profile_signal:
+        signal.signal(getattr(signal, profile_signal), lambda signum, frame: toggle_profiler(server))
     print(f"Serving on {listen_addr}:{port}")
     if server.ssl_context:
         print("SSL is enabled")
@@ -47,6 +57,11 @@ def start_server(request_handler, port, listen_addr='0.0.0.0', ssl_cert=None, ss
         server.serve_forever()
     except:
         server.shutdown()
+    finally:
+        if getattr(server, 'profiler', None) is not None and server.profiler.running:
+            toggle_profiler(server)
+        if getattr(server, 'wire_capture', None) is not None:
+            server.wire_capture.close()
 
 
 cli_arg_parser = argparse.ArgumentParser()
@@ -55,6 +70,34 @@ cli_arg_parser.add_argument('--port', type=int, default=55432)
 cli_arg_parser.add_argument('--ssl-cert')
 cli_arg_parser.add_argument('--ssl-key')
 cli_arg_parser.add_argument('--max-clients', type=int, default=100)
+cli_arg_parser.add_argument('--portal-results-memory-limit', type=int, default=512 * 1024 * 1024,
+    help='Max bytes of portal results kept in memory across all sessions before spilling to disk')
+cli_arg_parser.add_argument('--max-connections-per-user', type=int)
+cli_arg_parser.add_argument('--queries-per-second', type=float, help='Max rate of queries per user')
+cli_arg_parser.add_argument('--queries-burst', type=int)
+cli_arg_parser.add_argument('--max-statements-per-user', type=int, help='Max concurrent statements per user')
+cli_arg_parser.add_argument('--max-statements-per-database', type=int, help='Max concurrent statements per database')
+cli_arg_parser.add_argument('--max-inflight-statements', type=int, help='Max concurrent statements across all sessions')
+cli_arg_parser.add_argument('--quota-queue-timeout', type=float, default=0,
+    help='Seconds a statement over a quota waits before being rejected')
+cli_arg_parser.add_argument('--pool-size', type=int, help='Max number of pooled backend resources shared by sessions')
+cli_arg_parser.add_argument('--pool-timeout', type=float, help='Seconds a session waits for a pooled backend resource')
+cli_arg_parser.add_argument('--profile-signal', default='SIGUSR2' if hasattr(signal, 'SIGUSR2') else None,
+    help='Signal starting and stopping the sampling profiler')
+cli_arg_parser.add_argument('--profile-interval', type=float, help='Seconds between samples of the profiler')
+cli_arg_parser.add_argument('--profile-dir', help='Directory where profiles are written')
+cli_arg_parser.add_argument('--auth-cache-ttl', type=float, default=0,
+    help='Seconds repeat logins of authenticated users are checked locally using cached SCRAM-SHA-256 verifiers '
+         '(default: 0, disabled)')
+cli_arg_parser.add_argument('--capture-file',
+    help='File where the messages received by sessions are recorded to be replayed (see postgres_proto.replay)')
+cli_arg_parser.add_argument('--trace-file', help='File where tracing spans are written as JSON lines (- for stdout)')
+cli_arg_parser.add_argument('--slow-query-log', help='File where slow statements are written as JSON lines (- for stdout)')
+cli_arg_parser.add_argument('--slow-query-threshold', type=float,
+    help='Seconds over which statements are written to the slow query log (default: 1)')
+cli_arg_parser.add_argument('--admin-user', dest='admin_users', action='append',
+    help='Authenticated user allowed to control the profiler using SQL and to see and reset statistics of all users, '
+         'can be repeated')
 
 
 class RequestHandlerArgAction(argparse.Action):
@@ -1,59 +1,152 @@
+from contextlib import contextmanager
 from .base import BasePostgresStreamRequestHandler
 from .prepared_stmts import PostgresPreparedStatementsRequestHandlerMixin
 from .builtins import QueryPostgresBuiltinsMixin
 from .info_schema import QueryInformationSchemaMixin
-from .helpers import format_select_results
-from ..flow import PostgresError
-from ..sql import parse_sql
+from .notifications import NotificationsMixin
+from .explain import ExplainMixin
+from .stats import StatsMixin
+from .writes import WriteStatementsMixin
+from .pooling import TransactionPoolingMixin, ResourcePool
+from .cursors import CursorsMixin
+from .auth_cache import AuthCacheMixin
+from .quotas import QuotasMixin
+from .tracing import TracingMixin, Tracer, JSONLinesExporter, SlowQueryLog
+from .helpers import format_select_results, as_row_dicts, stmt_handler, server_resource, LRUCache
+from .joins import merge_table_results, get_joined_where_predicates, single_table_stmt
+from .predicates import filter_joined_rows
+from .aggregates import is_aggregate_query, aggregate_select_results
+from .sorting import sort_select_results
+from ..flow import PostgresError, get_decorated_methods
+from ..sql import split_sql, transform_stmt, bind_params, iter_from_tables
 
 
-def stmt_handler(name):
-    def decorator(func):
-        func.__stmt_handler__ = name
-        return func
-    return decorator
+class PostgresRequestHandler(AuthCacheMixin, TracingMixin, QuotasMixin, CursorsMixin, NotificationsMixin,
+                             TransactionPoolingMixin, StatsMixin, ExplainMixin, WriteStatementsMixin, QueryInformationSchemaMixin,
+                             QueryPostgresBuiltinsMixin, PostgresPreparedStatementsRequestHandlerMixin,
+                             BasePostgresStreamRequestHandler):
 
+    ignore_missing_statement_types = ('SET', 'DEALLOCATE', 'DISCARD')
+    stmt_type_delimiters = None
+    join_max_build_rows = 1000000 # hash joins spill to disk over this number of rows
+    sort_max_memory_rows = 1000000 # sorts without LIMIT spill sorted runs to disk over this number of rows
+    spill_dir = None
 
-class PostgresRequestHandler(QueryInformationSchemaMixin, QueryPostgresBuiltinsMixin,
-                             PostgresPreparedStatementsRequestHandlerMixin, BasePostgresStreamRequestHandler):
+    parse_cache_size = 1024 # number of parsed statements kept for queries executed again
 
-    ignore_missing_statement_types = ('SET', 'BEGIN', 'COMMIT', 'ROLLBACK', 'DEALLOCATE', 'DISCARD')
-    stmt_type_delimiters = None
+    @property
+    def parse_cache(self):
+        server = getattr(self, 'server', None)
+        return server_resource(server, 'parse_cache', lambda: LRUCache(self.parse_cache_size))
 
-    def parse_sql(self, query):
+    def parse_sql(self, query, params=None):
+        query = query.rstrip('\x00').rstrip(';')
+        cached = self.parse_cache.get(query)
+        if cached is not None:
+            with self.stage('parse_sql') as stage:
+                stage.hit()
+                self.count_cache_hit()
+                stmt_type, stmt_info = cached
+        else:
+            try:
+                with self.stage('split_sql'):
+                    stmt_type, parts = split_sql(query, self.stmt_type_delimiters)
+                with self.stage('parse_sql'):
+                    stmt_info = transform_stmt(stmt_type, parts)
+            except SyntaxError as e:
+                raise PostgresError("Syntax error: %s" % e)
+            self.parse_cache.set(query, (stmt_type, stmt_info))
         try:
-            return parse_sql(query.rstrip('\x00').rstrip(';'), self.stmt_type_delimiters)
+            return stmt_type, bind_params(stmt_info, params)
         except SyntaxError as e:
             raise PostgresError("Syntax error: %s" % e)
 
-    def execute_query(self, query):
-        stmt_type, stmt_info = self.parse_sql(query)
+    @contextmanager
+    def executing_statement(self, query, executions=1):
+        """Context of statement executions: statistics, transaction status, quotas and tracing
+        """
+        with self.track_statement(query, executions), self.track_transaction(), self.quota_statement(), \
+                self.trace_span('execute_query', query=query):
+            yield
 
-        if self.is_postgres_builtins_query(stmt_type, stmt_info):
-            return self.handle_postgres_builtins_query(stmt_type, stmt_info)
+    def execute_query(self, query, params=None):
+        with self.executing_statement(query):
+            stmt_type, stmt_info = self.parse_sql(query, params)
+            self.check_transaction_status(stmt_type)
 
-        if self.is_information_schema_query(stmt_type, stmt_info):
-            return self.handle_information_schema_query(stmt_type, stmt_info)
+            if self.is_postgres_builtins_query(stmt_type, stmt_info):
+                return self.handle_postgres_builtins_query(stmt_type, stmt_info)
 
-        handler = self.get_stmt_handler(stmt_type)
-        if not handler:
-            if stmt_type in self.ignore_missing_statement_types:
-                return stmt_type, None, None
-            raise PostgresError('statement type not supported')
-        rows, cols = handler(stmt_info)
-        return stmt_type, rows, cols
+            if self.is_information_schema_query(stmt_type, stmt_info):
+                return self.handle_information_schema_query(stmt_type, stmt_info)
+
+            handler = self.get_stmt_handler(stmt_type)
+            if not handler:
+                if stmt_type in self.ignore_missing_statement_types:
+                    return stmt_type, None, None
+                raise PostgresError('statement type not supported')
+            with self.trace_span('execute_handler', statement_type=stmt_type):
+                result = handler(stmt_info)
+            # handlers may return a command tag as third item (eg: "INSERT 0 1")
+            rows, cols = result[:2]
+            return result[2] if len(result) > 2 else stmt_type, rows, cols
 
     def get_stmt_handler(self, stmt_type):
-        handlers = {getattr(self, f).__stmt_handler__: getattr(self, f) for f in dir(self) if hasattr(getattr(self, f), '__stmt_handler__')}
-        return handlers.get(stmt_type)
+        name = get_decorated_methods(type(self), '__stmt_handler__').get(stmt_type)
+        return getattr(self, name) if name else None
 
     @stmt_handler('SELECT')
     def handle_select(self, stmt_info):
         if '*' in [c.name for c in stmt_info.columns] and (len(stmt_info.columns) > 1 or stmt_info.columns[0].alias):
             raise PostgresError('select * cannot be aliased or used with other columns')
 
-        data, cols = self.query_tables(stmt_info)
-        return format_select_results(data, cols, stmt_info)
+        if any(t.joins for t in stmt_info.tables):
+            with self.stage('query_joined_tables') as stage:
+                data, cols = self.query_joined_tables(stmt_info)
+                data = stage.output(data)
+        else:
+            with self.stage('query_tables') as stage:
+                data, cols = self.query_tables(stmt_info)
+                data = stage.output(data)
+        if is_aggregate_query(stmt_info):
+            with self.stage('aggregate_results') as stage:
+                data, cols = self.aggregate_results(as_row_dicts(stage.input(data)), cols, stmt_info)
+                data = stage.output(data)
+        if stmt_info.order_by or stmt_info.limit or stmt_info.offset:
+            with self.stage('sort_results') as stage:
+                data, cols = self.sort_results(as_row_dicts(stage.input(data)), cols, stmt_info)
+                data = stage.output(data)
+        with self.stage('format_select_results') as stage:
+            data, cols = format_select_results(stage.input(data), cols, stmt_info)
+            return stage.output(data), cols
+
+    def aggregate_results(self, data, cols, stmt_info):
+        """Evaluates GROUP BY and aggregate functions over the rows returned by query_tables().
+           Override to return data as is if query_tables() already performs aggregation.
+        """
+        return aggregate_select_results(data, cols, stmt_info)
+
+    def sort_results(self, data, cols, stmt_info):
+        """Applies ORDER BY, LIMIT and OFFSET. ORDER BY with LIMIT uses a bounded heap, otherwise an external
+           merge sort. Override to return data as is if query_tables() already sorts and limits results.
+        """
+        return sort_select_results(data, cols, stmt_info, self.sort_max_memory_rows, self.spill_dir)
 
     def query_tables(self, stmt_info):
+        """Must return a tuple (rows, columns) where rows is a list of dicts or a ColumnBatch
+        """
         raise NotImplementedError()
+
+    def query_joined_tables(self, stmt_info):
+        """Queries each table separately using query_table(), joins them and filters the joined rows using WHERE
+        """
+        predicates = get_joined_where_predicates(stmt_info)
+        results = [self.query_table(table, stmt_info) for table in iter_from_tables(stmt_info.tables)]
+        rows, cols = merge_table_results(stmt_info.tables, results, self.join_max_build_rows, self.spill_dir)
+        return filter_joined_rows(rows, predicates), cols
+
+    def query_table(self, table, stmt_info):
+        """Queries a single table (a FromTableExpr) of a query involving joins. The WHERE clause only keeps the
+           comparisons applying to this table, the whole clause is evaluated once tables are joined.
+        """
+        return self.query_tables(single_table_stmt(stmt_info, table))
@@ -0,0 +1,243 @@
+from collections import namedtuple
+from ..flow import PostgresError
+from ..sql import tokenize_comma_separated_list
+from .helpers import to_number, compare_key, resolve_col_name
+
+
+AggregateExpr = namedtuple('AggregateExpr', ['name', 'func', 'arg', 'distinct'])
+
+
+class CountAggregate(object):
+    def __init__(self):
+        self.value = 0
+
+    def add(self, value):
+        if value is not None:
+            self.value += 1
+
+    def merge(self, other):
+        self.value += other.value
+
+    def result(self):
+        return self.value
+
+
+class CountDistinctAggregate(object):
+    def __init__(self):
+        self.values = set()
+
+    def add(self, value):
+        if value is not None:
+            self.values.add(value)
+
+    def merge(self, other):
+        self.values |= other.values
+
+    def result(self):
+        return len(self.values)
+
+
+def to_numeric_arg(value, func):
+    """Converts a value aggregated by sum() or avg() to a number, None (NULL or empty string) being ignored
+    """
+    if value is None or value == '':
+        return None
+    number = to_number(value)
+    if number is None:
+        raise PostgresError(f"invalid input syntax for type numeric in {func}(): {str(value)[:100]!r}", code='22P02')
+    return number
+
+
+def add_numbers(a, b):
+    try:
+        return a + b
+    except TypeError:
+        # Decimal values (eg: parsed literals) and floats: the sum is a float as with a float column
+        return float(a) + float(b)
+
+
+class SumAggregate(object):
+    def __init__(self):
+        self.value = None
+
+    def add(self, value):
+        value = to_numeric_arg(value, 'sum')
+        if value is not None:
+            self.value = value if self.value is None else add_numbers(self.value, value)
+
+    def merge(self, other):
+        self.add(other.value)
+
+    def result(self):
+        return self.value
+
+
+class AvgAggregate(object):
+    def __init__(self):
+        self.sum = 0
+        self.count = 0
+
+    def add(self, value):
+        value = to_numeric_arg(value, 'avg')
+        if value is not None:
+            self.sum = add_numbers(self.sum, value)
+            self.count += 1
+
+    def merge(self, other):
+        self.sum = add_numbers(self.sum, other.sum)
+        self.count += other.count
+
+    def result(self):
+        return self.sum / self.count if self.count else None
+
+
+class MinAggregate(object):
+    def __init__(self):
+        self.value = None
+
+    def add(self, value):
+        if value is not None and (self.value is None or self.is_better(value)):
+            self.value = value
+
+    def is_better(self, value):
+        return compare_key(value) < compare_key(self.value)
+
+    def merge(self, other):
+        self.add(other.value)
+
+    def result(self):
+        return self.value
+
+
+class MaxAggregate(MinAggregate):
+    def is_better(self, value):
+        return compare_key(value) > compare_key(self.value)
+
+
+AGGREGATE_FUNCTIONS = {
+    'count': CountAggregate,
+    'sum': SumAggregate,
+    'avg': AvgAggregate,
+    'min': MinAggregate,
+    'max': MaxAggregate
+}
+
+
+def parse_aggregate_expr(name):
+    if not name.endswith(')') or '(' not in name:
+        return None
+    func, arg = name[:-1].split('(', 1)
+    func = func.strip().lower()
+    if func not in AGGREGATE_FUNCTIONS:
+        return None
+    arg = arg.strip()
+    distinct = arg.lower().startswith('distinct ')
+    if distinct:
+        arg = arg[len('distinct '):].strip()
+    return AggregateExpr(name, func, arg, distinct)
+
+
+def create_aggregate(expr):
+    if expr.distinct:
+        if expr.func != 'count':
+            raise PostgresError("DISTINCT is only supported with count()", code="0A000")
+        return CountDistinctAggregate()
+    return AGGREGATE_FUNCTIONS[expr.func]()
+
+
+def is_aggregate_query(stmt_info):
+    return bool(stmt_info.group_by) or any(parse_aggregate_expr(c.name) for c in stmt_info.columns)
+
+
+def parse_group_by(group_by, stmt_info):
+    cols = []
+    for col, _ in tokenize_comma_separated_list(group_by or '', remove_quotes=True):
+        col = col.lower()
+        if col.isdigit(): # position in the select list
+            if not 0 < int(col) <= len(stmt_info.columns):
+                raise PostgresError(f"GROUP BY position {col} is not in select list", code="42P10")
+            col = stmt_info.columns[int(col) - 1].name
+        cols.append(col)
+    return cols
+
+
+def partial_aggregate(rows, group_cols, aggregates):
+    """Consumes rows one at a time, keeping only the state of each group. Returns a dict mapping group keys
+       to the list of aggregate states, which can be merged with other partial results (eg: from other workers).
+       group_cols and AggregateExpr.arg must be keys of the rows.
+    """
+    groups = {}
+    for row in rows:
+        key = tuple(row.get(c) for c in group_cols)
+        states = groups.get(key)
+        if states is None:
+            states = groups[key] = [create_aggregate(agg) for agg in aggregates]
+        for state, agg in zip(states, aggregates):
+            state.add(1 if agg.arg == '*' else row.get(agg.arg))
+    return groups
+
+
+def merge_partial_aggregates(groups, partial):
+    for key, states in partial.items():
+        current = groups.get(key)
+        if current is None:
+            groups[key] = states
+        else:
+            for state, other in zip(current, states):
+                state.merge(other)
+    return groups
+
+
+def finalize_aggregates(groups, group_cols, aggregates):
+    """Yields one row per group from partial results
+    """
+    if not groups and not group_cols:
+        groups[()] = [create_aggregate(agg) for agg in aggregates]
+    for key, states in groups.items():
+        result = dict(zip(group_cols, key))
+        result.update({agg.name: state.result() for agg, state in zip(aggregates, states)})
+        yield result
+
+
+def aggregate_rows(rows, group_cols, aggregates):
+    """Returns an iterator of one row per group, see partial_aggregate(). Rows are aggregated before returning so
+       errors (eg: non-numeric values) are raised before any result is sent
+    """
+    return finalize_aggregates(partial_aggregate(rows, group_cols, aggregates), group_cols, aggregates)
+
+
+def resolve_aggregates(stmt_info, cols):
+    """Returns a tuple (group_cols, aggregates, out_cols) where group_cols and aggregates use the names of cols
+       and out_cols are named after the select list
+    """
+    cols = list(cols)
+    group_cols = [resolve_col_name(c, cols) for c in parse_group_by(stmt_info.group_by, stmt_info)]
+    aggregates = []
+    out_cols = []
+    for col in stmt_info.columns:
+        agg = parse_aggregate_expr(col.name)
+        if agg:
+            if agg.arg != '*':
+                agg = agg._replace(arg=resolve_col_name(agg.arg, cols))
+            aggregates.append(agg)
+        elif resolve_col_name(col.name, cols) not in group_cols:
+            raise PostgresError(f"column \"{col.name}\" must appear in the GROUP BY clause or be used in an aggregate function",
+                                code="42803")
+        out_cols.append(col.name)
+    return group_cols, aggregates, out_cols
+
+
+def rename_group_cols(rows, cols, out_cols):
+    # group columns are renamed to how they appear in the select list
+    renames = {resolve_col_name(c, cols): c for c in out_cols if not parse_aggregate_expr(c)}
+    if any(k != v for k, v in renames.items()):
+        rows = ({renames.get(k, k): v for k, v in row.items()} for row in rows)
+    return rows
+
+
+def aggregate_select_results(data, cols, stmt_info):
+    """Evaluates GROUP BY and aggregate functions, returns rows and columns named after the select list
+    """
+    cols = list(cols)
+    group_cols, aggregates, out_cols = resolve_aggregates(stmt_info, cols)
+    return rename_group_cols(aggregate_rows(data, group_cols, aggregates), cols, out_cols), out_cols
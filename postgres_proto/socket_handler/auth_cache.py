@@ -0,0 +1,99 @@
+from collections import namedtuple
+import time
+from ..scram import create_scram_verifier, check_scram_password, SCRAM_DEFAULT_ITERATIONS
+from .helpers import server_resource, LRUCache
+
+
+AuthCacheEntry = namedtuple('AuthCacheEntry', ['verifier', 'user', 'expires', 'method'])
+
+# authentication methods of cached entries, repeat logins use the same method
+PASSWORD_METHOD = 'password'
+SCRAM_METHOD = 'scram'
+
+
+class AuthCache(object):
+    """SCRAM verifiers of authenticated users, by (username, database), expiring after ttl seconds
+    """
+    def __init__(self, ttl=300, max_entries=10000):
+        self.ttl = ttl
+        self.entries = LRUCache(max_entries)
+
+    def get(self, username, database):
+        entry = self.entries.get((username, database))
+        if entry is None:
+            return None
+        if entry.expires < time.monotonic():
+            self.entries.delete((username, database))
+            return None
+        return entry
+
+    def set(self, username, database, verifier, user, method=PASSWORD_METHOD):
+        self.entries.set((username, database), AuthCacheEntry(verifier, user, time.monotonic() + self.ttl, method))
+
+    def invalidate(self, username, database):
+        self.entries.delete((username, database))
+
+
+class AuthCacheMixin(object):
+    """Checks repeat logins locally against cached SCRAM-SHA-256 verifiers, kept for auth_cache_ttl seconds
+       (0, the default, disables the cache). Users authenticated using a cleartext password checked by
+       authenticate() keep sending their password, checked against a verifier derived from it, and users
+       authenticated using SCRAM-SHA-256 (verifiers obtained using lookup_scram_verifier()) keep using it.
+       Password changes in the backend are seen when a login fails the local check or once the entry expires.
+    """
+    auth_cache_ttl = 0
+    scram_iterations = SCRAM_DEFAULT_ITERATIONS
+
+    @property
+    def auth_cache_ttl_seconds(self):
+        ttl = getattr(getattr(self, 'server', None), 'auth_cache_ttl', None)
+        return self.auth_cache_ttl if ttl is None else ttl
+
+    @property
+    def auth_cache(self):
+        return server_resource(getattr(self, 'server', None), 'auth_cache',
+                               lambda: AuthCache(self.auth_cache_ttl_seconds))
+
+    def lookup_scram_verifier(self, username, database):
+        """Can return a ScramVerifier (eg: stored by the backend, see parse_scram_verifier()) to authenticate
+           first logins using SCRAM-SHA-256 rather than a cleartext password
+        """
+        return None
+
+    def get_scram_verifier(self, username, database):
+        if not self.auth_cache_ttl_seconds:
+            return self.lookup_scram_verifier(username, database)
+        entry = self.auth_cache.get(username, database)
+        if entry is not None:
+            return entry.verifier if entry.method == SCRAM_METHOD else None
+        verifier = self.lookup_scram_verifier(username, database)
+        if verifier is not None:
+            self.auth_cache.set(username, database, verifier, username, SCRAM_METHOD)
+        return verifier
+
+    def perform_scram_authentication(self, username, database, verifier):
+        user = super().perform_scram_authentication(username, database, verifier)
+        if not self.auth_cache_ttl_seconds:
+            return user
+        if user is None:
+            # the entry is kept, so that failed attempts do not send other logins to the backend, unless
+            # the verifier of the backend changed (eg: new password), which is then used by next logins
+            current = self.lookup_scram_verifier(username, database)
+            if current is not None and current != verifier:
+                self.auth_cache.set(username, database, current, username, SCRAM_METHOD)
+            return None
+        entry = self.auth_cache.get(username, database)
+        return entry.user if entry is not None else user
+
+    def authenticate_password(self, username, password, database):
+        entry = self.auth_cache.get(username, database) if self.auth_cache_ttl_seconds else None
+        if entry is not None and entry.method == PASSWORD_METHOD and password is not None and \
+                check_scram_password(entry.verifier, password):
+            return entry.user
+        # unknown users and passwords not matching the cached entry are checked by the backend
+        return super().authenticate_password(username, password, database)
+
+    def handle_password_authenticated(self, username, database, password, user):
+        if self.auth_cache_ttl_seconds and password is not None:
+            self.auth_cache.set(username, database, create_scram_verifier(password, iterations=self.scram_iterations), user)
+        super().handle_password_authenticated(username, database, password, user)
@@ -2,17 +2,37 @@ import socketserver
 import ssl
 from ..stream import PostgresStream
 from ..flow import PostgresServerFlowMixin, PostgresError
+from ..capture import WireCapture
+from .helpers import server_resource
 
 
 class BasePostgresStreamRequestHandler(PostgresServerFlowMixin, socketserver.StreamRequestHandler):
+    # responses are made of several small writes which would otherwise wait for the delayed ack of the client
+    disable_nagle_algorithm = True
+
     def handle(self):
-        self.stream = PostgresStream(self.rfile, self.wfile)
-        with self.error_context():
-            self.version, self.startup_params, self.user = self.perform_session_init()
-            self.handle_session_ready()
-            while True:
-                if not self.read_and_execute_command():
-                    break
+        self.stream = PostgresStream(self.rfile, self.wfile, self.create_capture_session())
+        try:
+            with self.error_context():
+                self.version, self.startup_params, self.user = self.perform_session_init()
+                self.handle_session_ready()
+                while True:
+                    if not self.read_and_execute_command():
+                        break
+        finally:
+            try:
+                self.handle_session_end()
+            finally:
+                if self.stream.capture is not None:
+                    self.stream.capture.close()
+
+    def create_capture_session(self):
+        """Sessions are recorded when the server has a capture_file property (see postgres_proto.replay)
+        """
+        capture_file = getattr(self.server, 'capture_file', None)
+        if not capture_file:
+            return None
+        return server_resource(self.server, 'wire_capture', lambda: WireCapture(capture_file)).session()
 
     def perform_ssl_handshake(self):
         ssl_context = getattr(self.server, 'ssl_context', None)
@@ -23,7 +43,10 @@ class BasePostgresStreamRequestHandler(PostgresServerFlowMixin, socketserver.Str
             except:
                 raise PostgresError("failed establishing ssl connection", "FATAL")
             self.stream = PostgresStream(self.ssl_connection.makefile('rb', self.rbufsize),
-                socketserver._SocketWriter(self.ssl_connection))
+                socketserver._SocketWriter(self.ssl_connection), self.stream.capture)
 
     def handle_session_ready(self):
         pass
+
+    def handle_session_end(self):
+        pass
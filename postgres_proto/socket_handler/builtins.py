@@ -1,17 +1,26 @@
 from ..flow import PostgresError
-from .helpers import format_select_results
+from .profiler import get_profiler
+from .helpers import format_select_results, as_row_dicts
+from .predicates import parse_where_predicates, filter_rows
+from .aggregates import is_aggregate_query, aggregate_select_results
+from .sorting import sort_select_results
+from .stats import get_statement_stats, get_session_registry, PG_STAT_STATEMENTS_COLUMNS, PG_STAT_ACTIVITY_COLUMNS
 
 
 class QueryPostgresBuiltinsMixin(object):
     """Implements the minimum to avoid triggering errors for clients querying these tables and functions on start
     """
     pg_builtin_tables = {'pg_matviews', 'pg_type', 'pg_index', 'pg_attribute', 'pg_settings',
-        'pg_database', 'pg_roles', 'pg_user', 'pg_enum', 'pg_class', 'pg_namespace'}
+        'pg_database', 'pg_roles', 'pg_user', 'pg_enum', 'pg_class', 'pg_namespace',
+        'pg_stat_activity', 'pg_stat_statements'}
 
     pg_builtin_functions = {
         'current_schema()': 'public',
         'version()': 'PostgreSQL 13.1 (Kantree Tranlation Layer)',
-        'pg_backend_pid()': 0
+        'pg_backend_pid()': 0,
+        'pg_stat_statements_reset()': '',
+        'pg_profiler_start()': '',
+        'pg_profiler_stop()': ''
     }
 
     def is_postgres_builtins_query(self, stmt_type, stmt_info):
@@ -35,7 +44,58 @@ class QueryPostgresBuiltinsMixin(object):
         return stmt_type, rows, cols
 
     def handle_postgres_builtin_function_calls(self, stmt_info):
-        return [self.pg_builtin_functions], self.pg_builtin_functions.keys()
+        functions = dict(self.pg_builtin_functions)
+        if 'pg_backend_pid()' in functions:
+            functions['pg_backend_pid()'] = getattr(self, 'backend_pid', 0)
+        if 'pg_stat_statements_reset()' in {c.name for c in stmt_info.columns}:
+            if not self.is_admin_user():
+                raise PostgresError('must be an admin user to reset statement statistics', code='42501')
+            get_statement_stats(getattr(self, 'server', None)).reset()
+        if {'pg_profiler_start()', 'pg_profiler_stop()'} & {c.name for c in stmt_info.columns}:
+            functions.update(self.handle_profiler_function_calls(stmt_info))
+        return [functions], functions.keys()
+
+    def is_admin_user(self):
+        """Admin users (admin_users server property) can control the profiler and see and reset the statistics of all
+           users. They must have been authenticated as anyone can use any user name otherwise.
+        """
+        if not getattr(self, 'authenticated', False):
+            return False
+        return getattr(self, 'user', None) in (getattr(getattr(self, 'server', None), 'admin_users', None) or ())
+
+    def handle_profiler_function_calls(self, stmt_info):
+        server = getattr(self, 'server', None)
+        if not self.is_admin_user():
+            raise PostgresError('must be an admin user to control the profiler', code='42501')
+        profiler = get_profiler(server)
+        if 'pg_profiler_stop()' in {c.name for c in stmt_info.columns}:
+            return {'pg_profiler_stop()': profiler.stop() or ''}
+        profiler.start()
+        return {'pg_profiler_start()': profiler.output_dir}
+
+    def hide_queries_of_other_users(self, rows, user_col):
+        # as postgres does for users without the pg_read_all_stats role
+        if self.is_admin_user():
+            return rows
+        user = getattr(self, 'user', None)
+        return [row if row[user_col] == user else dict(row, query='<insufficient privilege>') for row in rows]
 
     def handle_postgres_builtin_tables_query(self, stmt_info):
-        return [], []
+        tables = {t.name for t in stmt_info.tables}
+        if tables == {'pg_stat_statements'}:
+            rows, cols = get_statement_stats(getattr(self, 'server', None)).rows(), PG_STAT_STATEMENTS_COLUMNS
+            rows = self.hide_queries_of_other_users(rows, 'userid')
+        elif tables == {'pg_stat_activity'}:
+            rows, cols = get_session_registry(getattr(self, 'server', None)).rows(), PG_STAT_ACTIVITY_COLUMNS
+            rows = self.hide_queries_of_other_users(rows, 'usename')
+        else:
+            return [], []
+        predicates = parse_where_predicates(stmt_info.where, stmt_info.tables[0], stmt_info.params)
+        if predicates is None:
+            raise PostgresError('only comparisons combined with AND are supported on statistics tables', code='0A000')
+        rows = list(filter_rows(rows, predicates))
+        if is_aggregate_query(stmt_info):
+            rows, cols = aggregate_select_results(rows, cols, stmt_info)
+        if stmt_info.order_by or stmt_info.limit or stmt_info.offset:
+            rows, cols = sort_select_results(as_row_dicts(rows), cols, stmt_info)
+        return rows, cols
@@ -0,0 +1,183 @@
+import itertools
+import re
+from ..flow import PostgresError
+from ..sql.parser import parse_identifier
+from ..stream import ColumnBatch, column_values
+from .helpers import stmt_handler
+from .spill import SpillFile
+from .pooling import TRANSACTION_IDLE
+
+
+DECLARE_RE = re.compile(r"""^\s*(?P<name>"[^"]+"|[\w$]+)\s+(?:BINARY\s+)?(?:(?:ASENSITIVE|INSENSITIVE)\s+)?(?P<scroll>(?:NO\s+)?SCROLL\s+)?
+    CURSOR\s+(?:(?P<hold>WITH|WITHOUT)\s+HOLD\s+)?FOR\s+(?P<query>.+)$""", re.IGNORECASE | re.DOTALL | re.VERBOSE)
+
+FETCH_DIRECTION_KEYWORDS = ('NEXT', 'PRIOR', 'FIRST', 'LAST', 'ABSOLUTE', 'RELATIVE', 'FORWARD', 'BACKWARD', 'ALL')
+
+
+def iter_rows(rows):
+    """Iterates over rows returned by handlers, ColumnBatch objects being iterated row by row
+    """
+    if isinstance(rows, ColumnBatch):
+        return zip(*[column_values(col) for col in rows.columns])
+    return iter(rows or ())
+
+
+class Cursor(object):
+    """Named cursor reading rows lazily from the results of its query. Cursors can only scan forward.
+    """
+    def __init__(self, name, rows, cols, hold=False):
+        self.name = name
+        self.rows = iter_rows(rows)
+        self.cols = cols
+        self.hold = hold
+        self.position = 0 # number of rows read
+        self.spill_file = None
+
+    def fetch(self, count=None):
+        rows = list(itertools.islice(self.rows, count))
+        self.position += len(rows)
+        return rows
+
+    def skip(self, count=None):
+        skipped = sum(1 for _ in itertools.islice(self.rows, count))
+        self.position += skipped
+        return skipped
+
+    def materialize(self, spill_dir=None):
+        """Reads the remaining rows into a temporary file so that they outlive the backend resources of the
+           transaction (cursors declared WITH HOLD)
+        """
+        if self.spill_file is not None:
+            return
+        self.spill_file = SpillFile(spill_dir)
+        for row in self.rows:
+            self.spill_file.write(row)
+        self.rows = iter(self.spill_file)
+
+    def close(self):
+        close = getattr(self.rows, 'close', None)
+        if close:
+            close()
+        if self.spill_file is not None:
+            self.spill_file.close()
+
+
+def parse_declare(sql):
+    """Returns a tuple (name, hold, query) from the text following DECLARE
+    """
+    m = DECLARE_RE.match(sql)
+    if not m:
+        raise PostgresError('syntax error in DECLARE', code='42601')
+    if m.group('scroll') and not m.group('scroll').upper().startswith('NO'):
+        raise PostgresError('scrollable cursors are not supported', code='0A000')
+    return parse_identifier(m.group('name')), (m.group('hold') or '').upper() == 'WITH', m.group('query').strip()
+
+
+def parse_fetch(sql):
+    """Returns a tuple (cursor name, count, skip) from the text following FETCH or MOVE, where skip is the number
+       of rows to skip before fetching count rows (None meaning all rows)
+    """
+    words = sql.split()
+    if not words:
+        raise PostgresError('cursor name required', code='42601')
+    name = parse_identifier(words.pop())
+    if words and words[-1].upper() in ('FROM', 'IN'):
+        words.pop()
+    direction = [w.upper() for w in words]
+    if direction in ([], ['NEXT'], ['FORWARD']):
+        return name, 1, 0
+    if direction in (['ALL'], ['FORWARD', 'ALL']):
+        return name, None, 0
+    if len(direction) <= 2 and direction[-1].lstrip('+-').isdigit():
+        keyword = direction[0] if len(direction) == 2 else 'FORWARD'
+        count = int(direction[-1])
+        if keyword == 'FORWARD' and count >= 0:
+            return name, count, 0
+        if keyword == 'RELATIVE' and count > 0:
+            return name, 1, count - 1
+    if direction[0] in FETCH_DIRECTION_KEYWORDS or direction[0].lstrip('+-').isdigit():
+        raise PostgresError('cursor can only scan forward', code='55000')
+    raise PostgresError('syntax error in FETCH', code='42601')
+
+
+class CursorsMixin(object):
+    """Implements DECLARE, FETCH, MOVE and CLOSE. Cursors read the results of their query lazily as rows
+       are fetched, so that clients using the simple query protocol can page through large results.
+       Cursors are closed at the end of the transaction unless declared WITH HOLD, in which case the remaining
+       rows are spilled to a temporary file.
+    """
+    max_cursors_per_session = 100
+    cursors_spill_dir = None
+
+    @property
+    def cursors(self):
+        return self.__dict__.setdefault('_cursors', {})
+
+    def get_cursor(self, name):
+        if name not in self.cursors:
+            raise PostgresError(f"cursor \"{name}\" does not exist", code='34000')
+        return self.cursors[name]
+
+    @stmt_handler('DECLARE')
+    def handle_declare(self, stmt_info):
+        name, hold, query = parse_declare(stmt_info['DECLARE'])
+        if not hold and self.transaction_status == TRANSACTION_IDLE:
+            raise PostgresError('DECLARE CURSOR can only be used in transaction blocks', code='25P01')
+        if name in self.cursors:
+            raise PostgresError(f"cursor \"{name}\" already exists", code='42P03')
+        max_cursors = getattr(getattr(self, 'server', None), 'max_cursors_per_session', None) or self.max_cursors_per_session
+        if len(self.cursors) >= max_cursors:
+            raise PostgresError(f"too many open cursors (max: {max_cursors})", code='54000')
+        params = stmt_info.get('params')
+        if self.parse_sql(query, params)[0] != 'SELECT':
+            raise PostgresError('DECLARE CURSOR must be followed by a SELECT statement', code='42601')
+        command, rows, cols = self.execute_query(query, params)
+        cursor = Cursor(name, rows, cols, hold)
+        if hold and self.transaction_status == TRANSACTION_IDLE:
+            # the statement is its own transaction
+            cursor.materialize(self.cursors_spill_dir)
+        self.cursors[name] = cursor
+        return None, None, 'DECLARE CURSOR'
+
+    @stmt_handler('FETCH')
+    def handle_fetch(self, stmt_info):
+        name, count, skip = parse_fetch(stmt_info['FETCH'])
+        cursor = self.get_cursor(name)
+        cursor.skip(skip)
+        rows = cursor.fetch(count)
+        return rows, cursor.cols, f"FETCH {len(rows)}"
+
+    @stmt_handler('MOVE')
+    def handle_move(self, stmt_info):
+        name, count, skip = parse_fetch(stmt_info['MOVE'])
+        cursor = self.get_cursor(name)
+        return None, None, f"MOVE {cursor.skip(skip) + cursor.skip(count)}"
+
+    @stmt_handler('CLOSE')
+    def handle_close(self, stmt_info):
+        name = stmt_info['CLOSE'].strip()
+        if name.upper() == 'ALL':
+            self.close_cursors()
+            return None, None, 'CLOSE CURSOR ALL'
+        self.cursors.pop(self.get_cursor(parse_identifier(name)).name).close()
+        return None, None, 'CLOSE CURSOR'
+
+    def close_cursors(self, keep=lambda cursor: False):
+        for name, cursor in list(self.cursors.items()):
+            if not keep(cursor):
+                self.cursors.pop(name).close()
+
+    def handle_transaction_end(self, committed):
+        if committed:
+            for cursor in self.cursors.values():
+                if cursor.hold:
+                    cursor.materialize(self.cursors_spill_dir)
+        # cursors declared WITH HOLD in earlier transactions are already materialized
+        self.close_cursors(keep=lambda cursor: cursor.hold and cursor.spill_file is not None)
+        super().handle_transaction_end(committed)
+
+    def handle_session_end(self):
+        try:
+            self.close_cursors()
+        finally:
+            super().handle_session_end()
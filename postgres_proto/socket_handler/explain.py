@@ -0,0 +1,202 @@
+import time
+from ..flow import PostgresError
+from ..stream import PostgresBuffer
+from .helpers import stmt_handler
+from .aggregates import is_aggregate_query
+
+
+def materialize(data):
+    if data is None or hasattr(data, '__len__'):
+        return data
+    return list(data)
+
+
+class Stage(object):
+    """Statistics of one stage of a query execution. Used as a context manager to time the stage.
+    """
+    def __init__(self, name, profile):
+        self.name = name
+        self.profile = profile
+        self.elapsed = None
+        self.rows_in = None
+        self.rows_out = None
+        self.bytes = None
+        self.cache_hits = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.profile.stages.append(self)
+
+    def input(self, data):
+        """Counts rows entering the stage, iterators are materialized to be counted
+        """
+        data = materialize(data)
+        self.rows_in = len(data) if data is not None else 0
+        return data
+
+    def output(self, data):
+        data = materialize(data)
+        self.rows_out = len(data) if data is not None else 0
+        return data
+
+    def hit(self, n=1):
+        self.cache_hits += n
+
+    def add_bytes(self, n):
+        self.bytes = (self.bytes or 0) + n
+
+
+class NullStage(object):
+    """Stage used when queries are not profiled
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def input(self, data):
+        return data
+
+    def output(self, data):
+        return data
+
+    def hit(self, n=1):
+        pass
+
+    def add_bytes(self, n):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class QueryProfile(object):
+    def __init__(self):
+        self.stages = []
+
+    def stage(self, name):
+        return Stage(name, self)
+
+
+def parse_explain_options(sql):
+    """Returns a tuple (options, statement) from the text following EXPLAIN
+    """
+    sql = sql.strip()
+    options = set()
+    if sql.startswith('('):
+        end = sql.find(')')
+        if end == -1:
+            raise PostgresError('syntax error in EXPLAIN options', code='42601')
+        for option in sql[1:end].split(','):
+            words = option.strip().upper().split()
+            if words and (len(words) == 1 or words[1] in ('TRUE', 'ON', '1')):
+                options.add(words[0])
+        sql = sql[end + 1:].strip()
+    else:
+        words = sql.split(None, 1)
+        while words and words[0].upper() in ('ANALYZE', 'ANALYSE', 'VERBOSE'):
+            options.add(words[0].upper())
+            sql = words[1] if len(words) > 1 else ''
+            words = sql.split(None, 1)
+    if not sql:
+        raise PostgresError('EXPLAIN requires a statement', code='42601')
+    if 'ANALYSE' in options:
+        options.add('ANALYZE')
+    return options, sql
+
+
+def format_ms(seconds):
+    return '%.3f ms' % (seconds * 1000)
+
+
+def format_stage(stage):
+    stats = [f"time={format_ms(stage.elapsed)}"]
+    if stage.rows_in is not None:
+        stats.append(f"rows in={stage.rows_in}")
+    if stage.rows_out is not None:
+        stats.append(f"rows out={stage.rows_out}")
+    if stage.bytes is not None:
+        stats.append(f"bytes={stage.bytes}")
+    if stage.cache_hits:
+        stats.append(f"cache hits={stage.cache_hits}")
+    return f"  ->  {stage.name}  ({', '.join(stats)})"
+
+
+class ExplainMixin(object):
+    """Implements EXPLAIN and EXPLAIN ANALYZE. EXPLAIN lists the stages which would execute the statement,
+       EXPLAIN ANALYZE executes it (discarding results) and reports the statistics of each stage.
+       Stages are declared using stage(), backends can describe what they execute using explain_pushdown().
+    """
+    def stage(self, name):
+        """Context manager returning the Stage object recording statistics for EXPLAIN ANALYZE
+        """
+        profile = self.__dict__.get('query_profile')
+        return profile.stage(name) if profile is not None else NULL_STAGE
+
+    def explain_pushdown(self, stmt_info):
+        """Returns a list of descriptions of the parts of a SELECT statement executed by the backend
+        """
+        return []
+
+    def explain_stages(self, stmt_type, stmt_info):
+        """Returns the names of the stages which would execute the statement
+        """
+        if stmt_type != 'SELECT':
+            return [f"handle_{stmt_type.lower()}"]
+        if self.is_postgres_builtins_query(stmt_type, stmt_info):
+            return ['postgres_builtins']
+        if self.is_information_schema_query(stmt_type, stmt_info):
+            return ['information_schema']
+        stages = ['query_joined_tables' if any(t.joins for t in stmt_info.tables) else 'query_tables']
+        if is_aggregate_query(stmt_info):
+            stages.append('aggregate_results')
+        if stmt_info.order_by or stmt_info.limit or stmt_info.offset:
+            stages.append('sort_results')
+        stages.append('format_select_results')
+        return stages
+
+    def explain_pushdown_lines(self, stmt_type, stmt_info):
+        if stmt_type != 'SELECT' or self.is_postgres_builtins_query(stmt_type, stmt_info) or \
+                self.is_information_schema_query(stmt_type, stmt_info):
+            return []
+        return [f"Pushed down: {p}" for p in self.explain_pushdown(stmt_info)]
+
+    @stmt_handler('EXPLAIN')
+    def handle_explain(self, stmt_info):
+        options, query = parse_explain_options(stmt_info['EXPLAIN'])
+        if 'ANALYZE' in options:
+            lines = self.explain_analyze(query, stmt_info.get('params'))
+        else:
+            lines = self.explain(query, stmt_info.get('params'))
+        return [(line,) for line in lines], ['QUERY PLAN']
+
+    def explain(self, query, params=None):
+        stmt_type, stmt_info = self.parse_sql(query, params)
+        lines = [stmt_type] + [f"  ->  {name}" for name in self.explain_stages(stmt_type, stmt_info)]
+        return lines + self.explain_pushdown_lines(stmt_type, stmt_info)
+
+    def explain_analyze(self, query, params=None):
+        profile = self.__dict__['query_profile'] = QueryProfile()
+        try:
+            start = time.perf_counter()
+            command, rows, cols = self.execute_query(query, params)
+            with self.stage('encode') as stage:
+                rows = stage.input(rows)
+                buf = PostgresBuffer()
+                if rows:
+                    buf.write_data_rows(rows)
+                stage.add_bytes(len(buf.getvalue()))
+            elapsed = time.perf_counter() - start
+        finally:
+            del self.__dict__['query_profile']
+        stmt_type, stmt_info = self.parse_sql(query, params)
+        lines = [f"{command}  (actual time={format_ms(elapsed)}, rows={len(rows) if rows is not None else 0})"]
+        lines.extend(format_stage(stage) for stage in profile.stages)
+        lines.extend(self.explain_pushdown_lines(stmt_type, stmt_info))
+        lines.append(f"Execution Time: {format_ms(elapsed)}")
+        return lines
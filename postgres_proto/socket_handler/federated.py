@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import threading
+import time
+from ..flow import PostgresError
+from ..sql import iter_from_tables
+from .helpers import server_resource
+from .joins import merge_table_results, get_joined_where_predicates, single_table_stmt
+from .predicates import filter_joined_rows
+
+
+_executors_lock = threading.Lock()
+
+
+class TableSource(object):
+    """A source of tables for FederatedQueryMixin. Override fetch_table().
+    """
+    timeout = None # seconds, None to use FederatedQueryMixin.default_source_timeout
+    max_workers = None # concurrent fetches of a table, None to use FederatedQueryMixin.federated_max_workers
+
+    def fetch_table(self, table, stmt_info):
+        """Must return a tuple (rows, columns) similar to query_tables() for a single table (a FromTableExpr).
+           With multiple tables, stmt_info.where only has the comparisons applying to this table.
+        """
+        raise NotImplementedError()
+
+    def list_tables(self):
+        return []
+
+    def describe_table(self, table_name):
+        return []
+
+
+class FederatedQueryMixin(object):
+    """Implements query_tables() by fetching each table from its TableSource concurrently.
+       Each table is fetched in its own thread pool shared by all sessions of the server: fetches cannot be
+       interrupted, so a source which hangs only occupies the workers of its table.
+    """
+    table_sources = {}
+    default_source_timeout = None
+    federated_max_workers = 16 # per table
+
+    def get_table_sources(self):
+        return self.table_sources
+
+    def get_table_source(self, table):
+        source = self.get_table_sources().get(table.name)
+        if not source:
+            raise PostgresError(f"unknown table {table.name}", code="42P01")
+        return source
+
+    def get_source_executor(self, table, source):
+        server = getattr(self, 'server', self)
+        executors = server_resource(server, 'federated_executors', dict)
+        with _executors_lock:
+            if table.name not in executors:
+                max_workers = source.max_workers or getattr(server, 'federated_max_workers', None) or self.federated_max_workers
+                executors[table.name] = ThreadPoolExecutor(max_workers, f"federated-{table.name}")
+            return executors[table.name]
+
+    def query_tables(self, stmt_info):
+        tables = list(iter_from_tables(stmt_info.tables))
+        if len(tables) == 1:
+            return self.fetch_tables(tables, [stmt_info])[0]
+        # sources only get the comparisons on their table, the whole WHERE clause is evaluated once merged
+        predicates = get_joined_where_predicates(stmt_info)
+        results = self.fetch_tables(tables, [single_table_stmt(stmt_info, table) for table in tables])
+        rows, cols = merge_table_results(stmt_info.tables, results, getattr(self, 'join_max_build_rows', None),
+                                         getattr(self, 'spill_dir', None))
+        return filter_joined_rows(rows, predicates), cols
+
+    def query_joined_tables(self, stmt_info):
+        return self.query_tables(stmt_info)
+
+    def fetch_tables(self, tables, stmts):
+        start = time.monotonic()
+        sources = [self.get_table_source(table) for table in tables]
+        futures = [self.get_source_executor(table, source).submit(source.fetch_table, stmt.tables[0], stmt)
+                   for table, source, stmt in zip(tables, sources, stmts)]
+        try:
+            return [self.wait_source_result(table, source, future, start) for table, source, future in zip(tables, sources, futures)]
+        finally:
+            # fetches still queued are dropped, running ones complete in the background
+            for future in futures:
+                future.cancel()
+
+    def wait_source_result(self, table, source, future, start):
+        timeout = source.timeout if source.timeout is not None else self.default_source_timeout
+        try:
+            return future.result(None if timeout is None else max(0, start + timeout - time.monotonic()))
+        except TimeoutError:
+            future.cancel()
+            raise PostgresError(f"timeout while fetching table {table.name}", code="57014")
+
+    def list_tables(self):
+        return list(self.get_table_sources().keys())
+
+    def describe_table(self, table_name):
+        source = self.get_table_sources().get(table_name)
+        return source.describe_table(table_name) if source else []
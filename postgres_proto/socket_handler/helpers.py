@@ -1,13 +1,98 @@
-from ..stream import ColumnDef
+from collections import OrderedDict
+from decimal import Decimal
+import threading
+from ..flow import PostgresError
+from ..stream import ColumnDef, ColumnBatch
+
+
+_server_resources_lock = threading.Lock()
+
+
+def stmt_handler(name):
+    def decorator(func):
+        func.__stmt_handler__ = name
+        return func
+    return decorator
+
+
+def server_resource(server, name, factory):
+    """Returns an object shared by all sessions of a server, creating it using factory() on first access
+    """
+    if server is None:
+        return factory()
+    with _server_resources_lock:
+        if getattr(server, name, None) is None:
+            setattr(server, name, factory())
+        return getattr(server, name)
+
+
+class LRUCache(object):
+    """Thread safe mapping keeping the most recently used items
+    """
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            if len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+
+def to_number(value):
+    """Converts strings (eg: from text based sources) to int or float, returns None if not a number
+    """
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+
+def compare_key(value):
+    """Key to compare values of possibly mixed types, numbers (including numeric strings) first
+    """
+    if type(value) in (int, float):
+        return (0, value, '')
+    number = to_number(value)
+    if number is not None:
+        return (0, number, '')
+    return (1, 0, str(value))
 
 
 def filter_selected_cols(cols, select_cols):
     if select_cols[0] == '*':
         return cols, cols
-    return [col.lower().split('.', 1)[-1] for col in select_cols], select_cols
+    return [resolve_col_name(col.lower(), cols) for col in select_cols], select_cols
+
+
+def resolve_col_name(col, cols):
+    # qualified names are only kept when the results have them (eg: same column in joined tables)
+    return col if col in cols else col.split('.', 1)[-1]
 
 
 def format_rows(data, cols):
+    if not isinstance(data, list):
+        # rows produced lazily are streamed
+        return ([item.get(c, '') for c in cols] for item in data)
     return [list([item.get(c, '') for c in cols]) for item in data]
 
 
@@ -19,6 +104,21 @@ def format_result_cols(cols, cols_aliases=None):
 
 def format_select_results(data, cols, stmt_info):
     select_cols, col_names = filter_selected_cols(cols, [c.name for c in stmt_info.columns])
+    aliases = {c.name: c.alias for c in stmt_info.columns if c.alias}
+    if isinstance(data, ColumnBatch):
+        for col, name in zip(select_cols, col_names):
+            if col not in data.names:
+                raise PostgresError(f'column "{name}" does not exist', code="42703")
+        batch = data.select(list(select_cols))
+        return batch, batch.column_defs({c: aliases.get(n, n) for c, n in zip(select_cols, col_names)})
     rows = format_rows(data, select_cols)
-    cols = format_result_cols(col_names, {c.name: c.alias for c in stmt_info.columns if c.alias})
+    cols = format_result_cols(col_names, aliases)
     return rows, cols
+
+
+def as_row_dicts(data):
+    """Rows as dicts for operators (joins, aggregation, sorting), data being a list of dicts or a ColumnBatch
+    """
+    if isinstance(data, ColumnBatch):
+        return data.iter_dicts()
+    return data
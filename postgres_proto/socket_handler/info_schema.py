@@ -38,7 +38,7 @@ class QueryInformationSchemaMixin(object):
     def handle_information_schema_columns_query(self, stmt_info):
         if not stmt_info.where:
             return [], []
-        table_name = extract_value_from_where_comparison(stmt_info.where, 'table_name')
+        table_name = extract_value_from_where_comparison(stmt_info.where, 'table_name', stmt_info.params)
         if not table_name:
             return [], []
         rows = []
@@ -0,0 +1,187 @@
+import itertools
+from ..flow import PostgresError
+from ..sql import iter_from_tables
+from .helpers import as_row_dicts
+from .predicates import parse_joined_where_predicates, get_table_where
+from .spill import SpillFile
+
+
+MAX_PARTITION_LEVELS = 3
+
+
+def table_prefix(table):
+    return table.alias or table.name
+
+
+def qualify_row(row, prefix):
+    qualified = dict(row)
+    qualified.update({f"{prefix}.{k}": v for k, v in row.items()})
+    return qualified
+
+
+def combine_rows(rows):
+    # unqualified column names resolve to the first table that has them
+    combined = {}
+    for row in reversed(rows):
+        combined.update(row)
+    return combined
+
+
+def merge_cols(tables, tables_cols):
+    counts = {}
+    for cols in tables_cols:
+        for col in cols:
+            counts[col] = counts.get(col, 0) + 1
+    merged = []
+    for table, cols in zip(tables, tables_cols):
+        merged.extend(c if counts[c] == 1 else f"{table_prefix(table)}.{c}" for c in cols)
+    return merged
+
+
+def cross_join(tables_rows):
+    return (combine_rows(rows) for rows in itertools.product(*[list(rows) for rows in tables_rows]))
+
+
+def join_key(row, cols):
+    if len(cols) == 1:
+        value = row.get(cols[0])
+        return value if value is None or type(value) is str else str(value)
+    key = tuple(row.get(c) for c in cols)
+    if None in key:
+        return None # NULL never matches
+    return tuple(str(v) for v in key)
+
+
+def build_hash_table(rows, cols, max_rows=None):
+    """Returns the hash table or None if max_rows is reached (rows consumed so far are then left in the iterator)
+    """
+    table = {}
+    count = 0
+    for row in rows:
+        key = join_key(row, cols)
+        if key is not None:
+            table.setdefault(key, []).append(row)
+        count += 1
+        if max_rows is not None and count >= max_rows:
+            return None, table
+    return table, None
+
+
+def probe_hash_table(table, rows, cols, build_is_left=False, null_row=None):
+    for row in rows:
+        matches = table.get(join_key(row, cols), ())
+        for match in matches:
+            yield combine_rows([match, row] if build_is_left else [row, match])
+        if not matches and null_row is not None:
+            yield combine_rows([row, null_row])
+
+
+def partition_rows(rows, cols, nb_partitions, level, spill_dir=None):
+    partitions = [SpillFile(spill_dir) for i in range(nb_partitions)]
+    for row in rows:
+        key = join_key(row, cols)
+        partitions[hash((level, key)) % nb_partitions].write(row)
+    return partitions
+
+
+def hash_join(left, right, left_cols, right_cols, join_type='INNER', null_row=None, left_size=None, right_size=None,
+              max_build_rows=None, nb_partitions=16, spill_dir=None, level=0):
+    """Joins two iterables of row dicts on equality of left_cols and right_cols, streaming the probe side.
+       INNER joins build the hash table on the smallest input when sizes are known. LEFT joins always build on the
+       right input and use null_row for unmatched left rows.
+       When the build side exceeds max_build_rows, both sides are partitioned to disk and joined partition by
+       partition (grace hash join).
+    """
+    build_is_left = join_type == 'INNER' and left_size is not None and right_size is not None and left_size < right_size
+    build, build_cols, probe, probe_cols = (left, left_cols, right, right_cols) if build_is_left else (right, right_cols, left, left_cols)
+    build = iter(build)
+    table, partial = build_hash_table(build, build_cols, max_build_rows)
+    if table is not None:
+        yield from probe_hash_table(table, probe, probe_cols, build_is_left, null_row)
+        return
+
+    build_rows = itertools.chain((row for rows in partial.values() for row in rows), build)
+    build_partitions = partition_rows(build_rows, build_cols, nb_partitions, level, spill_dir)
+    probe_partitions = partition_rows(probe, probe_cols, nb_partitions, level, spill_dir)
+    try:
+        for build_part, probe_part in zip(build_partitions, probe_partitions):
+            if not len(probe_part) or not len(build_part) and null_row is None:
+                continue
+            left_part, right_part = (build_part, probe_part) if build_is_left else (probe_part, build_part)
+            # partitions may stay too big with skewed keys: stop partitioning after a few levels
+            yield from hash_join(left_part, right_part, left_cols, right_cols, join_type, null_row, len(left_part), len(right_part),
+                                 max_build_rows if level < MAX_PARTITION_LEVELS else None, nb_partitions, spill_dir, level + 1)
+    finally:
+        for part in build_partitions + probe_partitions:
+            part.close()
+
+
+def resolve_join_cols(join, on):
+    """Returns the list of left and right columns, the right ones being the columns of the joined table
+    """
+    prefix = table_prefix(join.table)
+    left_cols = []
+    right_cols = []
+    for left_col, right_col in on:
+        if left_col.split('.', 1)[0] == prefix and right_col.split('.', 1)[0] != prefix:
+            left_col, right_col = right_col, left_col
+        left_cols.append(left_col)
+        right_cols.append(right_col if '.' in right_col else f"{prefix}.{right_col}")
+    return left_cols, right_cols
+
+
+def join_table_results(table, results, max_build_rows=None, spill_dir=None):
+    """Joins the results of a table with the results of its joined tables.
+       results is an iterator of (rows, cols) for the table and each joined table.
+    """
+    rows, cols = next(results)
+    size = len(rows) if hasattr(rows, '__len__') else None
+    rows = (qualify_row(row, table_prefix(table)) for row in as_row_dicts(rows))
+    tables_cols = [list(cols)]
+    for join in table.joins or ():
+        join_rows, join_cols = next(results)
+        join_cols = list(join_cols)
+        prefix = table_prefix(join.table)
+        join_size = len(join_rows) if hasattr(join_rows, '__len__') else None
+        null_row = qualify_row({c: None for c in join_cols}, prefix) if join.type == 'LEFT' else None
+        left_cols, right_cols = resolve_join_cols(join, join.on)
+        rows = hash_join(rows, (qualify_row(row, prefix) for row in as_row_dicts(join_rows)), left_cols, right_cols, join.type, null_row,
+                         size, join_size, max_build_rows, spill_dir=spill_dir)
+        size = None
+        tables_cols.append(join_cols)
+    return rows, tables_cols
+
+
+def merge_table_results(tables, results, max_build_rows=None, spill_dir=None):
+    """Merges the (rows, cols) results of each table of the FROM clause, as returned by iter_from_tables().
+       Joined tables are hash joined and tables separated by commas are cross joined.
+    """
+    if len(results) == 1:
+        return results[0]
+    results = iter(results)
+    tables_rows = []
+    tables_cols = []
+    for table in tables:
+        rows, cols = join_table_results(table, results, max_build_rows, spill_dir)
+        tables_rows.append(rows)
+        tables_cols.extend(cols)
+    rows = tables_rows[0] if len(tables_rows) == 1 else cross_join(tables_rows)
+    return rows, merge_cols(list(iter_from_tables(tables)), tables_cols)
+
+
+def get_joined_where_predicates(stmt_info):
+    """Returns the predicates of the WHERE clause of a query on multiple tables, to filter the merged results
+       using filter_joined_rows()
+    """
+    predicates = parse_joined_where_predicates(stmt_info.where, list(iter_from_tables(stmt_info.tables)), stmt_info.params)
+    if predicates is None:
+        raise PostgresError('only comparisons combined with AND are supported in WHERE with multiple tables', code='0A000')
+    return predicates
+
+
+def single_table_stmt(stmt_info, table):
+    """Returns stmt_info querying only one of its tables, the WHERE clause keeping the comparisons which only
+       apply to this table
+    """
+    where = get_table_where(stmt_info.where, table, list(iter_from_tables(stmt_info.tables)))
+    return stmt_info._replace(tables=[table._replace(joins=None)], where=where)
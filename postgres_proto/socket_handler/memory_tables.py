@@ -0,0 +1,262 @@
+import bisect
+import threading
+from ..flow import PostgresError
+from ..sql import SqlExpr
+from .helpers import compare_key
+from .predicates import parse_where_predicates, filter_rows, match_predicates, is_null_value
+
+
+class HashIndex(object):
+    """Index for equality lookups in O(1)
+    """
+    ops = ('=',)
+
+    def __init__(self, col):
+        self.col = col
+        self.entries = {}
+
+    def add(self, rowid, value):
+        if value is not None:
+            self.entries.setdefault(compare_key(value), set()).add(rowid)
+
+    def add_many(self, entries):
+        for rowid, value in entries:
+            self.add(rowid, value)
+
+    def remove(self, rowid, value):
+        if value is not None:
+            rowids = self.entries.get(compare_key(value))
+            rowids.discard(rowid)
+            if not rowids:
+                del self.entries[compare_key(value)]
+
+    def lookup(self, op, value):
+        if op != '=':
+            return None
+        return self.entries.get(compare_key(value), ())
+
+
+class SortedIndex(object):
+    """Index for equality and range lookups in O(log n)
+    """
+    ops = ('=', '<', '<=', '>', '>=')
+
+    def __init__(self, col):
+        self.col = col
+        self.entries = [] # sorted list of (key, rowid)
+
+    def add(self, rowid, value):
+        if value is not None:
+            bisect.insort(self.entries, (compare_key(value), rowid))
+
+    def add_many(self, entries):
+        # sorting the appended entries merges them with the sorted ones in about linear time
+        self.entries.extend((compare_key(value), rowid) for rowid, value in entries if value is not None)
+        self.entries.sort()
+
+    def remove(self, rowid, value):
+        if value is not None:
+            entry = (compare_key(value), rowid)
+            i = bisect.bisect_left(self.entries, entry)
+            if i < len(self.entries) and self.entries[i] == entry:
+                del self.entries[i]
+
+    def lookup(self, op, value):
+        key = compare_key(value)
+        lower = (key, -1)
+        upper = (key, float('inf'))
+        bounds = {
+            '=': (bisect.bisect_left(self.entries, lower), bisect.bisect_right(self.entries, upper)),
+            '<': (0, bisect.bisect_left(self.entries, lower)),
+            '<=': (0, bisect.bisect_right(self.entries, upper)),
+            '>': (bisect.bisect_right(self.entries, upper), len(self.entries)),
+            '>=': (bisect.bisect_left(self.entries, lower), len(self.entries))
+        }
+        if op not in bounds:
+            return None
+        start, end = bounds[op]
+        return [rowid for _, rowid in self.entries[start:end]]
+
+
+class MemoryTable(object):
+    """Rows stored in memory, with hash and sorted indexes kept up to date on inserts, updates and deletes
+    """
+    def __init__(self, columns, rows=(), hash_indexes=(), sorted_indexes=()):
+        self.columns = list(columns)
+        self.rows = {}
+        self.next_rowid = 0
+        self.indexes = {}
+        self.lock = threading.RLock()
+        for col in hash_indexes:
+            self.indexes.setdefault(col, []).append(HashIndex(col))
+        for col in sorted_indexes:
+            self.indexes.setdefault(col, []).append(SortedIndex(col))
+        self.insert_many(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.rows.values()))
+
+    def get(self, rowid):
+        return self.rows[rowid]
+
+    def insert(self, row):
+        with self.lock:
+            rowid = self.next_rowid
+            self.next_rowid += 1
+            self.rows[rowid] = dict(row)
+            for col, indexes in self.indexes.items():
+                for index in indexes:
+                    index.add(rowid, row.get(col))
+            return rowid
+
+    def insert_many(self, rows):
+        with self.lock:
+            rowids = []
+            for row in rows:
+                rowid = self.next_rowid
+                self.next_rowid += 1
+                self.rows[rowid] = dict(row)
+                rowids.append(rowid)
+            for col, indexes in self.indexes.items():
+                for index in indexes:
+                    index.add_many((rowid, self.rows[rowid].get(col)) for rowid in rowids)
+            return rowids
+
+    def update(self, rowid, values):
+        with self.lock:
+            row = dict(self.rows[rowid])
+            for col, value in values.items():
+                for index in self.indexes.get(col, ()):
+                    index.remove(rowid, row.get(col))
+                    index.add(rowid, value)
+            row.update(values)
+            self.rows[rowid] = row # rows are replaced so that concurrent scans see consistent rows
+
+    def delete(self, rowid):
+        with self.lock:
+            row = self.rows.pop(rowid)
+            for col, indexes in self.indexes.items():
+                for index in indexes:
+                    index.remove(rowid, row.get(col))
+
+    def find_index(self, predicates):
+        """Returns a tuple (predicate, index) for the most selective index usable with one of the predicates,
+           or None if no index can be used. Equality lookups are preferred over ranges.
+        """
+        for ops in (('=',), ('<', '<=', '>', '>=')):
+            for predicate in predicates:
+                if predicate.op not in ops or is_null_value(predicate.value):
+                    continue
+                for index in self.indexes.get(predicate.col, ()):
+                    if predicate.op in index.ops:
+                        return predicate, index
+        return None
+
+    def lookup_rowids(self, predicates):
+        """Returns rowids matching one of the predicates using an index, or None if no index can be used
+        """
+        found = self.find_index(predicates)
+        if found is None:
+            return None
+        predicate, index = found
+        return index.lookup(predicate.op, predicate.value)
+
+    def find_rowids(self, predicates):
+        """Returns the rowids of rows matching all predicates
+        """
+        with self.lock:
+            rowids = self.lookup_rowids(predicates) if predicates else None
+            candidates = list(self.rows) if rowids is None else sorted(rowids)
+            return [rowid for rowid in candidates if match_predicates(self.rows[rowid], predicates)]
+
+    def scan(self, predicates=None):
+        """Iterates over rows matching all predicates (see parse_where_predicates())
+        """
+        if not predicates:
+            return iter(self)
+        with self.lock:
+            rowids = self.lookup_rowids(predicates)
+            rows = iter(self) if rowids is None else [self.rows[rowid] for rowid in sorted(rowids)]
+        return filter_rows(rows, predicates)
+
+
+class MemoryTablesMixin(object):
+    """Implements query_tables(), insert_rows(), update_rows(), delete_rows(), list_tables() and describe_table()
+       using MemoryTable objects. WHERE clauses made of AND-ed comparisons are evaluated using indexes when possible,
+       other WHERE clauses are rejected.
+    """
+    memory_tables = {}
+
+    def get_memory_tables(self):
+        return self.memory_tables
+
+    def get_memory_table(self, table):
+        memory_table = self.get_memory_tables().get(table.name)
+        if memory_table is None:
+            raise PostgresError(f"unknown table {table.name}", code="42P01")
+        return memory_table
+
+    def query_tables(self, stmt_info):
+        if len(stmt_info.tables) > 1:
+            # each table is scanned with the comparisons applying to it, WHERE being evaluated on the merged rows
+            return self.query_joined_tables(stmt_info)
+        table = stmt_info.tables[0]
+        memory_table = self.get_memory_table(table)
+        return memory_table.scan(self.get_where_predicates(table, stmt_info)), memory_table.columns
+
+    def get_where_predicates(self, table, stmt_info):
+        predicates = parse_where_predicates(stmt_info.where, table, stmt_info.params)
+        if predicates is None:
+            raise PostgresError('only comparisons combined with AND are supported in WHERE', code='0A000')
+        return predicates
+
+    def get_write_rowids(self, memory_table, table, stmt_info):
+        return memory_table.find_rowids(self.get_where_predicates(table, stmt_info))
+
+    def insert_rows(self, table, rows, stmt_info):
+        memory_table = self.get_memory_table(table)
+        rowids = memory_table.insert_many(rows)
+        return [memory_table.get(rowid) for rowid in rowids] if stmt_info.returning else len(rowids)
+
+    def update_rows(self, table, assignments, stmt_info):
+        if any(isinstance(value, SqlExpr) for value in assignments.values()):
+            raise PostgresError('only literal values are supported in SET', code='0A000')
+        memory_table = self.get_memory_table(table)
+        with memory_table.lock:
+            rowids = self.get_write_rowids(memory_table, table, stmt_info)
+            for rowid in rowids:
+                memory_table.update(rowid, assignments)
+            return [memory_table.get(rowid) for rowid in rowids] if stmt_info.returning else len(rowids)
+
+    def delete_rows(self, table, stmt_info):
+        memory_table = self.get_memory_table(table)
+        with memory_table.lock:
+            rowids = self.get_write_rowids(memory_table, table, stmt_info)
+            rows = [memory_table.get(rowid) for rowid in rowids]
+            for rowid in rowids:
+                memory_table.delete(rowid)
+            return rows if stmt_info.returning else len(rows)
+
+    def explain_pushdown(self, stmt_info):
+        if len(stmt_info.tables) != 1 or not stmt_info.where:
+            return []
+        table = stmt_info.tables[0]
+        predicates = parse_where_predicates(stmt_info.where, table, stmt_info.params)
+        if predicates is None:
+            return []
+        found = self.get_memory_table(table).find_index(predicates)
+        if found is None:
+            return [f"WHERE evaluated by scanning {table.name}"]
+        predicate, index = found
+        return [f"WHERE evaluated using {type(index).__name__} on {table.name}.{predicate.col}"]
+
+    def list_tables(self):
+        return list(self.get_memory_tables().keys())
+
+    def describe_table(self, table_name):
+        memory_table = self.get_memory_tables().get(table_name)
+        return memory_table.columns if memory_table is not None else []
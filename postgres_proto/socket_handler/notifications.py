@@ -0,0 +1,198 @@
+from collections import namedtuple, deque
+import itertools
+import select
+import socket
+import threading
+from ..flow import PostgresError
+from ..sql import tokenize_comma_separated_list, resolve_param
+from .helpers import server_resource, stmt_handler
+from .pooling import TRANSACTION_IDLE
+
+
+Notification = namedtuple('Notification', ['pid', 'channel', 'payload'])
+
+
+class NotificationChannels(object):
+    """Server-wide registry of listened channels. Notifications are queued on listening sessions, which
+       send them from their own thread so that notify() never blocks on a client socket.
+    """
+    def __init__(self):
+        self.listeners = {}
+        self.lock = threading.Lock()
+
+    def listen(self, channel, session):
+        with self.lock:
+            self.listeners.setdefault(channel, set()).add(session)
+
+    def unlisten(self, channel, session):
+        with self.lock:
+            sessions = self.listeners.get(channel)
+            if sessions:
+                sessions.discard(session)
+                if not sessions:
+                    del self.listeners[channel]
+
+    def unlisten_all(self, session):
+        with self.lock:
+            for channel in [c for c, sessions in self.listeners.items() if session in sessions]:
+                self.listeners[channel].discard(session)
+                if not self.listeners[channel]:
+                    del self.listeners[channel]
+
+    def get_listeners(self, channel):
+        with self.lock:
+            return list(self.listeners.get(channel, ()))
+
+    def notify(self, channel, payload='', pid=0):
+        notification = Notification(pid, channel, payload)
+        for session in self.get_listeners(channel):
+            session.deliver_notification(notification)
+
+
+def get_notification_channels(server):
+    return server_resource(server, 'notification_channels', NotificationChannels)
+
+
+def notify(server, channel, payload=''):
+    """Publishes a notification to all sessions listening on channel
+    """
+    get_notification_channels(server).notify(channel, payload)
+
+
+def parse_channel_name(name):
+    name = name.strip()
+    if not name:
+        raise PostgresError('channel name cannot be empty', code='42601')
+    if name.startswith('"') and name.endswith('"'):
+        return name[1:-1]
+    return name.lower()
+
+
+def parse_notify_args(sql, params=None):
+    args = [expr.strip() for expr, _ in tokenize_comma_separated_list(sql)]
+    if not args or len(args) > 2:
+        raise PostgresError('syntax error in NOTIFY', code='42601')
+    payload = resolve_param(args[1], params) if len(args) > 1 else ''
+    if len(args) > 1 and payload is args[1]:
+        if not (payload.startswith("'") and payload.endswith("'")):
+            raise PostgresError('NOTIFY payload must be a string literal', code='42601')
+        payload = payload[1:-1].replace("''", "'")
+    return parse_channel_name(args[0]), str(payload)
+
+
+class NotificationsMixin(object):
+    """Implements LISTEN, UNLISTEN and NOTIFY. Notifications are sent right away to idle sessions and
+       after the current command otherwise, always from the thread of the session. Notifications published
+       in a transaction are sent on COMMIT and discarded on ROLLBACK. Use notify() to publish notifications
+       from handlers.
+    """
+    @property
+    def notification_channels(self):
+        return get_notification_channels(getattr(self, 'server', None))
+
+    @property
+    def backend_pid(self):
+        if 'backend_pid' not in self.__dict__:
+            pids = server_resource(getattr(self, 'server', None), 'backend_pids', lambda: itertools.count(1))
+            self.__dict__['backend_pid'] = next(pids)
+        return self.__dict__['backend_pid']
+
+    @property
+    def pending_notifications(self):
+        return self.__dict__.setdefault('pending_notifications', deque())
+
+    @property
+    def transaction_notifications(self):
+        return self.__dict__.setdefault('transaction_notifications', [])
+
+    def read_and_execute_command(self):
+        if self.__dict__.get('notification_wakeup') is not None:
+            self.wait_for_message()
+        return super().read_and_execute_command()
+
+    def wait_for_message(self):
+        """Waits for the next message of the client, sending notifications delivered in the meantime
+        """
+        sock = getattr(self, 'ssl_connection', None) or self.connection
+        wakeup = self.__dict__['notification_wakeup'][0]
+        while True:
+            timeout = sock.gettimeout()
+            sock.settimeout(0)
+            try:
+                if self.stream.has_pending_input():
+                    return
+            finally:
+                sock.settimeout(timeout)
+            readable = select.select([sock, wakeup], [], [])[0]
+            if wakeup in readable:
+                try:
+                    wakeup.recv(4096)
+                except BlockingIOError:
+                    pass
+                self.send_pending_notifications()
+            if sock in readable:
+                return
+
+    def execute_command(self, code):
+        super().execute_command(code)
+        self.send_pending_notifications()
+
+    def notify(self, channel, payload=''):
+        if getattr(self, 'transaction_status', TRANSACTION_IDLE) != TRANSACTION_IDLE:
+            self.transaction_notifications.append((channel, payload))
+            return
+        self.notification_channels.notify(channel, payload, self.backend_pid)
+
+    def handle_transaction_end(self, committed):
+        notifications = self.__dict__.pop('transaction_notifications', [])
+        self.__dict__['committed_notifications'] = notifications if committed else []
+        super().handle_transaction_end(committed)
+
+    def handle_transaction_committed(self):
+        super().handle_transaction_committed()
+        for channel, payload in self.__dict__.pop('committed_notifications', []):
+            self.notification_channels.notify(channel, payload, self.backend_pid)
+
+    def deliver_notification(self, notification):
+        """Called by NotificationChannels from the thread publishing the notification
+        """
+        self.pending_notifications.append(notification)
+        wakeup = self.__dict__.get('notification_wakeup')
+        if wakeup is not None:
+            try:
+                wakeup[1].send(b'\x00')
+            except OSError:
+                pass # full (the session will be woken up anyway) or closed
+
+    def send_pending_notifications(self):
+        while self.pending_notifications:
+            self.stream.send_notification(*self.pending_notifications.popleft())
+
+    def handle_session_end(self):
+        self.notification_channels.unlisten_all(self)
+        for sock in self.__dict__.pop('notification_wakeup', None) or ():
+            sock.close()
+        super().handle_session_end()
+
+    @stmt_handler('LISTEN')
+    def handle_listen(self, stmt_info):
+        if self.__dict__.get('notification_wakeup') is None:
+            # wakes the session up when it waits for a message and notifications are delivered
+            self.__dict__['notification_wakeup'] = socket.socketpair()
+            for sock in self.__dict__['notification_wakeup']:
+                sock.setblocking(False)
+        self.notification_channels.listen(parse_channel_name(stmt_info['LISTEN']), self)
+        return None, None
+
+    @stmt_handler('UNLISTEN')
+    def handle_unlisten(self, stmt_info):
+        if stmt_info['UNLISTEN'].strip() == '*':
+            self.notification_channels.unlisten_all(self)
+        else:
+            self.notification_channels.unlisten(parse_channel_name(stmt_info['UNLISTEN']), self)
+        return None, None
+
+    @stmt_handler('NOTIFY')
+    def handle_notify(self, stmt_info):
+        self.notify(*parse_notify_args(stmt_info['NOTIFY'], stmt_info.get('params')))
+        return None, None
@@ -0,0 +1,228 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import csv
+import heapq
+import io
+import itertools
+import multiprocessing
+import os
+from ..flow import PostgresError
+from ..sql import resolve_param
+from .helpers import stmt_handler, server_resource, resolve_col_name, format_select_results
+from .predicates import parse_where_predicates, filter_rows
+from .aggregates import (is_aggregate_query, resolve_aggregates, partial_aggregate, merge_partial_aggregates,
+                         finalize_aggregates, rename_group_cols)
+from .sorting import parse_order_by, parse_limit, make_sort_key, top_k
+from .spill import SpillFile
+
+
+ScanRange = namedtuple('ScanRange', ['path', 'start', 'end'])
+
+# reader: picklable function (path, start, end) returning an iterable of row dicts
+ScanSource = namedtuple('ScanSource', ['reader', 'ranges', 'columns'])
+
+# operations executed by workers on each range, columns and limit are None when not applicable
+ScanPlan = namedtuple('ScanPlan', ['predicates', 'columns', 'group_cols', 'aggregates', 'order_by', 'limit'])
+
+
+def split_file(path, chunk_size, start=0):
+    """Splits a file into ranges of about chunk_size bytes ending at line boundaries. Records must not contain
+       line breaks (eg: in quoted CSV values).
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        while start < size:
+            end = start + chunk_size
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            end = min(end, size)
+            ranges.append(ScanRange(path, start, end))
+            start = end
+    return ranges
+
+
+def read_csv_header(path, **fmtparams):
+    """Returns a tuple (fieldnames, position of the first record)
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+    return next(csv.reader([header.decode()], **fmtparams)), len(header)
+
+
+def read_csv_range(path, start, end, fieldnames=None, **fmtparams):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).decode()
+    return csv.DictReader(io.StringIO(data, newline=''), fieldnames, **fmtparams)
+
+
+def scan_range(reader, scan, plan):
+    """Executed by workers: filters, projects and pre-aggregates (or sorts) the rows of a ScanRange
+    """
+    rows = filter_rows(reader(*scan), plan.predicates)
+    if plan.aggregates is not None:
+        return partial_aggregate(rows, plan.group_cols, plan.aggregates)
+    if plan.columns is not None:
+        rows = ({col: row.get(col) for col in plan.columns} for row in rows)
+    if plan.order_by:
+        key, reverse = make_sort_key(plan.order_by)
+        if plan.limit is not None:
+            return top_k(rows, plan.limit, key, reverse)
+        return sorted(rows, key=key, reverse=reverse)
+    return list(itertools.islice(rows, plan.limit))
+
+
+def create_scan_executor(workers):
+    # workers are spawned rather than forked as the server runs threads
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def iter_range_results(executor, source, plan, max_pending):
+    """Yields the results of each range as they complete, with at most max_pending ranges submitted at once
+       to bound the memory used by results waiting to be consumed
+    """
+    ranges = iter(source.ranges)
+    pending = set()
+    try:
+        while True:
+            for scan in itertools.islice(ranges, max_pending - len(pending)):
+                pending.add(executor.submit(scan_range, source.reader, scan, plan))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def merge_sorted_results(results, order_by, max_memory_rows=None, spill_dir=None):
+    """Merges results sorted by workers. Results are spilled to disk when they exceed max_memory_rows.
+    """
+    key, reverse = make_sort_key(order_by)
+    runs = []
+    nb_rows = 0
+    try:
+        for rows in results:
+            nb_rows += len(rows)
+            if max_memory_rows and nb_rows > max_memory_rows:
+                spill = SpillFile(spill_dir)
+                for row in rows:
+                    spill.write(row)
+                rows = spill
+            runs.append(rows)
+        yield from heapq.merge(*runs, key=key, reverse=reverse)
+    finally:
+        for run in runs:
+            if isinstance(run, SpillFile):
+                run.close()
+
+
+def get_scan_columns(stmt_info, order_by, cols):
+    """Columns needed by the select list and ORDER BY, None meaning all columns
+    """
+    names = [c.name for c in stmt_info.columns]
+    if '*' in names:
+        return None
+    return list(dict.fromkeys(resolve_col_name(name.lower(), cols) for name in names + [o.name for o in order_by]))
+
+
+class ParallelScanMixin(object):
+    """Executes SELECT statements on file-backed tables by scanning ranges of the files in a pool of worker
+       processes. Workers filter (WHERE made of AND-ed comparisons), project and pre-aggregate or sort the rows
+       of each range. Partial aggregates are merged, sorted results are merged in order and other rows are
+       streamed as ranges complete. Override get_scan_source() to return a ScanSource for scannable tables.
+    """
+    scan_workers = None # defaults to the number of cores
+    scan_chunk_size = 16 * 1024 * 1024 # bytes per range
+
+    @property
+    def scan_worker_count(self):
+        return getattr(getattr(self, 'server', None), 'scan_workers', None) or self.scan_workers or os.cpu_count()
+
+    @property
+    def scan_executor(self):
+        return server_resource(getattr(self, 'server', self), 'scan_executor',
+                               lambda: create_scan_executor(self.scan_worker_count))
+
+    def get_scan_source(self, table):
+        """Must return a ScanSource for tables (FromTableExpr) which can be scanned in parallel, None otherwise
+        """
+        return None
+
+    def get_select_scan_source(self, stmt_info):
+        if len(stmt_info.tables) != 1 or stmt_info.tables[0].joins or stmt_info.tables[0].subquery:
+            return None
+        return self.get_scan_source(stmt_info.tables[0])
+
+    def run_scan(self, source, plan):
+        return iter_range_results(self.scan_executor, source, plan, self.scan_worker_count * 2)
+
+    @stmt_handler('SELECT')
+    def handle_select(self, stmt_info):
+        source = self.get_select_scan_source(stmt_info)
+        if source is None:
+            return super().handle_select(stmt_info)
+        if '*' in [c.name for c in stmt_info.columns] and (len(stmt_info.columns) > 1 or stmt_info.columns[0].alias):
+            raise PostgresError('select * cannot be aliased or used with other columns')
+        cols = list(source.columns)
+        predicates = parse_where_predicates(stmt_info.where, stmt_info.tables[0], stmt_info.params)
+        if predicates is None:
+            raise PostgresError('only comparisons combined with AND are supported in WHERE', code='0A000')
+        predicates = [p._replace(col=resolve_col_name(p.col, cols)) for p in predicates]
+        limit = parse_limit(resolve_param(stmt_info.limit, stmt_info.params), 'LIMIT')
+        offset = parse_limit(resolve_param(stmt_info.offset, stmt_info.params), 'OFFSET') or 0
+
+        if is_aggregate_query(stmt_info):
+            group_cols, aggregates, out_cols = resolve_aggregates(stmt_info, cols)
+            with self.stage('parallel_scan') as stage:
+                groups = {}
+                for partial in self.run_scan(source, ScanPlan(predicates, None, group_cols, aggregates, None, None)):
+                    merge_partial_aggregates(groups, partial)
+                data = stage.output(rename_group_cols(finalize_aggregates(groups, group_cols, aggregates), cols, out_cols))
+            cols = out_cols
+            if stmt_info.order_by or limit is not None or offset:
+                with self.stage('sort_results') as stage:
+                    data, cols = self.sort_results(stage.input(data), cols, stmt_info)
+                    data = stage.output(data)
+        else:
+            order_by = [o._replace(name=resolve_col_name(o.name, cols)) for o in parse_order_by(stmt_info.order_by, stmt_info)]
+            plan = ScanPlan(predicates, get_scan_columns(stmt_info, order_by, cols), None, None, order_by,
+                            None if limit is None else offset + limit)
+            with self.stage('parallel_scan') as stage:
+                results = self.run_scan(source, plan)
+                if order_by:
+                    data = merge_sorted_results(results, order_by, self.sort_max_memory_rows, self.spill_dir)
+                else:
+                    data = itertools.chain.from_iterable(results)
+                if offset or limit is not None:
+                    data = itertools.islice(data, offset, None if limit is None else offset + limit)
+                data = stage.output(data)
+        with self.stage('format_select_results') as stage:
+            data, cols = format_select_results(stage.input(data), cols, stmt_info)
+            return stage.output(data), cols
+
+    def explain_stages(self, stmt_type, stmt_info):
+        if stmt_type != 'SELECT' or self.is_postgres_builtins_query(stmt_type, stmt_info) or \
+                self.is_information_schema_query(stmt_type, stmt_info) or self.get_select_scan_source(stmt_info) is None:
+            return super().explain_stages(stmt_type, stmt_info)
+        stages = ['parallel_scan']
+        if is_aggregate_query(stmt_info) and (stmt_info.order_by or stmt_info.limit or stmt_info.offset):
+            stages.append('sort_results')
+        return stages + ['format_select_results']
+
+    def explain_pushdown(self, stmt_info):
+        source = self.get_select_scan_source(stmt_info)
+        if source is None:
+            return super().explain_pushdown(stmt_info)
+        executed = ['WHERE'] if stmt_info.where else []
+        if is_aggregate_query(stmt_info):
+            executed.append('partial aggregates')
+        elif stmt_info.order_by:
+            executed.append('ORDER BY' + (' with LIMIT' if stmt_info.limit else ''))
+        return [f"{len(source.ranges)} ranges scanned by {self.scan_worker_count} workers"
+                + (f" ({', '.join(executed)} in workers)" if executed else '')]
@@ -0,0 +1,269 @@
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+from ..flow import PostgresError
+from .helpers import server_resource, stmt_handler
+
+
+class ResourcePool(object):
+    """Backend resources (eg: database connections) shared by all sessions of a server. Resources are created
+       on demand up to max_size. Sessions waiting for a resource are served in arrival order and give up after
+       timeout seconds.
+    """
+    def __init__(self, max_size=10, timeout=30):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.size = 0
+        self.idle = deque()
+        self.waiting = deque() # one condition per waiting session, only the first one is woken up
+        self.lock = threading.Lock()
+        self.acquired = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time = 0
+
+    def is_available(self):
+        return bool(self.idle) or self.size < self.max_size
+
+    def wake_next(self):
+        if self.waiting and self.is_available():
+            self.waiting[0].notify()
+
+    def acquire(self, create, timeout=None):
+        """Returns an idle resource or a new one created using create()
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self.lock:
+            if self.waiting or not self.is_available():
+                self.wait(timeout)
+            self.acquired += 1
+            if self.idle:
+                return self.idle.pop() # most recently used first
+            self.size += 1
+        try:
+            return create()
+        except BaseException:
+            self.discard(None)
+            raise
+
+    def wait(self, timeout):
+        cond = threading.Condition(self.lock)
+        self.waiting.append(cond)
+        self.waits += 1
+        start = time.monotonic()
+        try:
+            if not cond.wait_for(lambda: self.waiting[0] is cond and self.is_available(), timeout):
+                self.timeouts += 1
+                raise PostgresError("timeout waiting for a pooled backend resource", code="53300")
+        finally:
+            self.wait_time += time.monotonic() - start
+            self.waiting.remove(cond)
+            self.wake_next()
+
+    def release(self, resource):
+        with self.lock:
+            self.idle.append(resource)
+            self.wake_next()
+
+    def discard(self, resource, close=None):
+        """Removes a resource from the pool, eg: when it is broken
+        """
+        try:
+            if resource is not None and close is not None:
+                close(resource)
+        finally:
+            with self.lock:
+                self.size -= 1
+                self.wake_next()
+
+    def close(self, close):
+        with self.lock:
+            idle = list(self.idle)
+            self.idle.clear()
+        for resource in idle:
+            self.discard(resource, close)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': self.size,
+                'max_size': self.max_size,
+                'idle': len(self.idle),
+                'active': self.size - len(self.idle),
+                'waiting': len(self.waiting),
+                'acquired': self.acquired,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'wait_time': self.wait_time
+            }
+
+
+TRANSACTION_IDLE = 'I'
+TRANSACTION_ACTIVE = 'T'
+TRANSACTION_FAILED = 'E'
+
+ABORTED_TRANSACTION_STMT_TYPES = ('COMMIT', 'ROLLBACK')
+
+
+class TransactionPoolingMixin(object):
+    """Tracks the transaction status of sessions and lends them resources of a server-wide ResourcePool, in the
+       style of transaction pooling: a session holds a resource from its first use (see pooled_resource) until
+       the end of the statement, or until the end of the transaction when one was started using BEGIN.
+       Override create_pooled_resource() to pool resources, and begin_transaction(), commit_transaction() and
+       rollback_transaction() to forward transactions to them. Session state (eg: SET) is not carried over.
+    """
+    pool_size = 10
+    pool_timeout = 30 # seconds a session waits for a resource
+
+    @property
+    def resource_pool(self):
+        server = getattr(self, 'server', self)
+        timeout = getattr(server, 'pool_timeout', None)
+        return server_resource(server, 'resource_pool', lambda: ResourcePool(
+            getattr(server, 'pool_size', None) or self.pool_size,
+            self.pool_timeout if timeout is None else timeout)) # 0 does not wait
+
+    @property
+    def transaction_status(self):
+        return self.__dict__.get('transaction_status', TRANSACTION_IDLE)
+
+    @transaction_status.setter
+    def transaction_status(self, status):
+        self.__dict__['transaction_status'] = status
+
+    @property
+    def pooled_resource(self):
+        """Resource held by the session, acquired from the pool on first access
+        """
+        if self.__dict__.get('pooled_resource') is None:
+            self.__dict__.update(wait_event_type='Client', wait_event='ResourcePool')
+            try:
+                self.__dict__['pooled_resource'] = self.resource_pool.acquire(self.create_pooled_resource)
+            finally:
+                self.__dict__.update(wait_event_type=None, wait_event=None)
+        return self.__dict__['pooled_resource']
+
+    def create_pooled_resource(self):
+        """Must return a new resource for the pool, eg: a database connection
+        """
+        raise PostgresError('resource pooling not supported')
+
+    def reset_pooled_resource(self, resource):
+        """Called before a resource is returned to the pool, must raise an exception if it cannot be reused
+        """
+        pass
+
+    def close_pooled_resource(self, resource):
+        close = getattr(resource, 'close', None)
+        if close:
+            close()
+
+    def release_pooled_resource(self):
+        resource = self.__dict__.pop('pooled_resource', None)
+        if resource is None:
+            return
+        try:
+            self.reset_pooled_resource(resource)
+        except Exception:
+            self.resource_pool.discard(resource, self.close_pooled_resource)
+        else:
+            self.resource_pool.release(resource)
+
+    def get_transaction_status(self):
+        return self.transaction_status.encode()
+
+    def get_session_idle_state(self):
+        if self.transaction_status == TRANSACTION_ACTIVE:
+            return 'idle in transaction'
+        if self.transaction_status == TRANSACTION_FAILED:
+            return 'idle in transaction (aborted)'
+        return super().get_session_idle_state()
+
+    def execute_command(self, code):
+        try:
+            super().execute_command(code)
+        finally:
+            # resources are returned at the end of each query or extended protocol batch, outside transactions
+            if code in ('Q', 'S') and self.transaction_status == TRANSACTION_IDLE:
+                self.release_pooled_resource()
+
+    @contextmanager
+    def track_transaction(self):
+        """Context manager around statements, errors abort the current transaction
+        """
+        try:
+            yield
+        except PostgresError:
+            if self.transaction_status == TRANSACTION_ACTIVE:
+                self.transaction_status = TRANSACTION_FAILED
+            raise
+
+    def check_transaction_status(self, stmt_type):
+        if self.transaction_status == TRANSACTION_FAILED and stmt_type not in ABORTED_TRANSACTION_STMT_TYPES:
+            raise PostgresError("current transaction is aborted, commands ignored until end of transaction block",
+                                code="25P02")
+
+    def begin_transaction(self):
+        pass
+
+    def commit_transaction(self):
+        pass
+
+    def rollback_transaction(self):
+        pass
+
+    @stmt_handler('BEGIN')
+    def handle_begin(self, stmt_info):
+        # postgres only warns when a transaction is already in progress
+        if self.transaction_status == TRANSACTION_IDLE:
+            self.begin_transaction()
+            self.transaction_status = TRANSACTION_ACTIVE
+        return None, None
+
+    def handle_transaction_end(self, committed):
+        """Called at the end of transactions, before they are committed or rolled back
+        """
+        pass
+
+    def handle_transaction_committed(self):
+        """Called once a transaction has been committed
+        """
+        pass
+
+    @stmt_handler('COMMIT')
+    def handle_commit(self, stmt_info):
+        status = self.transaction_status
+        self.transaction_status = TRANSACTION_IDLE
+        if status == TRANSACTION_FAILED:
+            self.handle_transaction_end(False)
+            self.rollback_transaction()
+            return None, None, 'ROLLBACK'
+        if status == TRANSACTION_ACTIVE:
+            self.handle_transaction_end(True)
+            self.commit_transaction()
+            self.handle_transaction_committed()
+        return None, None
+
+    @stmt_handler('ROLLBACK')
+    def handle_rollback(self, stmt_info):
+        status = self.transaction_status
+        self.transaction_status = TRANSACTION_IDLE
+        if status != TRANSACTION_IDLE:
+            self.handle_transaction_end(False)
+            self.rollback_transaction()
+        return None, None
+
+    def handle_session_end(self):
+        try:
+            if self.transaction_status != TRANSACTION_IDLE:
+                self.transaction_status = TRANSACTION_IDLE
+                self.handle_transaction_end(False)
+                if self.__dict__.get('pooled_resource') is not None:
+                    self.rollback_transaction()
+        except Exception:
+            if self.__dict__.get('pooled_resource') is not None:
+                self.resource_pool.discard(self.__dict__.pop('pooled_resource'), self.close_pooled_resource)
+        finally:
+            self.release_pooled_resource()
+            super().handle_session_end()
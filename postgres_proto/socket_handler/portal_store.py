@@ -0,0 +1,137 @@
+import itertools
+import tempfile
+import threading
+from io import BytesIO
+from ..stream import PostgresBuffer, ColumnBatch
+
+
+class MemoryBudget(object):
+    """Thread-safe counter of bytes held in memory, optionally charged to a parent budget (eg: server-wide)
+    """
+    def __init__(self, limit=None, parent=None):
+        self.limit = limit
+        self.parent = parent
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, size):
+        with self.lock:
+            if self.limit is not None and self.used + size > self.limit:
+                return False
+            if self.parent and not self.parent.reserve(size):
+                return False
+            self.used += size
+            return True
+
+    def release(self, size):
+        with self.lock:
+            self.used -= size
+        if self.parent:
+            self.parent.release(size)
+
+
+def iter_row_chunks(rows, size):
+    if isinstance(rows, ColumnBatch):
+        yield from rows.chunks(size)
+        return
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class PortalResult(object):
+    """Results of an executed portal, with rows stored as encoded DataRow messages
+       either in memory or in a temporary file when spilled
+    """
+    def __init__(self, command, cols, data, nb_rows, reserved=0):
+        self.command = command
+        self.cols = cols
+        self.data = data
+        self.nb_rows = nb_rows
+        self.reserved = reserved
+
+    @property
+    def spilled(self):
+        return not isinstance(self.data, BytesIO)
+
+    def open_rows(self):
+        self.data.seek(0)
+        return self.data
+
+    def close(self):
+        self.data.close()
+
+
+class PortalResultStore(object):
+    """Dict-like storage of portal results bound to a memory budget.
+       Results that do not fit in the budget are spilled to disk.
+    """
+    reserve_chunk_size = 64 * 1024
+    encode_chunk_size = 256 # rows encoded between budget checks
+
+    def __init__(self, budget=None, spill_dir=None):
+        self.budget = budget or MemoryBudget()
+        self.spill_dir = spill_dir
+        self.results = {}
+
+    def __contains__(self, portal):
+        return portal in self.results
+
+    def __getitem__(self, portal):
+        return self.results[portal]
+
+    def __setitem__(self, portal, results):
+        self.pop(portal, None)
+        self.results[portal] = self.encode_results(*results) if results else None
+
+    def pop(self, portal, *default):
+        if portal not in self.results:
+            if default:
+                return default[0]
+            raise KeyError(portal)
+        result = self.results.pop(portal)
+        if result:
+            self.budget.release(result.reserved)
+            result.close()
+        return result
+
+    def clear(self):
+        for portal in list(self.results):
+            self.pop(portal)
+
+    def encode_results(self, command, rows, cols):
+        buf = PostgresBuffer()
+        reserved = 0
+        nb_rows = 0
+        for chunk in iter_row_chunks(rows or (), self.encode_chunk_size):
+            buf.write_data_rows(chunk)
+            nb_rows += len(chunk)
+            size = buf.stream.tell()
+            if size > reserved and isinstance(buf.stream, BytesIO):
+                chunk = self.reserve(size - reserved)
+                if chunk:
+                    reserved += chunk
+                else:
+                    buf = PostgresBuffer(self.spill(buf.stream))
+                    self.budget.release(reserved)
+                    reserved = 0
+        if reserved > buf.stream.tell():
+            self.budget.release(reserved - buf.stream.tell())
+            reserved = buf.stream.tell()
+        return PortalResult(command, cols, buf.stream, nb_rows, reserved)
+
+    def reserve(self, needed):
+        """Reserves by chunks to limit contention on the budget lock, falling back to the exact needed size
+        """
+        for size in (max(self.reserve_chunk_size, needed), needed):
+            if self.budget.reserve(size):
+                return size
+        return 0
+
+    def spill(self, data):
+        spill_file = tempfile.TemporaryFile(prefix='pgproto-portal-', dir=self.spill_dir)
+        spill_file.write(data.getbuffer())
+        return spill_file
@@ -0,0 +1,177 @@
+from collections import namedtuple
+import operator
+import re
+from ..sql import tokenize, tokenize_where_expr, resolve_param
+from .helpers import compare_key
+
+
+Predicate = namedtuple('Predicate', ['col', 'op', 'value'])
+
+# value of comparisons between columns of joined tables (eg: a.id = b.a_id)
+ColumnRef = namedtuple('ColumnRef', ['name'])
+
+# column name, possibly qualified with a table name (eg: t.id)
+COLUMN_RE = re.compile(r'^("[^"]+"|[a-z_][\w$]*)(?:\.("[^"]+"|[a-z_][\w$]*))?$', re.IGNORECASE)
+
+
+COMPARISON_OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<>': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge
+}
+
+
+def parse_where_predicates(where, table=None, params=None):
+    """Returns the list of comparisons of a WHERE clause made only of AND-ed comparisons, or None if the
+       clause cannot be represented this way. Column names qualified with the table are unqualified and
+       parameters are replaced by their value.
+    """
+    if not where:
+        return []
+    if len(tokenize(where, split_delimiters=(' or ',))) > 1:
+        return None
+    prefixes = {table.name, table.alias} if table else set()
+    predicates = []
+    try:
+        for left_expr, op, right_expr in tokenize_where_expr(where):
+            if not COLUMN_RE.match(left_expr):
+                return None # eg: functions
+            col = left_expr.lower()
+            if '.' in col and col.split('.', 1)[0] in prefixes:
+                col = col.split('.', 1)[1]
+            predicates.append(Predicate(col, op, resolve_param(right_expr, params)))
+    except SyntaxError:
+        return None
+    return predicates
+
+
+def is_null_value(value):
+    return value is None or isinstance(value, str) and value.upper() == 'NULL'
+
+
+def match_predicate(value, predicate):
+    # NULL never matches a comparison
+    if value is None or is_null_value(predicate.value):
+        return False
+    return COMPARISON_OPERATORS[predicate.op](compare_key(value), compare_key(predicate.value))
+
+
+def match_predicates(row, predicates):
+    return all(match_predicate(row.get(p.col), p) for p in predicates)
+
+
+def filter_rows(rows, predicates):
+    if not predicates:
+        return rows
+    return (row for row in rows if match_predicates(row, predicates))
+
+
+def tokenize_comparisons(where):
+    """Returns the list of (left, op, right) comparisons of a WHERE clause made only of AND-ed comparisons of a
+       column, quotes being kept, or None if the clause cannot be represented this way
+    """
+    if len(tokenize(where, split_delimiters=(' or ',))) > 1:
+        return None
+    comparisons = []
+    try:
+        for expr, _ in tokenize(where, split_delimiters=(' and ',)):
+            tokens = [t[0] for t in tokenize(expr, split_delimiters=tuple(COMPARISON_OPERATORS),
+                                             split_delimiters_as_tokens=True)]
+            if len(tokens) != 3 or not COLUMN_RE.match(tokens[0]):
+                return None
+            comparisons.append(tokens)
+    except SyntaxError:
+        return None
+    return comparisons
+
+
+def parse_identifier(expr):
+    return expr[1:-1] if expr.startswith('"') else expr.lower()
+
+
+def split_column(expr):
+    """Returns a tuple (table prefix or None, column name) if expr is a column, None otherwise
+    """
+    match = COLUMN_RE.match(expr)
+    if not match:
+        return None
+    if match.group(2) is None:
+        return None, parse_identifier(match.group(1))
+    return parse_identifier(match.group(1)), parse_identifier(match.group(2))
+
+
+def table_prefixes(table):
+    return {table.name, table.alias} - {None}
+
+
+def is_column_of(expr, tables):
+    column = split_column(expr)
+    return column is not None and column[0] is not None and any(column[0] in table_prefixes(t) for t in tables)
+
+
+def column_key(expr):
+    # key of the column in rows of joined tables
+    prefix, col = split_column(expr)
+    return col if prefix is None else f"{prefix}.{col}"
+
+
+def parse_value(expr, params):
+    if expr.startswith("'") and expr.endswith("'"):
+        return expr[1:-1].replace("''", "'")
+    return resolve_param(expr, params)
+
+
+def parse_joined_where_predicates(where, tables, params=None):
+    """Returns the list of comparisons of a WHERE clause evaluated over the rows of joined tables (see joins.py),
+       comparisons with a column of a table (eg: a.id = b.a_id) having a ColumnRef as value. Returns None if the
+       clause is not made only of AND-ed comparisons.
+    """
+    if not where:
+        return []
+    comparisons = tokenize_comparisons(where)
+    if comparisons is None:
+        return None
+    predicates = []
+    try:
+        for left_expr, op, right_expr in comparisons:
+            value = ColumnRef(column_key(right_expr)) if is_column_of(right_expr, tables) else parse_value(right_expr, params)
+            predicates.append(Predicate(column_key(left_expr), op, value))
+    except SyntaxError:
+        return None
+    return predicates
+
+
+def get_table_where(where, table, tables):
+    """Returns the WHERE clause made of the comparisons of where which only apply to table (one of tables, the
+       tables of a query), with unqualified column names. Unqualified columns are only attributed to a table when
+       the query has a single table. Returns None when no comparison applies.
+    """
+    comparisons = tokenize_comparisons(where) if where else None
+    if not comparisons:
+        return None
+    prefixes = table_prefixes(table)
+    conditions = []
+    for left_expr, op, right_expr in comparisons:
+        if is_column_of(right_expr, tables):
+            continue
+        prefix = split_column(left_expr)[0]
+        if prefix is not None and prefix not in prefixes or prefix is None and len(tables) > 1:
+            continue
+        conditions.append(f"{COLUMN_RE.match(left_expr).groups()[-1] if prefix else left_expr} {op} {right_expr}")
+    return ' AND '.join(conditions) or None
+
+
+def resolve_column_refs(row, predicates):
+    return [p._replace(value=row.get(p.value.name)) if isinstance(p.value, ColumnRef) else p for p in predicates]
+
+
+def filter_joined_rows(rows, predicates):
+    """Filters rows of joined tables using predicates returned by parse_joined_where_predicates()
+    """
+    if not any(isinstance(p.value, ColumnRef) for p in predicates):
+        return filter_rows(rows, predicates)
+    return (row for row in rows if match_predicates(row, resolve_column_refs(row, predicates)))
@@ -1,7 +1,24 @@
-from ..flow import PostgresError
+from ..flow import PostgresError, pgcommand
+from ..types import decode_params
+from .helpers import server_resource
+from .portal_store import PortalResultStore, MemoryBudget
+
+
+class PendingExecution(object):
+    """A Bind message, and possibly its Execute message, waiting to be executed as part of a batch
+    """
+    def __init__(self, portal, stmt, params):
+        self.portal = portal
+        self.stmt = stmt
+        self.params = params
+        self.executed = False
 
 
 class PostgresPreparedStatementsRequestHandlerMixin(object):
+    portal_results_memory_limit = 16 * 1024 * 1024 # per session, in bytes
+    portal_results_spill_dir = None
+    batch_executions = True # consecutive Bind/Execute of the same statement are executed using execute_batch()
+
     @property
     def prepared_statements(self):
         return self.__dict__.setdefault('_prepared_statements', {})
@@ -10,38 +27,136 @@ class PostgresPreparedStatementsRequestHandlerMixin(object):
     def portals(self):
         return self.__dict__.setdefault('_portals', {})
 
+    @property
+    def pending_executions(self):
+        return self.__dict__.setdefault('_pending_executions', [])
+
     @property
     def portal_results(self):
-        return self.__dict__.setdefault('_portal_results', {})
+        if '_portal_results' not in self.__dict__:
+            budget = MemoryBudget(self.portal_results_memory_limit, self.get_server_portal_results_budget())
+            self._portal_results = PortalResultStore(budget, self.portal_results_spill_dir)
+        return self._portal_results
+
+    def get_server_portal_results_budget(self):
+        server = getattr(self, 'server', None)
+        if server is None:
+            return None
+        return server_resource(server, 'portal_results_budget',
+            lambda: MemoryBudget(getattr(server, 'portal_results_memory_limit', None)))
 
     def create_prepared_statement(self, name, query, param_types):
         self.prepared_statements[name] = (query, param_types)
 
     def bind_prepared_statement(self, portal, stmt, param_formats, params, result_cols):
+        # a failed Bind must not leave a previous portal of the same name to be executed
+        self.portals.pop(portal, None)
+        self.portal_results.pop(portal, None)
         if stmt not in self.prepared_statements:
             raise PostgresError("unknown statement")
+        try:
+            params = decode_params(params, param_formats, self.prepared_statements[stmt][1])
+        except ValueError as e:
+            raise PostgresError(str(e), code="22P02")
         self.portals[portal] = (stmt, param_formats, params, result_cols)
-        self.portal_results.pop(portal, None)
+
+    def execute_command(self, code):
+        # any message other than Bind or Execute ends the current batch
+        if code not in ('B', 'E') and self.pending_executions:
+            with self.error_context():
+                self.execute_pending_batch()
+        super().execute_command(code)
+
+    @pgcommand('B')
+    def perform_bind_prepared_statement_flow(self):
+        portal, stmt, param_formats, params, result_cols = self.stream.read_bind()
+        if not self.batch_executions:
+            self.bind_prepared_statement(portal, stmt, param_formats, params, result_cols)
+            self.stream.send_bind_complete()
+            return
+        if self.pending_executions and self.pending_executions[-1].stmt != stmt:
+            self.execute_pending_batch()
+        try:
+            self.bind_prepared_statement(portal, stmt, param_formats, params, result_cols)
+        except PostgresError:
+            self.execute_pending_batch()
+            raise
+        # BindComplete is deferred to keep responses in order
+        self.pending_executions.append(PendingExecution(portal, stmt, self.portals[portal][2]))
+
+    @pgcommand('E')
+    def perform_execute_prepared_statement_flow(self):
+        portal, max_rows = self.stream.read_execute()
+        last = self.pending_executions[-1] if self.pending_executions else None
+        if last and last.portal == portal and not last.executed:
+            last.executed = True
+            return
+        self.execute_pending_batch()
+        self.execute_prepared_statement(portal, max_rows)
+
+    def execute_pending_batch(self):
+        pending = self.pending_executions
+        self.__dict__['_pending_executions'] = []
+        while pending:
+            size = 1
+            while size < len(pending) and pending[0].executed and pending[size].executed and pending[size].stmt == pending[0].stmt:
+                size += 1
+            batch, pending = pending[:size], pending[size:]
+            if not batch[0].executed:
+                self.stream.send_bind_complete()
+            else:
+                query = self.prepared_statements[batch[0].stmt][0]
+                results = iter(self.execute_batch(query, [execution.params for execution in batch]))
+                for execution in batch:
+                    try:
+                        result = next(results)
+                    except StopIteration:
+                        break
+                    except PostgresError:
+                        # results of previous executions are sent, the Bind of the failed one succeeded.
+                        # Remaining executions are discarded, as postgres does after an error
+                        self.stream.send_bind_complete()
+                        raise
+                    self.stream.send_bind_complete()
+                    # stored as by execute_portal(): executing or describing the portal again does not re-execute it
+                    self.send_executed_portal(self.store_portal_results(execution.portal, result))
+
+    def execute_batch(self, query, param_sets):
+        """Executes a prepared statement once per set of parameters, returns an iterable of the results of each
+           execution (as returned by execute_query()). Results are sent as they are iterated so the results of
+           executions preceding an error are sent. Override to execute batches more efficiently.
+        """
+        for params in param_sets:
+            yield self.execute_query(query, params)
 
     def execute_prepared_statement(self, portal, max_rows):
         if portal not in self.portals:
             raise PostgresError("unknown portal")
-        results = self.execute_portal(portal)
+        self.send_executed_portal(self.execute_portal(portal))
+
+    def send_executed_portal(self, results):
         if not results:
             self.stream.send_empty_query_response()
             return
-        self.send_query_results(*results, send_row_description=False)
+        self.send_portal_results(results)
+
+    def send_portal_results(self, results):
+        if results.nb_rows:
+            self.stream.send_encoded_row_data(results.open_rows())
+        self.stream.send_command_complete(results.command)
 
     def execute_portal(self, portal):
         if portal in self.portal_results:
             return self.portal_results[portal]
         query = self.prepared_statements[self.portals[portal][0]][0]
-        for i, value in enumerate(self.portals[portal][2]):
-            query = query.replace('$%s' % (i+1), value.decode())
-        try:
-            self.portal_results[portal] = self.execute_query(query) if query else None
-        except PostgresError as e:
-            self.portal_results[portal] = None
+        # parameters are provided to handlers as typed values, see parse_sql(). Errors are sent to the client
+        # (on Describe when the portal is described before being executed)
+        return self.store_portal_results(portal, self.execute_query(query, self.portals[portal][2]) if query else None)
+
+    def store_portal_results(self, portal, results):
+        """Encodes and stores the results of an executed portal, returns the stored results (a PortalResult)
+        """
+        self.portal_results[portal] = results
         return self.portal_results[portal]
 
     def describe_prepared_statement(self, name):
@@ -55,10 +170,15 @@ class PostgresPreparedStatementsRequestHandlerMixin(object):
             raise PostgresError("unknown portal")
         results = self.execute_portal(name)
         if results:
-            self.stream.send_row_description(results[2])
+            self.stream.send_row_description(results.cols)
         else:
             self.stream.send_no_data()
 
+    def handle_session_end(self):
+        self.pending_executions.clear()
+        self.portal_results.clear()
+        super().handle_session_end()
+
     def flush_prepared_statements(self):
         pass
 
@@ -0,0 +1,107 @@
+from collections import Counter
+from datetime import datetime
+import os
+import sys
+import threading
+import time
+from .helpers import server_resource
+from .stats import get_session_registry
+
+
+def format_frame(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def collapse_stack(frame, tags=()):
+    """Returns the stack ending at frame in the collapsed format: frames from the outermost separated by semicolons
+    """
+    frames = []
+    while frame is not None:
+        frames.append(format_frame(frame))
+        frame = frame.f_back
+    return ';'.join([tag.replace(';', ',') for tag in tags] + frames[::-1])
+
+
+class SamplingProfiler(object):
+    """Samples the stacks of the threads of sessions executing a statement every interval seconds. Stacks are
+       prefixed with tags identifying the statement and the session (see get_profiler_tags()) and written as
+       collapsed stacks (one "frame;frame;... count" line per stack), the input format of flamegraph.pl and speedscope.
+    """
+    def __init__(self, sessions, interval=0.01, output_dir=None):
+        self.sessions = sessions # callable returning the running sessions
+        self.interval = interval
+        self.output_dir = output_dir or '.'
+        self.stacks = Counter()
+        self.samples = 0
+        self.sampling_time = 0 # seconds spent sampling, ie: the overhead of the profiler
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.stacks.clear()
+            self.samples = 0
+            self.sampling_time = 0
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='sampling-profiler', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stops sampling and returns the path of the collapsed stacks file, None if the profiler was not running
+        """
+        with self.lock:
+            if self.thread is None:
+                return None
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+            return self.write()
+
+    def toggle(self):
+        if self.running:
+            return self.stop()
+        self.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            start = time.perf_counter()
+            self.sample()
+            self.sampling_time += time.perf_counter() - start
+
+    def sample(self):
+        threads = {}
+        for session in self.sessions():
+            tags = session.get_profiler_tags()
+            if tags is not None:
+                threads[session.thread_ident] = tags
+        if not threads:
+            return
+        frames = sys._current_frames()
+        for ident, tags in threads.items():
+            frame = frames.get(ident)
+            if frame is not None:
+                self.stacks[collapse_stack(frame, tags)] += 1
+        self.samples += 1
+
+    def write(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.folded")
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def get_profiler(server):
+    return server_resource(server, 'profiler', lambda: SamplingProfiler(
+        lambda: get_session_registry(server).list(),
+        getattr(server, 'profile_interval', None) or 0.01,
+        getattr(server, 'profile_dir', None)))
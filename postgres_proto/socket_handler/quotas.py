@@ -0,0 +1,199 @@
+from contextlib import contextmanager, ExitStack
+import threading
+import time
+from ..flow import PostgresError
+from .helpers import server_resource
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = max(burst or rate, 1) # at least one query, whatever the rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, max_wait=0):
+        """Consumes a token, waiting at most max_wait seconds for one to be available. Returns False on failure.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0
+            if wait > max_wait:
+                return False
+            self.tokens -= 1 # may become negative: the token is reserved for when we are done waiting
+        if wait:
+            time.sleep(wait)
+        return True
+
+
+class ConcurrencyLimit(object):
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, timeout=0):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.count < self.limit, timeout):
+                return False
+            self.count += 1
+            return True
+
+    def release(self):
+        with self.cond:
+            self.count -= 1
+            self.cond.notify()
+
+    @contextmanager
+    def hold(self, timeout, error):
+        if not self.acquire(timeout):
+            raise error
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class QuotaManager(object):
+    """Quotas shared by all sessions of a server. Limits set to None are disabled.
+       Statements over a limit wait up to queue_timeout seconds before being rejected.
+    """
+    def __init__(self, max_connections_per_user=None, queries_per_second=None, queries_burst=None,
+                 max_statements_per_user=None, max_statements_per_database=None, max_inflight_statements=None,
+                 queue_timeout=0):
+        self.max_connections_per_user = max_connections_per_user
+        self.queries_per_second = queries_per_second
+        self.queries_burst = queries_burst
+        self.max_statements_per_user = max_statements_per_user
+        self.max_statements_per_database = max_statements_per_database
+        self.inflight_limit = ConcurrencyLimit(max_inflight_statements) if max_inflight_statements else None
+        self.queue_timeout = queue_timeout or 0
+        self.connections = {}
+        self.buckets = {}
+        self.user_limits = {}
+        self.database_limits = {}
+        self.lock = threading.Lock()
+
+    def connect(self, user):
+        with self.lock:
+            if self.max_connections_per_user is not None and self.connections.get(user, 0) >= self.max_connections_per_user:
+                raise PostgresError(f"too many connections for role \"{user}\"", "FATAL", "53300")
+            self.connections[user] = self.connections.get(user, 0) + 1
+
+    def disconnect(self, user):
+        with self.lock:
+            self.connections[user] -= 1
+            if not self.connections[user]:
+                del self.connections[user]
+
+    def get_bucket(self, user):
+        with self.lock:
+            if user not in self.buckets:
+                self.buckets[user] = TokenBucket(self.queries_per_second, self.queries_burst)
+            return self.buckets[user]
+
+    def get_limit(self, limits, key, limit):
+        with self.lock:
+            if key not in limits:
+                limits[key] = ConcurrencyLimit(limit)
+            return limits[key]
+
+    @contextmanager
+    def statement(self, user, database):
+        start = time.monotonic()
+        remaining = lambda: max(0, self.queue_timeout - (time.monotonic() - start))
+        if self.queries_per_second and not self.get_bucket(user).consume(self.queue_timeout):
+            raise PostgresError(f"query rate limit exceeded for role \"{user}\"", code="53400")
+        with ExitStack() as stack:
+            if self.max_statements_per_user:
+                stack.enter_context(self.get_limit(self.user_limits, user, self.max_statements_per_user).hold(remaining(),
+                    PostgresError(f"too many concurrent statements for role \"{user}\"", code="53400")))
+            if self.max_statements_per_database:
+                stack.enter_context(self.get_limit(self.database_limits, database, self.max_statements_per_database).hold(remaining(),
+                    PostgresError(f"too many concurrent statements for database \"{database}\"", code="53400")))
+            if self.inflight_limit:
+                stack.enter_context(self.inflight_limit.hold(remaining(),
+                    PostgresError("server is overloaded, too many statements in progress", code="53300")))
+            yield
+
+
+class QuotasMixin(object):
+    """Enforces the QuotaManager of the server on connections and statements of PostgresRequestHandler.
+       Configure quotas with server properties named after QuotaManager arguments (all disabled by default).
+       The concurrency slots of a statement are held until its results are sent.
+    """
+    @property
+    def quotas(self):
+        server = getattr(self, 'server', self)
+        return server_resource(server, 'quota_manager', lambda: QuotaManager(
+            getattr(server, 'max_connections_per_user', None),
+            getattr(server, 'queries_per_second', None),
+            getattr(server, 'queries_burst', None),
+            getattr(server, 'max_statements_per_user', None),
+            getattr(server, 'max_statements_per_database', None),
+            getattr(server, 'max_inflight_statements', None),
+            getattr(server, 'quota_queue_timeout', None)))
+
+    def perform_authentication_flow(self, startup_params):
+        user = super().perform_authentication_flow(startup_params)
+        self.quotas.connect(user)
+        self.quota_user = user
+        return user
+
+    @contextmanager
+    def quota_statement(self):
+        """Acquires the quotas of a statement, used by execute_query()
+        """
+        if self.__dict__.get('in_quota_statement'):
+            # nested statements (eg: executed by EXPLAIN ANALYZE) count as part of the outer one
+            yield
+            return
+        # results of the previous statement were not sent (eg: portals described but not executed)
+        self.release_quota_statement()
+        stack = ExitStack()
+        stack.enter_context(self.quotas.statement(self.user, self.startup_params.get('database')))
+        self.__dict__['in_quota_statement'] = True
+        try:
+            yield
+        except BaseException:
+            stack.close()
+            raise
+        else:
+            # results are often generators consumed while being sent
+            self.__dict__['quota_statement'] = stack
+        finally:
+            self.__dict__['in_quota_statement'] = False
+
+    def release_quota_statement(self):
+        stack = self.__dict__.pop('quota_statement', None)
+        if stack is not None:
+            stack.close()
+
+    def send_query_results(self, command, rows, cols, send_row_description=True):
+        try:
+            super().send_query_results(command, rows, cols, send_row_description)
+        finally:
+            self.release_quota_statement()
+
+    def store_portal_results(self, portal, results):
+        try:
+            # portal results are encoded and stored when executed
+            return super().store_portal_results(portal, results)
+        finally:
+            self.release_quota_statement()
+
+    def execute_command(self, code):
+        try:
+            super().execute_command(code)
+        finally:
+            if code in ('Q', 'S'):
+                self.release_quota_statement()
+
+    def handle_session_end(self):
+        self.release_quota_statement()
+        if getattr(self, 'quota_user', None) is not None:
+            self.quotas.disconnect(self.quota_user)
+        super().handle_session_end()
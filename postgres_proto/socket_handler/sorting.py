@@ -0,0 +1,138 @@
+from collections import namedtuple
+import heapq
+import itertools
+from ..flow import PostgresError
+from ..sql import tokenize, tokenize_comma_separated_list, resolve_param
+from .helpers import compare_key, resolve_col_name
+from .spill import SpillFile
+
+
+OrderByExpr = namedtuple('OrderByExpr', ['name', 'desc', 'nulls_first'])
+
+
+NULL_KEY = (2, 0, '') # sorts after all values, as NULL in postgres
+
+
+def parse_order_by(order_by, stmt_info):
+    exprs = []
+    for expr, _ in tokenize_comma_separated_list(order_by or ''):
+        tokens = [t[0] for t in tokenize(expr, remove_quotes=True)]
+        name = tokens[0].lower()
+        modifiers = ' '.join(tokens[1:]).upper()
+        desc = modifiers.startswith('DESC')
+        nulls_first = 'NULLS FIRST' in modifiers or desc and 'NULLS LAST' not in modifiers
+        if name.isdigit(): # position in the select list
+            if not 0 < int(name) <= len(stmt_info.columns):
+                raise PostgresError(f"ORDER BY position {name} is not in select list", code="42P10")
+            name = stmt_info.columns[int(name) - 1].name
+        else:
+            name = {c.alias.lower(): c.name for c in stmt_info.columns if c.alias}.get(name, name)
+        exprs.append(OrderByExpr(name, desc, nulls_first))
+    return exprs
+
+
+def parse_limit(value, clause):
+    if value is None or isinstance(value, str) and value.upper() == 'ALL':
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise PostgresError(f"invalid value for {clause}: {value}", code="42601")
+    if value < 0:
+        raise PostgresError(f"{clause} must not be negative", code="2201W" if clause == 'LIMIT' else "2201X")
+    return value
+
+
+class SortKey(object):
+    """Key for sorts on multiple columns with mixed directions
+    """
+    __slots__ = ('values', 'directions')
+
+    def __init__(self, values, directions):
+        self.values = values
+        self.directions = directions
+
+    def __lt__(self, other):
+        for a, b, desc in zip(self.values, other.values, self.directions):
+            if a != b:
+                return a > b if desc else a < b
+        return False
+
+
+def make_sort_key(order_by):
+    """Returns a (key function, reverse) tuple
+    """
+    cols = [o.name for o in order_by]
+    # NULLS FIRST in ascending order (or NULLS LAST in descending order) means NULL sorts before all values
+    null_keys = [(-1, 0, '') if o.nulls_first != o.desc else NULL_KEY for o in order_by]
+
+    if len(cols) == 1:
+        col, null_key = cols[0], null_keys[0]
+
+        def values_key(row):
+            value = row.get(col)
+            return null_key if value is None else compare_key(value)
+    else:
+        def values_key(row):
+            return tuple(null_key if row.get(c) is None else compare_key(row.get(c)) for c, null_key in zip(cols, null_keys))
+
+    directions = [o.desc for o in order_by]
+    if len(set(directions)) == 1:
+        return values_key, directions[0]
+    return (lambda row: SortKey(values_key(row), directions)), False
+
+
+def top_k(rows, k, key, reverse=False):
+    """Bounded heap: O(n log k)
+    """
+    if reverse:
+        return heapq.nlargest(k, rows, key)
+    return heapq.nsmallest(k, rows, key)
+
+
+def external_sort(rows, key, reverse=False, max_memory_rows=None, spill_dir=None):
+    """Sorts in memory up to max_memory_rows, otherwise sorts runs of max_memory_rows that are spilled to disk
+       and merged
+    """
+    rows = iter(rows)
+    run = list(itertools.islice(rows, max_memory_rows)) if max_memory_rows else list(rows)
+    run.sort(key=key, reverse=reverse)
+    if not max_memory_rows or len(run) < max_memory_rows:
+        yield from run
+        return
+    runs = []
+    try:
+        while run:
+            spill = SpillFile(spill_dir)
+            for row in run:
+                spill.write(row)
+            runs.append(spill)
+            run = list(itertools.islice(rows, max_memory_rows))
+            run.sort(key=key, reverse=reverse)
+        yield from heapq.merge(*runs, key=key, reverse=reverse)
+    finally:
+        for spill in runs:
+            spill.close()
+
+
+def sort_rows(rows, order_by, limit=None, offset=0, max_memory_rows=None, spill_dir=None):
+    """Applies ORDER BY, LIMIT and OFFSET to an iterable of row dicts
+    """
+    offset = offset or 0
+    if order_by:
+        key, reverse = make_sort_key(order_by)
+        if limit is not None:
+            rows = top_k(rows, offset + limit, key, reverse)
+        else:
+            rows = external_sort(rows, key, reverse, max_memory_rows, spill_dir)
+    if offset or limit is not None:
+        rows = itertools.islice(rows, offset, None if limit is None else offset + limit)
+    return rows
+
+
+def sort_select_results(data, cols, stmt_info, max_memory_rows=None, spill_dir=None):
+    cols = list(cols)
+    order_by = [o._replace(name=resolve_col_name(o.name, cols)) for o in parse_order_by(stmt_info.order_by, stmt_info)]
+    limit = parse_limit(resolve_param(stmt_info.limit, stmt_info.params), 'LIMIT')
+    offset = parse_limit(resolve_param(stmt_info.offset, stmt_info.params), 'OFFSET')
+    return sort_rows(data, order_by, limit, offset, max_memory_rows, spill_dir), cols
@@ -0,0 +1,27 @@
+import pickle
+import tempfile
+
+
+class SpillFile(object):
+    """Temporary file of pickled records, used by operators when their inputs do not fit in memory
+    """
+    def __init__(self, dir=None):
+        self.file = tempfile.TemporaryFile(prefix='pgproto-spill-', dir=dir)
+        self.count = 0
+
+    def write(self, record):
+        pickle.dump(record, self.file, pickle.HIGHEST_PROTOCOL)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        self.file.seek(0)
+        for i in range(self.count):
+            # records are pickled separately, an unpickler reused across records resolves their memo references
+            # (eg: a string repeated in a record) to objects of previous records
+            yield pickle.load(self.file)
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,337 @@
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import hashlib
+import re
+import threading
+import time
+from ..sql.tokenizer import minify_sql
+from .helpers import server_resource, LRUCache
+from .writes import CommandTag
+
+
+LITERALS_RE = re.compile(r"'(?:[^']|'')*'|(?<![\w$.])\d+(?:\.\d+)?(?![\w.])")
+PARAM_RE = re.compile(r"\$(\d+)")
+
+
+def normalize_query(query):
+    """Replaces literals with parameters ($1, $2, ...) numbered after the parameters already in the query
+    """
+    sql = ' '.join(minify_sql(query).rstrip('\x00').rstrip(';').split())
+    counter = iter(range(max([int(n) for n in PARAM_RE.findall(sql)] or [0]) + 1, 1 << 31))
+    return LITERALS_RE.sub(lambda m: f"${next(counter)}", sql)
+
+
+def fingerprint_query(query):
+    """Returns a tuple (queryid, normalized query) where queryid is a signed 64 bits integer
+    """
+    normalized = normalize_query(query)
+    queryid = int.from_bytes(hashlib.md5(normalized.encode()).digest()[:8], 'big', signed=True)
+    return queryid, normalized
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+class StatementRun(object):
+    """Measures of one execution of a statement, from execute_query() until its results are sent
+    """
+    __slots__ = ('query', 'elapsed', 'rows', 'bytes', 'cache_hits', 'stages')
+
+    def __init__(self, query):
+        self.query = query
+        self.elapsed = 0
+        self.rows = 0
+        self.bytes = 0
+        self.cache_hits = 0
+        self.stages = [] # (name, elapsed), recorded when tracing (see TracingMixin)
+
+    def copy(self):
+        run = StatementRun(self.query)
+        run.elapsed = self.elapsed
+        run.stages = list(self.stages)
+        return run
+
+
+class StatementStats(object):
+    __slots__ = ('user', 'database', 'queryid', 'query', 'calls', 'total_time', 'min_time', 'max_time',
+                 'rows', 'bytes', 'cache_hits')
+
+    def __init__(self, user, database, queryid, query):
+        self.user = user
+        self.database = database
+        self.queryid = queryid
+        self.query = query
+        self.calls = 0
+        self.total_time = 0
+        self.min_time = None
+        self.max_time = 0
+        self.rows = 0
+        self.bytes = 0
+        self.cache_hits = 0
+
+    def add(self, run):
+        self.calls += 1
+        self.total_time += run.elapsed
+        self.min_time = run.elapsed if self.min_time is None else min(self.min_time, run.elapsed)
+        self.max_time = max(self.max_time, run.elapsed)
+        self.rows += run.rows
+        self.bytes += run.bytes
+        self.cache_hits += run.cache_hits
+
+    def as_row(self):
+        return {
+            'userid': self.user,
+            'dbid': self.database,
+            'queryid': self.queryid,
+            'query': self.query,
+            'calls': self.calls,
+            'total_exec_time': self.total_time * 1000,
+            'min_exec_time': (self.min_time or 0) * 1000,
+            'max_exec_time': self.max_time * 1000,
+            'mean_exec_time': self.total_time * 1000 / self.calls if self.calls else 0,
+            'rows': self.rows,
+            'bytes_sent': self.bytes,
+            'cache_hits': self.cache_hits
+        }
+
+
+PG_STAT_STATEMENTS_COLUMNS = ['userid', 'dbid', 'queryid', 'query', 'calls', 'total_exec_time', 'min_exec_time',
+                              'max_exec_time', 'mean_exec_time', 'rows', 'bytes_sent', 'cache_hits']
+
+
+class StatementStatsCollector(object):
+    """Statistics of statements grouped by user, database and query fingerprint. When max_entries is reached,
+       the least called 5% of the entries are evicted.
+    """
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self.entries = {}
+        self.fingerprints = LRUCache(1024)
+        self.lock = threading.Lock()
+
+    def fingerprint(self, query):
+        fingerprint = self.fingerprints.get(query)
+        if fingerprint is None:
+            fingerprint = fingerprint_query(query)
+            self.fingerprints.set(query, fingerprint)
+        return fingerprint
+
+    def record(self, user, database, run):
+        queryid, normalized = self.fingerprint(run.query)
+        key = (user, database, queryid)
+        with self.lock:
+            stats = self.entries.get(key)
+            if stats is None:
+                if len(self.entries) >= self.max_entries:
+                    self.evict()
+                stats = self.entries[key] = StatementStats(user, database, queryid, normalized)
+            stats.add(run)
+
+    def evict(self):
+        for key in sorted(self.entries, key=lambda k: self.entries[k].calls)[:max(1, len(self.entries) // 20)]:
+            del self.entries[key]
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
+
+    def rows(self):
+        with self.lock:
+            return [stats.as_row() for stats in self.entries.values()]
+
+
+PG_STAT_ACTIVITY_COLUMNS = ['datname', 'pid', 'usename', 'application_name', 'client_addr', 'client_port',
+                            'backend_start', 'query_start', 'state_change', 'wait_event_type', 'wait_event', 'state',
+                            'query', 'backend_type']
+
+
+class SessionRegistry(object):
+    """Sessions of a server, indexed by backend pid
+    """
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def register(self, session):
+        with self.lock:
+            self.sessions[session.backend_pid] = session
+
+    def unregister(self, session):
+        with self.lock:
+            self.sessions.pop(session.backend_pid, None)
+
+    def get(self, pid):
+        with self.lock:
+            return self.sessions.get(pid)
+
+    def list(self):
+        with self.lock:
+            return list(self.sessions.values())
+
+    def rows(self):
+        return [session.get_activity() for session in self.list()]
+
+
+def get_statement_stats(server):
+    return server_resource(server, 'statement_stats', lambda: StatementStatsCollector(
+        getattr(server, 'max_statement_stats', None) or 5000))
+
+
+def get_session_registry(server):
+    return server_resource(server, 'session_registry', SessionRegistry)
+
+
+def count_rows(rows, run):
+    for row in rows:
+        run.rows += 1
+        yield row
+
+
+class StatsMixin(object):
+    """Collects statement statistics and keeps the session registry used by pg_stat_statements and
+       pg_stat_activity. Statements are measured using track_statement() around their execution and until
+       their results are sent.
+    """
+    track_statement_stats = True
+
+    @property
+    def statement_stats(self):
+        return get_statement_stats(getattr(self, 'server', None))
+
+    @property
+    def session_registry(self):
+        return get_session_registry(getattr(self, 'server', None))
+
+    @property
+    def pending_statement_runs(self):
+        return self.__dict__.setdefault('pending_statement_runs', deque())
+
+    def handle_session_ready(self):
+        now = utcnow()
+        self.__dict__.update(backend_start=now, state='idle', state_change=now, current_query='', query_start=None,
+                             thread_ident=threading.get_ident())
+        self.session_registry.register(self)
+        super().handle_session_ready()
+
+    def handle_session_end(self):
+        self.session_registry.unregister(self)
+        super().handle_session_end()
+
+    def set_session_state(self, state):
+        self.__dict__.update(state=state, state_change=utcnow())
+
+    def get_session_idle_state(self):
+        return 'idle'
+
+    def get_activity(self):
+        client_address = getattr(self, 'client_address', None) or (None, None)
+        startup_params = getattr(self, 'startup_params', {})
+        return {
+            'datname': startup_params.get('database'),
+            'pid': self.backend_pid,
+            'usename': getattr(self, 'user', None),
+            'application_name': startup_params.get('application_name', ''),
+            'client_addr': client_address[0],
+            'client_port': client_address[1],
+            'backend_start': self.__dict__.get('backend_start'),
+            'query_start': self.__dict__.get('query_start'),
+            'state_change': self.__dict__.get('state_change'),
+            'wait_event_type': self.__dict__.get('wait_event_type'),
+            'wait_event': self.__dict__.get('wait_event'),
+            'state': self.__dict__.get('state'),
+            'query': self.__dict__.get('current_query'),
+            'backend_type': 'client backend'
+        }
+
+    def get_profiler_tags(self):
+        """Frames prefixing the stacks sampled by the profiler while the session executes a statement, None when idle
+        """
+        if self.__dict__.get('state') != 'active':
+            return None
+        statement = self.statement_stats.fingerprint(self.__dict__.get('current_query') or '')[1]
+        return [statement[:200], f"session {self.backend_pid}"]
+
+    def execute_command(self, code):
+        try:
+            super().execute_command(code)
+        finally:
+            if code in ('Q', 'S'):
+                # results of statements not sent (eg: portals described but not executed)
+                while self.pending_statement_runs:
+                    self.record_statement_run(self.pending_statement_runs.popleft())
+            if self.__dict__.get('state') == 'active':
+                self.set_session_state(self.get_session_idle_state())
+
+    @contextmanager
+    def track_statement(self, query, executions=1):
+        """executions is the number of executions of a prepared statement performed at once (see
+           WriteStatementsMixin.execute_batch()), recorded as one run each sharing the elapsed time
+        """
+        if self.__dict__.get('current_statement_run') is not None:
+            # nested statements (eg: executed by EXPLAIN ANALYZE) are part of the outer one
+            yield None
+            return
+        run = self.__dict__['current_statement_run'] = StatementRun(query)
+        self.__dict__.update(current_query=query, query_start=utcnow())
+        self.set_session_state('active')
+        start = time.perf_counter()
+        try:
+            yield run
+        except Exception:
+            run.elapsed += time.perf_counter() - start
+            self.record_statement_run(run)
+            raise
+        finally:
+            self.__dict__['current_statement_run'] = None
+        run.elapsed += time.perf_counter() - start
+        if executions > 1:
+            run.elapsed /= executions
+        for i in range(executions):
+            self.pending_statement_runs.append(run if i == 0 else run.copy())
+
+    def count_cache_hit(self, n=1):
+        run = self.__dict__.get('current_statement_run')
+        if run is not None:
+            run.cache_hits += n
+
+    def record_statement_run(self, run):
+        if self.track_statement_stats:
+            self.statement_stats.record(getattr(self, 'user', None), getattr(self, 'startup_params', {}).get('database'), run)
+
+    @contextmanager
+    def sending_statement_results(self):
+        run = self.pending_statement_runs.popleft() if self.pending_statement_runs else None
+        if run is None:
+            yield None
+            return
+        start = time.perf_counter()
+        bytes_sent = self.stream.bytes_sent
+        try:
+            yield run
+        finally:
+            elapsed = time.perf_counter() - start
+            run.elapsed += elapsed
+            run.stages.append(('send_results', elapsed))
+            run.bytes += self.stream.bytes_sent - bytes_sent
+            self.record_statement_run(run)
+
+    def send_query_results(self, command, rows, cols, send_row_description=True):
+        with self.sending_statement_results() as run:
+            if run is not None and rows:
+                if hasattr(rows, '__len__'):
+                    run.rows = len(rows)
+                else:
+                    rows = count_rows(rows, run)
+            super().send_query_results(command, rows, cols, send_row_description)
+            if run is not None and not rows and isinstance(command, CommandTag):
+                run.rows = command.count # rows affected by write statements
+
+    def send_portal_results(self, results):
+        with self.sending_statement_results() as run:
+            if run is not None:
+                run.rows = results.nb_rows
+                if not results.nb_rows and isinstance(results.command, CommandTag):
+                    run.rows = results.command.count # rows affected by write statements
+            super().send_portal_results(results)
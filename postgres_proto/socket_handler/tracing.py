@@ -0,0 +1,281 @@
+from datetime import datetime, timezone
+import json
+import os
+import sys
+import threading
+import time
+from .helpers import server_resource
+
+
+class Span(object):
+    """Timed operation of a session, spans started while another one is open are its children
+    """
+    __slots__ = ('name', 'parent', 'trace_id', 'span_id', 'parent_id', 'start_time', 'start', 'duration', 'attributes')
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.attributes = attributes or {}
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+    def as_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start_time,
+            'duration_ms': self.duration * 1000,
+            'attributes': self.attributes
+        }
+
+
+class NullSpan(object):
+    """Returned by trace_span() when tracing is disabled
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def set_attribute(self, key, value):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer(object):
+    """Receives spans when they start and end. This default tracer does nothing and spans are not even created.
+       Subclass it (setting enabled to True) to export spans.
+    """
+    enabled = False
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        pass
+
+
+class JSONLinesWriter(object):
+    """Thread safe writer of one JSON object per line, path '-' meaning stdout
+    """
+    def __init__(self, path):
+        self.file = sys.stdout if path == '-' else open(path, 'a')
+        self.lock = threading.Lock()
+
+    def write(self, obj):
+        line = json.dumps(obj, default=str) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+
+class JSONLinesExporter(Tracer):
+    """Writes ended spans as JSON lines
+    """
+    enabled = True
+
+    def __init__(self, path):
+        self.writer = JSONLinesWriter(path)
+
+    def on_end(self, span):
+        self.writer.write(span.as_dict())
+
+
+class SlowQueryLog(object):
+    """Writes statements lasting at least threshold seconds (execution and sending of results) as JSON lines
+       with their stage breakdown, number of rows and bytes sent
+    """
+    def __init__(self, path, threshold=1.0):
+        self.writer = JSONLinesWriter(path)
+        self.threshold = threshold
+
+    def record(self, session, run, span=None):
+        startup_params = getattr(session, 'startup_params', {})
+        self.writer.write({
+            'time': datetime.now(timezone.utc).isoformat(),
+            'trace_id': getattr(span, 'trace_id', None),
+            'pid': getattr(session, 'backend_pid', None),
+            'user': getattr(session, 'user', None),
+            'database': startup_params.get('database'),
+            'application_name': startup_params.get('application_name', ''),
+            'duration_ms': run.elapsed * 1000,
+            'query': run.query,
+            'rows': run.rows,
+            'bytes': run.bytes,
+            'stages': [[name, elapsed * 1000] for name, elapsed in run.stages]
+        })
+
+
+def create_tracer(server):
+    trace_file = getattr(server, 'trace_file', None)
+    return JSONLinesExporter(trace_file) if trace_file else Tracer()
+
+
+def create_slow_query_log(server):
+    path = getattr(server, 'slow_query_log', None)
+    if not path:
+        return False # server resources are only created once
+    threshold = getattr(server, 'slow_query_threshold', None)
+    return SlowQueryLog(path, 1.0 if threshold is None else threshold)
+
+
+class SpanContext(object):
+    def __init__(self, session, name, attributes):
+        self.session = session
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.span = self.session.start_span(self.name, **self.attributes)
+        return self.span
+
+    def __exit__(self, *exc):
+        self.session.end_span(self.span, exc[1])
+
+
+class TracedStage(object):
+    """Wraps the Stage returned by ExplainMixin.stage() to record a span and the duration of the stage
+    """
+    def __init__(self, session, name, stage):
+        self.session = session
+        self.name = name
+        self.stage = stage
+
+    def __enter__(self):
+        self.span = self.session.start_span(self.name)
+        self.stage.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.stage.__exit__(*exc)
+        self.session.end_span(self.span, exc[1])
+        run = self.session.__dict__.get('current_statement_run')
+        if run is not None:
+            run.stages.append((self.name, time.perf_counter() - self.span.start))
+
+    def input(self, data):
+        return self.stage.input(data)
+
+    def output(self, data):
+        data = self.stage.output(data)
+        if hasattr(data, '__len__'):
+            self.span.set_attribute('rows', len(data))
+        return data
+
+    def hit(self, n=1):
+        self.stage.hit(n)
+
+    def add_bytes(self, n):
+        self.stage.add_bytes(n)
+
+
+class TracingMixin(object):
+    """Records spans around session init, commands, statement execution, stages (see ExplainMixin.stage())
+       and the sending of results. Spans are exported by the server tracer, set using the trace_file server
+       property (JSON lines) or by setting the tracer server property to a Tracer object. Statements slower than
+       slow_query_threshold seconds are written to the slow_query_log file.
+    """
+    @property
+    def tracer(self):
+        if 'tracer' not in self.__dict__:
+            server = getattr(self, 'server', None)
+            self.__dict__['tracer'] = server_resource(server, 'tracer', lambda: create_tracer(server))
+        return self.__dict__['tracer']
+
+    @property
+    def slow_query_log(self):
+        if 'slow_query_log' not in self.__dict__:
+            server = getattr(self, 'server', None)
+            self.__dict__['slow_query_log'] = server_resource(server, 'slow_query_log_writer',
+                                                              lambda: create_slow_query_log(server)) or None
+        return self.__dict__['slow_query_log']
+
+    @property
+    def tracing_enabled(self):
+        return self.tracer.enabled or self.slow_query_log is not None
+
+    def start_span(self, name, **attributes):
+        parent = self.__dict__.get('current_span')
+        span = Span(name, parent, attributes)
+        self.__dict__['current_span'] = span
+        if self.tracer.enabled:
+            self.tracer.on_start(span)
+        return span
+
+    def end_span(self, span, error=None):
+        span.finish()
+        if error is not None:
+            span.set_attribute('error', getattr(error, 'message', None) or repr(error))
+        self.__dict__['current_span'] = span.parent
+        if self.tracer.enabled:
+            self.tracer.on_end(span)
+
+    def trace_span(self, name, **attributes):
+        """Context manager recording a span, returning the Span (a no-op object when tracing is disabled)
+        """
+        if not self.tracing_enabled:
+            return NULL_SPAN
+        return SpanContext(self, name, attributes)
+
+    def stage(self, name):
+        stage = super().stage(name)
+        if not self.tracing_enabled:
+            return stage
+        return TracedStage(self, name, stage)
+
+    def get_span_attributes(self):
+        client_address = getattr(self, 'client_address', None) or (None, None)
+        startup_params = getattr(self, 'startup_params', {})
+        return {
+            'pid': self.backend_pid,
+            'user': getattr(self, 'user', None),
+            'database': startup_params.get('database'),
+            'application_name': startup_params.get('application_name', ''),
+            'client_addr': client_address[0],
+            'client_port': client_address[1]
+        }
+
+    def perform_session_init(self):
+        with self.trace_span('session_init') as span:
+            version, startup_params, user = super().perform_session_init()
+            span.set_attribute('user', user)
+            span.set_attribute('database', startup_params.get('database'))
+            return version, startup_params, user
+
+    def execute_command(self, code):
+        if not self.tracing_enabled:
+            return super().execute_command(code)
+        with self.trace_span('execute_command', command=code, **self.get_span_attributes()):
+            super().execute_command(code)
+
+    def send_query_results(self, command, rows, cols, send_row_description=True):
+        with self.trace_span('send_results') as span:
+            bytes_sent = self.stream.bytes_sent
+            super().send_query_results(command, rows, cols, send_row_description)
+            span.set_attribute('bytes', self.stream.bytes_sent - bytes_sent)
+
+    def send_portal_results(self, results):
+        with self.trace_span('send_results') as span:
+            bytes_sent = self.stream.bytes_sent
+            super().send_portal_results(results)
+            span.set_attribute('bytes', self.stream.bytes_sent - bytes_sent)
+
+    def record_statement_run(self, run):
+        super().record_statement_run(run)
+        if self.slow_query_log is not None and run.elapsed >= self.slow_query_log.threshold:
+            self.slow_query_log.record(self, run, self.__dict__.get('current_span'))
@@ -0,0 +1,107 @@
+from ..flow import PostgresError
+from ..sql import bind_params, DEFAULT
+from .helpers import stmt_handler, filter_selected_cols, format_result_cols
+
+
+class CommandTag(object):
+    """Command tag of write statements. The number of rows is updated while RETURNING results are sent.
+    """
+    def __init__(self, command, count=0):
+        self.command = command
+        self.count = count
+
+    def __str__(self):
+        if self.command == 'INSERT':
+            return f"INSERT 0 {self.count}"
+        return f"{self.command} {self.count}"
+
+
+def count_rows(rows, tag):
+    for row in rows:
+        tag.count += 1
+        yield row
+
+
+def rows_as_dicts(columns, values):
+    """Rows of an INSERT as dicts, values set to DEFAULT being omitted
+    """
+    return [{col: value for col, value in zip(columns, row) if value is not DEFAULT} for row in values]
+
+
+class WriteStatementsMixin(object):
+    """Handles INSERT, UPDATE and DELETE statements by calling insert_rows(), update_rows() and delete_rows()
+       with the parsed values. Statements with RETURNING stream the rows returned by these methods.
+    """
+    @stmt_handler('INSERT')
+    def handle_insert(self, stmt_info):
+        rows = self.get_insert_rows(stmt_info)
+        return self.format_write_results('INSERT', stmt_info, self.insert_rows(stmt_info.table, rows, stmt_info))
+
+    @stmt_handler('UPDATE')
+    def handle_update(self, stmt_info):
+        result = self.update_rows(stmt_info.table, dict(stmt_info.assignments), stmt_info)
+        return self.format_write_results('UPDATE', stmt_info, result)
+
+    @stmt_handler('DELETE')
+    def handle_delete(self, stmt_info):
+        return self.format_write_results('DELETE', stmt_info, self.delete_rows(stmt_info.table, stmt_info))
+
+    def insert_rows(self, table, rows, stmt_info):
+        """Must insert rows (a list of dicts) in table (a FromTableExpr). Must return the number of inserted rows,
+           or the inserted rows as dicts (possibly an iterator) when stmt_info.returning is set.
+        """
+        raise PostgresError('statement type not supported')
+
+    def update_rows(self, table, assignments, stmt_info):
+        """Must update rows matching stmt_info.where using assignments, a dict mapping columns to values (SqlExpr
+           objects for values which are not literals). Returns the number of rows or the updated rows like insert_rows().
+        """
+        raise PostgresError('statement type not supported')
+
+    def delete_rows(self, table, stmt_info):
+        """Must delete rows matching stmt_info.where. Returns the number of rows or the deleted rows like insert_rows().
+        """
+        raise PostgresError('statement type not supported')
+
+    def get_insert_rows(self, stmt_info):
+        columns = stmt_info.columns or self.describe_table(stmt_info.table.name)
+        if any(len(row) > len(columns) for row in stmt_info.values):
+            raise PostgresError('INSERT has more expressions than target columns', code='42601')
+        return rows_as_dicts(columns, stmt_info.values)
+
+    def format_write_results(self, command, stmt_info, result):
+        tag = CommandTag(command)
+        if not stmt_info.returning:
+            tag.count = result or 0
+            return None, None, tag
+        names = [c.name for c in stmt_info.returning]
+        select_cols, col_names = filter_selected_cols(self.describe_table(stmt_info.table.name) or names, names)
+        aliases = {c.name: c.alias for c in stmt_info.returning if c.alias}
+        rows = ([row.get(col) for col in select_cols] for row in count_rows(result, tag))
+        return rows, format_result_cols(col_names, aliases), tag
+
+    def execute_batch(self, query, param_sets):
+        # executions of the same INSERT are merged into a single call to insert_rows()
+        try:
+            stmt_type, stmt_info = self.parse_sql(query)
+        except PostgresError:
+            stmt_type = None # reported by execute_query()
+        handler = self.get_stmt_handler(stmt_type)
+        if stmt_type != 'INSERT' or stmt_info.returning or len(param_sets) < 2 or \
+                getattr(handler, '__func__', None) is not WriteStatementsMixin.handle_insert:
+            yield from super().execute_batch(query, param_sets)
+            return
+        with self.executing_statement(query, len(param_sets)):
+            self.check_transaction_status(stmt_type)
+            rows = []
+            tags = []
+            for params in param_sets:
+                try:
+                    batch_rows = self.get_insert_rows(bind_params(stmt_info, params))
+                except SyntaxError as e:
+                    raise PostgresError("Syntax error: %s" % e)
+                rows.extend(batch_rows)
+                tags.append(CommandTag('INSERT', len(batch_rows)))
+            self.insert_rows(stmt_info.table, rows, bind_params(stmt_info, param_sets[0]))
+        for tag in tags:
+            yield tag, None, None
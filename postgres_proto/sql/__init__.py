@@ -1,5 +1,6 @@
 """
 Utilities to parse SQL statements in a very forgiving/loose manner
 """
-from .tokenizer import tokenize, tokenize_where_expr, split_sql, split_sql_queries
-from .parser import parse_sql, extract_value_from_where_comparison, parse_sql_func
+from .tokenizer import tokenize, tokenize_where_expr, tokenize_comma_separated_list, split_sql, split_sql_queries
+from .literals import parse_values, parse_value, Param, SqlExpr, DEFAULT
+from .parser import parse_sql, transform_stmt, bind_params, resolve_param, extract_value_from_where_comparison, parse_sql_func, iter_from_tables
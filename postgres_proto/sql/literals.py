@@ -0,0 +1,130 @@
+from collections import namedtuple
+from decimal import Decimal
+import re
+
+
+Param = namedtuple('Param', ['number']) # $1, $2, ... replaced by the bound value, see bind_params()
+SqlExpr = namedtuple('SqlExpr', ['sql']) # expression which is not a literal, provided as is
+DEFAULT = SqlExpr('DEFAULT')
+
+
+VALUE_RE = re.compile(r"""\s*(?:
+    '(?P<string>(?:[^']|'')*)'
+  | (?P<number>[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)
+  | \$(?P<param>\d+)
+  | (?P<word>[A-Za-z_]\w*)
+)(?:\s*::\s*\w+(?:\[\])?)*\s*""", re.VERBOSE)
+
+VALUE_END_RE = re.compile(r"\s*(?:[,)]|$)")
+
+KEYWORD_VALUES = {'null': None, 'true': True, 'false': False, 'default': DEFAULT}
+
+
+def parse_literal_at(sql, pos):
+    """Returns a tuple (value, end_pos) if a literal value (or parameter) ends at the next top level comma
+       or closing parenthesis, None otherwise
+    """
+    m = VALUE_RE.match(sql, pos)
+    if not m or not VALUE_END_RE.match(sql, m.end()):
+        return None
+    kind = m.lastgroup
+    text = m.group(kind)
+    if kind == 'string':
+        value = text.replace("''", "'")
+    elif kind == 'number':
+        value = int(text) if text.lstrip('+-').isdigit() else Decimal(text)
+    elif kind == 'param':
+        value = Param(int(text))
+    elif text.lower() in KEYWORD_VALUES:
+        value = KEYWORD_VALUES[text.lower()]
+    else:
+        return None
+    return value, m.end()
+
+
+def scan_expr(sql, pos):
+    """Returns the end position of the expression starting at pos, which ends at the next top level comma
+       or closing parenthesis
+    """
+    depth = 0
+    i = pos
+    while i < len(sql):
+        c = sql[i]
+        if c in "'\"":
+            end = sql.find(c, i + 1)
+            if end == -1:
+                raise SyntaxError('expecting closing quote, none found')
+            i = end
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            if not depth:
+                return i
+            depth -= 1
+        elif c == ',' and not depth:
+            return i
+        i += 1
+    return i
+
+
+def parse_value_at(sql, pos):
+    """Returns a tuple (value, end_pos) where value is a python value for literals, a Param for parameters
+       or a SqlExpr for other expressions
+    """
+    literal = parse_literal_at(sql, pos)
+    if literal is not None:
+        return literal
+    end = scan_expr(sql, pos)
+    expr = sql[pos:end].strip()
+    if not expr:
+        raise SyntaxError('expecting a value')
+    return SqlExpr(expr), end
+
+
+def parse_value(sql):
+    value, end = parse_value_at(sql, 0)
+    if end != len(sql):
+        # the expression contains a top level comma or parenthesis
+        return SqlExpr(sql.strip())
+    return value
+
+
+def expect(sql, pos, char):
+    while pos < len(sql) and sql[pos].isspace():
+        pos += 1
+    if pos >= len(sql) or sql[pos] != char:
+        raise SyntaxError(f"expecting '{char}' at position {pos}")
+    return pos + 1
+
+
+def parse_values(sql):
+    """Parses the tuples of a VALUES clause, eg: (1, 'a'), (2, NULL)
+    """
+    rows = []
+    pos = 0
+    end = len(sql.rstrip())
+    while True:
+        pos = expect(sql, pos, '(')
+        row = []
+        while True:
+            value, pos = parse_value_at(sql, pos)
+            row.append(value)
+            if pos >= len(sql):
+                raise SyntaxError('expecting closing parenthesis, end of string reached')
+            pos += 1
+            if sql[pos - 1] == ')':
+                break
+        rows.append(tuple(row))
+        while pos < end and sql[pos].isspace():
+            pos += 1
+        if pos >= end:
+            return rows
+        pos = expect(sql, pos, ',')
+
+
+def bind_value(value, params):
+    if isinstance(value, Param):
+        if params is None or not 0 < value.number <= len(params):
+            raise SyntaxError(f"there is no parameter ${value.number}")
+        return params[value.number - 1]
+    return value
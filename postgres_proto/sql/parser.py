@@ -1,33 +1,157 @@
-from .tokenizer import tokenize, split_sql, tokenize_where_expr, tokenize_comma_separated_list
+from .tokenizer import tokenize, split_sql, tokenize_where_expr, tokenize_comma_separated_list, search_next_token
+from .literals import parse_values, parse_value, bind_value, Param, SqlExpr, DEFAULT
 from collections import namedtuple
 
 
-SelectStmt = namedtuple('SelectStmt', ['columns', 'cols_aliases', 'tables', 'where', 'group_by', 'order_by' 'limit', 'offset'])
-SelectColumnExpr = namedtuple('SelectColumnExpr', ['name', 'alias'])
-FromTableExpr = namedtuple('FromTableExpr', ['name', 'schema', 'alias', 'joins', 'subquery'])
+SelectStmt = namedtuple('SelectStmt', ['columns', 'cols_aliases', 'tables', 'where', 'group_by', 'order_by', 'limit', 'offset', 'params'],
+    defaults=(None, None, None, None, None, None, None, None))
+SelectColumnExpr = namedtuple('SelectColumnExpr', ['name', 'alias', 'expr'], defaults=(None,)) # expr: as written in the query
+FromTableExpr = namedtuple('FromTableExpr', ['name', 'schema', 'alias', 'joins', 'subquery'], defaults=(None, None))
+JoinExpr = namedtuple('JoinExpr', ['type', 'table', 'on'])
+InsertStmt = namedtuple('InsertStmt', ['table', 'columns', 'values', 'returning', 'params'], defaults=(None, None))
+UpdateStmt = namedtuple('UpdateStmt', ['table', 'assignments', 'tables', 'where', 'returning', 'params'],
+    defaults=(None, None, None, None))
+DeleteStmt = namedtuple('DeleteStmt', ['table', 'where', 'returning', 'params'], defaults=(None, None, None))
 
 
-def parse_sql(sql, stmt_type_delimiters=None):
+JOIN_KEYWORDS = {
+    'INNER JOIN': 'INNER',
+    'LEFT OUTER JOIN': 'LEFT',
+    'LEFT JOIN': 'LEFT',
+    'JOIN': 'INNER'
+}
+
+
+def parse_sql(sql, stmt_type_delimiters=None, params=None):
+    """Returns a tuple (stmt_type, stmt_info). params are the values of bound parameters ($1, $2, ...), which
+       are provided as stmt_info.params (or stmt_info['params'] for statements without a specific parser).
+       Use resolve_param() to get the value of an expression which may be a parameter.
+    """
     stmt_type, parts = split_sql(sql, stmt_type_delimiters)
+    return stmt_type, transform_stmt(stmt_type, parts, params)
+
+
+def transform_stmt(stmt_type, parts, params=None):
     stmt_types = {
-        'SELECT': transform_select_stmt
+        'SELECT': transform_select_stmt,
+        'INSERT': transform_insert_stmt,
+        'UPDATE': transform_update_stmt,
+        'DELETE': transform_delete_stmt
     }
-    return stmt_type, stmt_types[stmt_type](parts) if stmt_type in stmt_types else parts
+    if stmt_type in stmt_types:
+        return bind_params(stmt_types[stmt_type](parts), params)
+    return bind_params(parts, params)
+
+
+def bind_params(stmt_info, params):
+    """Returns stmt_info with the values of bound parameters. stmt_info is not modified so that parsed statements
+       can be reused with different parameters.
+    """
+    if isinstance(stmt_info, dict):
+        stmt_info = dict(stmt_info)
+        if params is not None:
+            stmt_info['params'] = params
+        return stmt_info
+    if params is None:
+        return stmt_info
+    if isinstance(stmt_info, InsertStmt) and stmt_info.values:
+        values = [tuple(bind_value(v, params) for v in row) for row in stmt_info.values]
+        return stmt_info._replace(values=values, params=params)
+    if isinstance(stmt_info, UpdateStmt):
+        assignments = [(col, bind_value(v, params)) for col, v in stmt_info.assignments]
+        return stmt_info._replace(assignments=assignments, params=params)
+    return stmt_info._replace(params=params)
 
 
 def transform_select_stmt(parts):
     return SelectStmt(
         columns=list(parse_select_cols(parts.pop('SELECT'))),
-        tables=list(parse_from_tables(parts.pop('FROM'))),
+        tables=list(parse_from_tables(parts.pop('FROM', ''))),
         **{k.replace(' ', '_').lower(): v for k, v in parts.items()})
 
 
+def transform_insert_stmt(parts):
+    target = parts.get('INTO')
+    if not target:
+        raise SyntaxError('missing INTO clause')
+    if 'VALUES' not in parts:
+        raise SyntaxError('only INSERT ... VALUES is supported')
+    if target.upper().endswith(' DEFAULT') and not parts['VALUES']:
+        target = target[:-len(' DEFAULT')]
+        values = [()]
+    else:
+        values = parse_values(parts['VALUES'])
+    table, columns = parse_insert_target(target)
+    if columns and any(len(row) != len(columns) for row in values):
+        raise SyntaxError('VALUES lists must have as many values as columns')
+    return InsertStmt(table, columns, values, parse_returning(parts.get('RETURNING')))
+
+
+def parse_insert_target(sql):
+    """Returns a tuple (table, columns) from the INTO clause, columns being None when not specified
+    """
+    sql = sql.strip()
+    if not sql.endswith(')'):
+        return parse_table_expr(sql), None
+    start = sql.index('(')
+    columns = [parse_identifier(col) for col, _ in tokenize_comma_separated_list(sql[start + 1:-1])]
+    return parse_table_expr(sql[:start]), columns
+
+
+def parse_identifier(sql):
+    sql = sql.strip()
+    if sql.startswith('"') and sql.endswith('"'):
+        return sql[1:-1]
+    return sql.lower()
+
+
+def transform_update_stmt(parts):
+    if not parts.get('UPDATE') or not parts.get('SET'):
+        raise SyntaxError('UPDATE requires a table and a SET clause')
+    assignments = []
+    for assignment, _ in tokenize_comma_separated_list(parts['SET']):
+        if '=' not in assignment:
+            raise SyntaxError(f"invalid assignment: {assignment}")
+        col, value = assignment.split('=', 1)
+        assignments.append((parse_identifier(col), parse_value(value)))
+    return UpdateStmt(
+        table=parse_table_expr(parts['UPDATE']),
+        assignments=assignments,
+        tables=list(parse_from_tables(parts['FROM'])) if parts.get('FROM') else None,
+        where=parts.get('WHERE'),
+        returning=parse_returning(parts.get('RETURNING')))
+
+
+def transform_delete_stmt(parts):
+    if not parts.get('FROM'):
+        raise SyntaxError('missing FROM clause')
+    return DeleteStmt(parse_table_expr(parts['FROM']), parts.get('WHERE'), parse_returning(parts.get('RETURNING')))
+
+
+def parse_returning(sql):
+    return list(parse_select_cols(sql)) if sql else None
+
+
+def resolve_param(expr, params):
+    """Returns the value of the bound parameter if expr is a parameter placeholder ($1, $2, ...), expr otherwise
+    """
+    if params is None or not isinstance(expr, str) or not expr.startswith('$') or not expr[1:].isdigit():
+        return expr
+    i = int(expr[1:]) - 1
+    if not 0 <= i < len(params):
+        raise SyntaxError(f"there is no parameter {expr}")
+    return params[i]
+
+
 def parse_select_cols(sql):
     for col_expr, _ in tokenize_comma_separated_list(sql):
         if not col_expr:
             continue
-        tokens = tokenize(col_expr, remove_quotes=True, group_delimiters=(('(', ')'), ('CASE ', ' END')))
+        group_delimiters = (('(', ')'), ('CASE ', ' END'))
+        tokens = tokenize(col_expr, remove_quotes=True, group_delimiters=group_delimiters)
         name = tokens[0][0].lower()
+        # names are unquoted and lowercased, backends pushing down queries need the original expression
+        expr = tokenize(col_expr, group_delimiters=group_delimiters)[0][0]
         alias = None
         if '(' in name:
             alias = name.split('(', 1)[0]
@@ -35,28 +159,77 @@ def parse_select_cols(sql):
             alias = name.split('.', 1)[1]
         if len(tokens) > 1:
             alias = tokens[-1][0]
-        yield SelectColumnExpr(name, alias)
+        yield SelectColumnExpr(name, alias, expr)
 
 
 def parse_from_tables(sql):
     for table_expr, _ in tokenize_comma_separated_list(sql):
         if not table_expr:
             continue
-        tokens = tokenize(table_expr, remove_quotes=True)
-        name = tokens[0][0].lower()
-        schema = None
-        alias = None
-        if '.' in name:
-            schema, name = name.split('.', 1)
-        if len(tokens) > 1:
-            alias = tokens[-1][0]
-        yield FromTableExpr(name, schema, alias)
+        clauses = split_join_clauses(table_expr)
+        table = parse_table_expr(clauses[0][1])
+        joins = [parse_join_expr(join_type, join_expr) for join_type, join_expr in clauses[1:]]
+        yield table._replace(joins=joins) if joins else table
+
+
+def parse_table_expr(sql):
+    tokens = tokenize(sql, remove_quotes=True)
+    name = tokens[0][0].lower()
+    schema = None
+    alias = None
+    if '.' in name:
+        schema, name = name.split('.', 1)
+    if len(tokens) > 1:
+        alias = tokens[-1][0]
+    return FromTableExpr(name, schema, alias)
+
+
+def split_join_clauses(sql):
+    """Returns a list of (join_type, sql) where the first item is the table before any join (with a None join type)
+    """
+    tokens = tokenize(sql)
+    clauses = []
+    join_type = None
+    last_pos = 0
+    i = 0
+    while True:
+        keyword, pos, i = search_next_token(tokens, list(JOIN_KEYWORDS.keys()), i)
+        clauses.append((join_type, sql[last_pos:pos].strip()))
+        if not keyword:
+            return clauses
+        i += keyword.count(' ')
+        join_type = JOIN_KEYWORDS[keyword]
+        last_pos = pos + len(keyword)
+
+
+def parse_join_expr(join_type, sql):
+    keyword, pos, _ = search_next_token(tokenize(sql), ['ON'])
+    if not keyword:
+        raise SyntaxError('missing ON condition for join')
+    cond = sql[pos + len(keyword):]
+    if len(tokenize(cond, split_delimiters=(' or ',))) > 1:
+        raise SyntaxError('only AND conditions are supported in joins')
+    on = []
+    for left_expr, op, right_expr in tokenize_where_expr(cond):
+        if op != '=':
+            raise SyntaxError('only equality conditions are supported in joins')
+        on.append((left_expr, right_expr))
+    return JoinExpr(join_type, parse_table_expr(sql[:pos]), on)
+
+
+def iter_from_tables(tables):
+    """Iterates over all tables of the FROM clause, including joined tables
+    """
+    for table in tables:
+        yield table
+        for join in table.joins or ():
+            yield join.table
 
 
-def extract_value_from_where_comparison(where_cond, col):
+def extract_value_from_where_comparison(where_cond, col, params=None):
     for left_expr, op, right_expr in tokenize_where_expr(where_cond):
         if left_expr == col:
-            return right_expr
+            return resolve_param(right_expr, params)
 
 
 def parse_sql_func(sql):
@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 
 
 def split_sql_queries(sql):
@@ -8,8 +9,8 @@ def split_sql_queries(sql):
 SQL_SPLIT_STMT_TYPES = {
     'SELECT': ['SELECT', 'FROM', 'WHERE', 'GROUP BY', 'ORDER BY', 'LIMIT', 'OFFSET'],
     'INSERT': ['INTO', 'VALUES', 'RETURNING'],
-    'UPDATE': ['UPDATE', 'SET', 'FROM', 'WHERE'],
-    'DELETE': ['FROM', 'WHERE'],
+    'UPDATE': ['UPDATE', 'SET', 'FROM', 'WHERE', 'RETURNING'],
+    'DELETE': ['FROM', 'WHERE', 'RETURNING'],
     'SET': ['SET'],
     'BEGIN': [],
     'COMMIT': [],
@@ -18,6 +19,14 @@ SQL_SPLIT_STMT_TYPES = {
     'EXECUTE': ['EXECUTE'],
     'DEALLOCATE': ['DEALLOCATE'],
     'DISCARD': ['DISCARD'],
+    'LISTEN': ['LISTEN'],
+    'UNLISTEN': ['UNLISTEN'],
+    'NOTIFY': ['NOTIFY'],
+    'EXPLAIN': ['EXPLAIN'],
+    'DECLARE': ['DECLARE'],
+    'FETCH': ['FETCH'],
+    'MOVE': ['MOVE'],
+    'CLOSE': ['CLOSE'],
     'CASE': ['WHEN', 'THEN', 'ELSE', 'END']
 }
 
@@ -113,10 +122,10 @@ def tokenize(sql, pos=0, split_delimiters=(',', ' '), group_delimiters=(('(', ')
         elif delim in open_group_delimiters:
             if current.strip() or not tokenize_nested:
                 end_pos = find_next_unnested_delim(sql, delim_pos + len(delim), delim, group_delimiters[delim])
-                pos = end_pos + len(delim)
-                tokens.append((sql[delim_pos:pos].strip(), delim_pos))
-                current =''
-                current_pos = pos
+                pos = end_pos + len(group_delimiters[delim])
+                if not current.strip():
+                    current_pos = delim_pos
+                current += sql[delim_pos:pos]
             else:
                 # nested group
                 group, pos = tokenize(sql, delim_pos + len(delim), split_delimiters, group_delimiters,
@@ -143,27 +152,33 @@ def tokenize(sql, pos=0, split_delimiters=(',', ' '), group_delimiters=(('(', ')
     return tokens
 
 
+@lru_cache(maxsize=256)
+def compile_delimiters(delimiters):
+    """Returns a regexp matching any of the delimiters (case insensitive) and a dict mapping matches to delimiters
+    """
+    ordered = sorted(set(delimiters), key=len, reverse=True) # the longest delimiter wins at the same position (eg: '<=' and '<')
+    return re.compile('|'.join(re.escape(d) for d in ordered), re.IGNORECASE), {d.lower(): d for d in ordered}
+
+
 def find_next_delimiter(string, pos, delimiters):
-    next_delim = None
-    next_delim_pos = len(string)
-    string = string.lower()
-    for delim in delimiters:
-        delim_pos = string.find(delim.lower(), pos)
-        if delim_pos >= 0 and delim_pos < next_delim_pos:
-            next_delim = delim
-            next_delim_pos = delim_pos
-    return next_delim, next_delim_pos
+    regexp, lookup = compile_delimiters(tuple(delimiters))
+    m = regexp.search(string, pos)
+    if not m:
+        return None, len(string)
+    return lookup[m.group(0).lower()], m.start()
 
 
 def find_next_unnested_delim(string, pos, open_delim, close_delim):
-    next_open_delim = string.lower().find(open_delim.lower(), pos)
-    next_close_delim = string.lower().find(close_delim.lower(), pos)
-    if next_open_delim >= 0 and next_open_delim < next_close_delim:
-        return find_next_unnested_delim(
-            string,
-            find_next_unnested_delim(string, next_open_delim + len(open_delim), open_delim, close_delim) + len(close_delim),
-            open_delim,
-            close_delim)
-    elif next_close_delim == -1:
-        raise SyntaxError(f"missing closing delimiter '{close_delim}'")
-    return next_close_delim
+    depth = 0
+    while True:
+        delim, delim_pos = find_next_delimiter(string, pos, (open_delim, close_delim))
+        if delim is None:
+            raise SyntaxError(f"missing closing delimiter '{close_delim}'")
+        if delim == close_delim:
+            if not depth:
+                return delim_pos
+            depth -= 1
+            pos = delim_pos + len(close_delim)
+        else:
+            depth += 1
+            pos = delim_pos + len(open_delim)
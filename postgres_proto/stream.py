@@ -1,14 +1,30 @@
 from io import BytesIO
 from contextlib import contextmanager
+import shutil
+import ssl
 import struct
 
 
 POSTGRES_TYPE_MAPPING = {
     int: (23, 4),
+    float: (701, 8),
+    bool: (16, 1),
     str: (25, -1)
 }
 
 
+# array.array / memoryview typecodes and numpy dtype kinds. Unsigned 64 bits integers (and unsigned longs, 64 bits
+# on most platforms) do not fit in int8 and are described as numeric.
+COLUMN_TYPECODES_MAPPING = {
+    'b': (20, 8), 'B': (20, 8), 'h': (20, 8), 'H': (20, 8), 'i': (20, 8), 'I': (20, 8),
+    'l': (20, 8), 'L': (1700, -1), 'q': (20, 8), 'Q': (1700, -1), 'f': (701, 8), 'd': (701, 8), '?': (16, 1)
+}
+
+NON_FINITE_FLOATS = {'nan': b'NaN', 'inf': b'Infinity', '-inf': b'-Infinity'}
+
+NULL_FIELD = struct.pack("!i", -1)
+
+
 class ColumnDef:
     def __init__(self, name, pytype=None, type_id=None, type_size=None):
         self.name = name
@@ -19,14 +35,90 @@ class ColumnDef:
             self.type_size = type_size
 
 
+class ColumnBatch(object):
+    """Column oriented rows: one sequence per column. Columns can be lists, array.array, memoryview or numpy arrays
+       and are encoded without building per-row objects.
+    """
+    def __init__(self, names, columns):
+        self.names = list(names)
+        self.columns = list(columns)
+
+    @classmethod
+    def from_dict(cls, columns):
+        return cls(columns.keys(), columns.values())
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def select(self, names):
+        columns = dict(zip(self.names, self.columns))
+        return ColumnBatch(names, [columns[name] for name in names])
+
+    def slice(self, start, end):
+        return ColumnBatch(self.names, [col[start:end] for col in self.columns])
+
+    def chunks(self, size):
+        for start in range(0, len(self), size):
+            yield self.slice(start, start + size)
+
+    def iter_dicts(self):
+        for values in zip(*[column_values(col) for col in self.columns]):
+            yield dict(zip(self.names, values))
+
+    def column_defs(self, aliases=None):
+        aliases = aliases or {}
+        return [ColumnDef(aliases.get(name, name), type_id=type_id, type_size=type_size)
+                for name, (type_id, type_size) in zip(self.names, map(column_type, self.columns))]
+
+
+def column_typecode(column):
+    if hasattr(column, 'dtype'): # numpy
+        if column.dtype.kind == 'u':
+            return 'Q' if column.dtype.itemsize == 8 else 'I'
+        return {'b': '?'}.get(column.dtype.kind, column.dtype.kind)
+    return getattr(column, 'typecode', getattr(column, 'format', None))
+
+
+def column_type(column):
+    return COLUMN_TYPECODES_MAPPING.get(column_typecode(column), POSTGRES_TYPE_MAPPING[str])
+
+
+def column_values(column):
+    return column.tolist() if hasattr(column, 'tolist') else column
+
+
+def encode_column(column):
+    """Returns the list of length prefixed fields of a column
+    """
+    typecode = column_typecode(column)
+    values = column_values(column)
+    if typecode == '?':
+        fields = (b't' if v else b'f' for v in values)
+    elif typecode in ('f', 'd'):
+        fields = (NON_FINITE_FLOATS.get(repr(v)) or repr(v).encode() for v in values)
+    elif typecode in COLUMN_TYPECODES_MAPPING:
+        fields = (b'%d' % v for v in values)
+    else:
+        fields = (None if v is None else str(v).encode() for v in values)
+    return [NULL_FIELD if f is None else struct.pack("!i", len(f)) + f for f in fields]
+
+
+def encode_data_row(row):
+    fields = [NULL_FIELD if field is None else struct.pack("!i", len(field)) + field
+              for field in (None if v is None else str(v).encode() for v in row)]
+    payload = b''.join(fields)
+    return b'D' + struct.pack("!ih", 6 + len(payload), len(fields)) + payload # DataRow
+
+
 class PostgresBuffer(object):
     """Utilities to write on the stream"""
 
-    def __init__(self, stream=None):
+    def __init__(self, stream=None, payload=None):
         if not stream:
             self.stream = BytesIO()
         else:
             self.stream = stream
+        self.payload = payload # bytes of stream when reading a message in memory (see read_payload())
 
     def getvalue(self):
         return self.stream.getvalue()
@@ -43,16 +135,25 @@ class PostgresBuffer(object):
         return struct.unpack("!i", data)[0]
 
     def read_string(self):
-        data = bytes()
+        if self.payload is not None:
+            # payloads are in memory: search the terminator instead of reading byte by byte
+            start = self.stream.tell()
+            end = self.payload.find(b'\x00', start)
+            if end == -1:
+                end = len(self.payload)
+            self.stream.seek(end + 1)
+            return self.payload[start:end].decode()
+        data = bytearray()
         while True:
             char = self.read(1)
-            if char == b'\x00':
+            if char in (b'\x00', b''):
                 return data.decode()
             data += char
 
     def read_payload(self):
         msglen = self.read_int32()
-        return PostgresBuffer(BytesIO(self.read(msglen - 4)))
+        payload = self.read(msglen - 4)
+        return PostgresBuffer(BytesIO(payload), payload)
 
     def write(self, value):
         self.stream.write(value)
@@ -67,14 +168,35 @@ class PostgresBuffer(object):
         self.stream.write(value.encode())
         self.stream.write(b'\x00')
 
+    def write_data_row(self, row):
+        self.write(encode_data_row(row))
+
+    def write_column_batch(self, batch, chunk_size=4096):
+        header = struct.pack("!h", len(batch.columns))
+        for chunk in batch.chunks(chunk_size):
+            messages = []
+            for fields in zip(*[encode_column(col) for col in chunk.columns]):
+                payload = b''.join(fields)
+                messages.append(b'D' + struct.pack("!i", 6 + len(payload)) + header + payload) # DataRow
+            self.write(b''.join(messages))
+
+    def write_data_rows(self, rows):
+        if isinstance(rows, ColumnBatch):
+            self.write_column_batch(rows)
+            return
+        # rows are written by chunks to limit the number of writes on the socket
+        messages = []
+        for row in rows:
+            messages.append(encode_data_row(row))
+            if len(messages) >= 1024:
+                self.write(b''.join(messages))
+                messages = []
+        if messages:
+            self.write(b''.join(messages))
+
     def write_response(self, code, msg_stream=None):
-        self.write(code)
-        if msg_stream:
-            payload = msg_stream.getvalue()
-            self.write_int32(4 + len(payload))
-            self.write(payload)
-        else:
-            self.write_int32(4)
+        payload = msg_stream.getvalue() if msg_stream else b''
+        self.write(code + struct.pack("!i", 4 + len(payload)) + payload)
 
     @contextmanager
     def response(self, code):
@@ -83,16 +205,44 @@ class PostgresBuffer(object):
         self.write_response(code, buf)
 
 
+class CountingWriter(object):
+    """Wraps a file object to count bytes written"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_written = 0
+
+    def write(self, value):
+        self.bytes_written += len(value)
+        return self.stream.write(value)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
 class PostgresStream(object):
     """
         Implements reading and writing commands over file objects
         Message formats: https://www.postgresql.org/docs/current/protocol-message-formats.html
+        Messages are recorded when a capture session is given (see postgres_proto.capture)
     """
-    def __init__(self, rfile, wfile):
+    def __init__(self, rfile, wfile, capture=None):
+        self.capture = capture
+        if capture is not None:
+            rfile, wfile = capture.reader(rfile), capture.writer(wfile)
         self.rfile = PostgresBuffer(rfile)
-        self.wfile = PostgresBuffer(wfile)
+        self.wfile = PostgresBuffer(CountingWriter(wfile))
+
+    @property
+    def bytes_sent(self):
+        return self.wfile.stream.bytes_written
+
+    def begin_message(self):
+        if self.capture is not None:
+            self.capture.flush_message()
 
     def read_startup_message_header(self):
+        self.begin_message()
         msglen = self.rfile.read_int32()
         version = self.rfile.read_int32()
         return msglen, version
@@ -112,10 +262,42 @@ class PostgresStream(object):
 
     def send_authentication_request(self):
         self.wfile.write(struct.pack(b"!cii", b'R', 8, 3)) # AuthenticationCleartextPassword
+        data = self.read_password_message() # PasswordMessage
+        return None if data is None else data.read_string()
+
+    def read_password_message(self):
+        self.begin_message()
         type_code = self.rfile.read(1)
         if type_code != b"p":
-            return
-        return self.rfile.read_payload().read_string()
+            return None
+        return self.rfile.read_payload()
+
+    def send_authentication_sasl(self, mechanisms):
+        """Returns a tuple (mechanism, initial response) or None if the client did not answer
+        """
+        with self.wfile.response(b'R') as r: # AuthenticationSASL
+            r.write_int32(10)
+            for mechanism in mechanisms:
+                r.write_string(mechanism)
+            r.write(b'\x00')
+        data = self.read_password_message() # SASLInitialResponse
+        if data is None:
+            return None
+        mechanism = data.read_string()
+        length = data.read_int32()
+        return mechanism, (data.read(length) if length >= 0 else b'').decode()
+
+    def send_authentication_sasl_continue(self, message):
+        with self.wfile.response(b'R') as r: # AuthenticationSASLContinue
+            r.write_int32(11)
+            r.write(message.encode())
+        data = self.read_password_message() # SASLResponse
+        return None if data is None else data.read(-1).decode()
+
+    def send_authentication_sasl_final(self, message):
+        with self.wfile.response(b'R') as r: # AuthenticationSASLFinal
+            r.write_int32(12)
+            r.write(message.encode())
 
     def send_authentication_ok(self):
         self.wfile.write(struct.pack(b"!cii", b'R', 8, 0)) # AuthenticationOk
@@ -129,14 +311,28 @@ class PostgresStream(object):
     def send_ready_for_query(self, status=b'I'): # idle transaction
         with self.wfile.response(b'Z') as r: # ReadyForQuery
             r.write(status)
+        if self.capture is not None:
+            self.capture.end_response()
 
     def send_command_complete(self, tag):
         with self.wfile.response(b'C') as r: # CommandComplete
-            r.write_string(tag)
+            r.write_string(str(tag))
 
     def read_command(self):
+        self.begin_message()
         return self.rfile.read(1).decode()
 
+    def has_pending_input(self):
+        """Returns True if data sent by the client can be read right away. The socket must be non-blocking.
+        """
+        try:
+            return bool(self.rfile.stream.peek(1))
+        except ssl.SSLWantReadError:
+            return False
+
+    def skip_message(self):
+        self.rfile.read_payload()
+
     def read_query(self):
         return self.rfile.read_payload().read_string() # Query
 
@@ -161,10 +357,7 @@ class PostgresStream(object):
         params = []
         for i in range(data.read_int16()):
             paramlen = data.read_int32()
-            if paramlen == -1:
-                params.append(None)
-            if paramlen:
-                params.append(data.read(paramlen))
+            params.append(None if paramlen == -1 else data.read(paramlen))
         result_cols = [data.read_int16() for i in range(data.read_int16())]
         return portal, stmt, param_formats, params, result_cols
 
@@ -216,13 +409,17 @@ class PostgresStream(object):
                 r.write_int16(0)
 
     def send_row_data(self, rows):
-        for row in rows:
-            with self.wfile.response(b'D') as r: # DataRow
-                r.write_int16(len(row))
-                for field in row:
-                    v = str(field).encode()
-                    r.write_int32(len(v))
-                    r.write(v)
+        self.wfile.write_data_rows(rows)
+
+    def send_encoded_row_data(self, fileobj):
+        """Copies DataRow messages previously encoded with PostgresBuffer.write_data_row()"""
+        shutil.copyfileobj(fileobj, self.wfile.stream)
+
+    def send_notification(self, pid, channel, payload=''):
+        with self.wfile.response(b'A') as r: # NotificationResponse
+            r.write_int32(pid)
+            r.write_string(channel)
+            r.write_string(payload)
 
     def send_error(self, message, severity="ERROR", code="0"):
         with self.wfile.response(b'E') as r: # ErrorResponse
@@ -0,0 +1,112 @@
+"""
+Decoding of parameter values sent with Bind messages, in text or binary format
+Binary formats: https://github.com/postgres/postgres/tree/master/src/backend/utils/adt (*recv functions)
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+import json
+import struct
+import uuid
+
+
+TEXT_FORMAT = 0
+BINARY_FORMAT = 1
+
+POSTGRES_EPOCH = datetime(2000, 1, 1)
+POSTGRES_EPOCH_DATE = date(2000, 1, 1)
+
+
+def decode_text_bool(value):
+    return value.strip().lower() in ('t', 'true', 'y', 'yes', 'on', '1')
+
+
+def decode_text_bytea(value):
+    if value.startswith('\\x'):
+        return bytes.fromhex(value[2:])
+    return value.encode('latin-1').decode('unicode_escape').encode('latin-1')
+
+
+def decode_binary_numeric(data):
+    ndigits, weight, sign, dscale = struct.unpack("!hhHh", data[:8])
+    if sign == 0xC000:
+        return Decimal('NaN')
+    digits = struct.unpack("!%dh" % ndigits, data[8:8 + ndigits * 2])
+    value = Decimal(0)
+    for i, digit in enumerate(digits):
+        value += Decimal(digit).scaleb(4 * (weight - i))
+    if sign == 0x4000:
+        value = -value
+    return value.quantize(Decimal(1).scaleb(-dscale)) if dscale else value
+
+
+def decode_binary_timestamp(data, tz=None):
+    return (POSTGRES_EPOCH + timedelta(microseconds=struct.unpack("!q", data)[0])).replace(tzinfo=tz)
+
+
+def decode_binary_time(data):
+    micros = struct.unpack("!q", data)[0]
+    return (datetime.min + timedelta(microseconds=micros)).time()
+
+
+def decode_binary_jsonb(data):
+    return json.loads(data[1:].decode()) # first byte is the jsonb version
+
+
+def decode_text(value):
+    return value
+
+
+# oid: (text decoder, binary decoder)
+PARAM_DECODERS = {
+    16: (decode_text_bool, lambda d: d != b'\x00'), # bool
+    17: (decode_text_bytea, bytes), # bytea
+    18: (decode_text, lambda d: d.decode()), # char
+    19: (decode_text, lambda d: d.decode()), # name
+    20: (int, lambda d: struct.unpack("!q", d)[0]), # int8
+    21: (int, lambda d: struct.unpack("!h", d)[0]), # int2
+    23: (int, lambda d: struct.unpack("!i", d)[0]), # int4
+    25: (decode_text, lambda d: d.decode()), # text
+    26: (int, lambda d: struct.unpack("!I", d)[0]), # oid
+    114: (json.loads, lambda d: json.loads(d.decode())), # json
+    700: (float, lambda d: struct.unpack("!f", d)[0]), # float4
+    701: (float, lambda d: struct.unpack("!d", d)[0]), # float8
+    1042: (decode_text, lambda d: d.decode()), # bpchar
+    1043: (decode_text, lambda d: d.decode()), # varchar
+    1082: (date.fromisoformat, lambda d: POSTGRES_EPOCH_DATE + timedelta(days=struct.unpack("!i", d)[0])), # date
+    1083: (time.fromisoformat, decode_binary_time), # time
+    1114: (datetime.fromisoformat, decode_binary_timestamp), # timestamp
+    1184: (datetime.fromisoformat, lambda d: decode_binary_timestamp(d, timezone.utc)), # timestamptz
+    1700: (Decimal, decode_binary_numeric), # numeric
+    2950: (uuid.UUID, lambda d: uuid.UUID(bytes=d)), # uuid
+    3802: (json.loads, decode_binary_jsonb) # jsonb
+}
+
+
+def get_param_format(param_formats, i):
+    if not param_formats:
+        return TEXT_FORMAT
+    if len(param_formats) == 1:
+        return param_formats[0]
+    return param_formats[i]
+
+
+def decode_param(value, type_oid=0, format_code=TEXT_FORMAT):
+    """Decodes a raw parameter value into a Python value using its type oid (0 means unspecified).
+       Text values of unspecified or unknown types are returned as str, binary ones as bytes.
+       Raises ValueError for malformed values.
+    """
+    if value is None:
+        return None
+    decoders = PARAM_DECODERS.get(type_oid)
+    try:
+        if format_code == BINARY_FORMAT:
+            return decoders[1](value) if decoders else bytes(value)
+        value = value.decode()
+        return decoders[0](value) if decoders else value
+    except (struct.error, ArithmeticError, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError(f"invalid value for parameter of type {type_oid}: {e}")
+
+
+def decode_params(params, param_formats, param_types):
+    return [decode_param(value, param_types[i] if i < len(param_types) else 0, get_param_format(param_formats, i))
+            for i, value in enumerate(params)]
@@ -0,0 +1,55 @@
+from decimal import Decimal
+import pytest
+from postgres_proto.flow import PostgresError
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.aggregates import SumAggregate, AvgAggregate, MinAggregate
+from postgres_proto.socket_handler.memory_tables import MemoryTablesMixin, MemoryTable
+from wire import serve, Connection
+
+
+def aggregate(cls, values):
+    agg = cls()
+    for value in values:
+        agg.add(value)
+    return agg.result()
+
+
+def test_sum_of_mixed_numbers():
+    assert aggregate(SumAggregate, [1, 2]) == 3
+    assert aggregate(SumAggregate, [Decimal('2.5'), 1]) == Decimal('3.5')
+    assert aggregate(SumAggregate, [1.5, Decimal('2.5'), None, '1']) == 5.0
+    assert aggregate(SumAggregate, [None, '']) is None
+
+
+def test_avg_of_mixed_numbers():
+    assert aggregate(AvgAggregate, [1.0, Decimal('2'), '3']) == 2.0
+    partial = AvgAggregate()
+    partial.add(Decimal('1.5'))
+    merged = AvgAggregate()
+    merged.add(2.5)
+    merged.merge(partial)
+    assert merged.result() == 2.0
+
+
+def test_non_numeric_values():
+    with pytest.raises(PostgresError) as e:
+        aggregate(SumAggregate, [1, 'abc'])
+    assert e.value.code == '22P02'
+    assert aggregate(MinAggregate, ['b', 'a']) == 'a'
+
+
+class MemoryHandler(MemoryTablesMixin, PostgresRequestHandler):
+    memory_tables = {'prices': MemoryTable(['name', 'price'], [{'name': 'a', 'price': 1.25}])}
+
+
+def test_sum_over_inserted_literals():
+    with serve(MemoryHandler) as server, Connection(server) as conn:
+        assert conn.query("insert into prices (name, price) values ('b', 2.5)").errors == []
+        response = conn.query('select sum(price), avg(price) from prices')
+        assert response.errors == []
+        assert response.rows == [['3.75', '1.875']]
+        response = conn.query('select sum(name) from prices')
+        assert response.error_codes == ['22P02']
+        # the error is raised before RowDescription is sent
+        assert response.codes == [b'E', b'Z']
+        assert conn.query('select 1').errors == []
@@ -0,0 +1,67 @@
+from postgres_proto.scram import create_scram_verifier
+from postgres_proto.socket_handler import PostgresRequestHandler
+from wire import serve, Connection
+
+
+CLEARTEXT = [3, 0]
+SCRAM = [10, 11, 12, 0]
+
+
+class PasswordHandler(PostgresRequestHandler):
+    def is_authentication_needed(self, username, database):
+        return True
+
+    def authenticate(self, username, password, database):
+        self.server.backend_checks += 1
+        return username if password == self.server.passwords.get(username) else None
+
+
+class VerifierHandler(PasswordHandler):
+    def lookup_scram_verifier(self, username, database):
+        self.server.backend_checks += 1
+        return self.server.verifiers.get(username)
+
+
+def login(server, password):
+    with Connection(server, user='alice', password=password) as conn:
+        return conn.startup.auth_requests, [e[b'C'] for e in conn.startup.errors]
+
+
+def test_cache_is_disabled_by_default():
+    with serve(PasswordHandler, passwords={'alice': 'secret'}, backend_checks=0) as server:
+        assert login(server, 'secret') == (CLEARTEXT, [])
+        assert login(server, 'secret') == (CLEARTEXT, [])
+        assert server.backend_checks == 2
+
+
+def test_cleartext_logins_keep_using_cleartext():
+    with serve(PasswordHandler, auth_cache_ttl=60, passwords={'alice': 'secret'}, backend_checks=0) as server:
+        assert login(server, 'secret') == (CLEARTEXT, [])
+        assert login(server, 'secret') == (CLEARTEXT, [])
+        assert server.backend_checks == 1
+        # passwords not matching the cached entry are checked by the backend
+        assert login(server, 'wrong') == ([3], ['28000'])
+        assert server.backend_checks == 2
+        server.passwords['alice'] = 'changed'
+        assert login(server, 'changed') == (CLEARTEXT, [])
+        assert login(server, 'changed') == (CLEARTEXT, [])
+        assert server.backend_checks == 3
+        assert login(server, 'secret') == ([3], ['28000'])
+
+
+def test_scram_logins_use_cached_verifiers():
+    verifiers = {'alice': create_scram_verifier('secret', iterations=100)}
+    with serve(VerifierHandler, auth_cache_ttl=60, verifiers=verifiers, backend_checks=0) as server:
+        assert login(server, 'secret') == (SCRAM, [])
+        assert login(server, 'secret') == (SCRAM, [])
+        assert server.backend_checks == 1
+        # failed attempts do not remove the entry
+        assert login(server, 'wrong') == ([10, 11], ['28000'])
+        assert server.backend_checks == 2
+        assert login(server, 'secret') == (SCRAM, [])
+        assert server.backend_checks == 2
+        # a failed attempt refreshes a verifier changed in the backend
+        verifiers['alice'] = create_scram_verifier('changed', iterations=100)
+        assert login(server, 'changed') == ([10, 11], ['28000'])
+        assert login(server, 'changed') == (SCRAM, [])
+        assert login(server, 'secret') == ([10, 11], ['28000'])
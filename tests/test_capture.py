@@ -0,0 +1,117 @@
+import gzip
+import io
+import time
+import pytest
+from postgres_proto.capture import read_capture, RECORD_HEADER, MESSAGE, SESSION_END, REDACTED_PASSWORD_MESSAGE
+from postgres_proto.replay import load_sessions, replay, print_report
+from postgres_proto.scram import create_scram_verifier
+from postgres_proto.socket_handler import PostgresRequestHandler
+from wire import serve, Connection, parse, bind, execute
+
+
+class RowsHandler(PostgresRequestHandler):
+    rows = [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}]
+
+    def query_tables(self, stmt_info):
+        return self.rows, ['id', 'name']
+
+
+class OtherRowsHandler(RowsHandler):
+    rows = [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'c'}]
+
+
+class PasswordHandler(RowsHandler):
+    def is_authentication_needed(self, username, database):
+        return True
+
+    def authenticate(self, username, password, database):
+        return username if password == 'secret' else None
+
+
+class VerifierHandler(PasswordHandler):
+    def lookup_scram_verifier(self, username, database):
+        return create_scram_verifier('secret', iterations=4096)
+
+
+def capture(handler, path, sessions=1, password=None):
+    with serve(handler, capture_file=str(path)) as server:
+        for _ in range(sessions):
+            with Connection(server, password=password) as conn:
+                assert conn.startup.errors == []
+                conn.query('select id, name from t')
+                conn.extended(parse('', 'select name from t where id = $1'), bind('', '', [2]), execute(''))
+        # sessions are recorded until their end is handled
+        deadline = time.monotonic() + 10
+        while sum(1 for record in read_capture(str(path)) if record[0] == SESSION_END) < sessions:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        server.wire_capture.close()
+
+
+def replay_to(handler, path, **kwargs):
+    with serve(handler) as server:
+        return replay(load_sessions(str(path)), server.server_address[:2], None, **kwargs)
+
+
+@pytest.mark.parametrize('name', ['capture.bin', 'capture.bin.gz'])
+def test_capture_and_replay(tmp_path, name):
+    path = tmp_path / name
+    capture(RowsHandler, path, sessions=2)
+    sessions = load_sessions(str(path))
+    assert len(sessions) == 2
+    # startup, 2 queries and Terminate, which has no response
+    assert [len(session.exchanges) for session in sessions] == [4, 4]
+    results = replay_to(RowsHandler, path)
+    assert [r.label for r in results if r.session_id == sessions[0].id][:3] == \
+        ['startup', 'select id, name from t', 'select name from t where id = $1']
+    assert all(r.matched and r.error is None for r in results)
+    out = io.StringIO()
+    assert print_report(results, 1, file=out)
+    assert '0 responses differ' in out.getvalue()
+
+
+def test_passwords_are_redacted(tmp_path):
+    path = tmp_path / 'capture.bin'
+    capture(PasswordHandler, path, password='secret')
+    assert b'secret' not in path.read_bytes()
+    assert (MESSAGE, REDACTED_PASSWORD_MESSAGE) in [(r[0], r[3]) for r in read_capture(str(path))]
+    # sessions are authenticated again, using cleartext or SCRAM-SHA-256
+    for handler in (PasswordHandler, VerifierHandler):
+        results = replay_to(handler, path, password='secret')
+        assert results and all(r.matched and r.error is None for r in results)
+    for handler in (PasswordHandler, VerifierHandler):
+        results = replay_to(handler, path, password='wrong')
+        assert results[0].label == 'startup' and not any(r.matched for r in results)
+
+
+def test_responses_differ(tmp_path):
+    path = tmp_path / 'capture.bin'
+    capture(RowsHandler, path)
+    results = replay_to(OtherRowsHandler, path)
+    assert [(r.label, r.matched) for r in results] == [
+        ('startup', True), ('select id, name from t', False), ('select name from t where id = $1', False)]
+    out = io.StringIO()
+    assert not print_report(results, 1, file=out)
+    assert '2 responses differ' in out.getvalue()
+
+
+def test_truncated_capture_files(tmp_path):
+    path = tmp_path / 'capture.bin'
+    capture(RowsHandler, path)
+    records = list(read_capture(str(path)))
+    data = path.read_bytes()
+    # a file still being written ends in the middle of a record
+    path.write_bytes(data[:-3])
+    assert list(read_capture(str(path))) == records[:-1]
+    path.write_bytes(data[:-RECORD_HEADER.size - 1]) # header of the Terminate message without its payload
+    assert list(read_capture(str(path))) == records[:-2]
+    path.write_bytes(data[:5])
+    assert list(read_capture(str(path))) == []
+    # compressed stream not terminated
+    gz_path = tmp_path / 'capture.bin.gz'
+    gz_path.write_bytes(gzip.compress(data)[:-20])
+    truncated = list(read_capture(str(gz_path)))
+    assert truncated == records[:len(truncated)] and len(truncated) < len(records)
+    (tmp_path / 'other').write_bytes(b'not a capture')
+    with pytest.raises(ValueError):
+        list(read_capture(str(tmp_path / 'other')))
@@ -0,0 +1,65 @@
+import pytest
+from postgres_proto.flow import PostgresError
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.cursors import parse_declare, parse_fetch
+from wire import serve, Connection
+
+
+def test_parse_fetch():
+    assert parse_fetch('c') == ('c', 1, 0)
+    assert parse_fetch('FORWARD 5 FROM c') == ('c', 5, 0)
+    assert parse_fetch('ALL IN "C"') == ('C', None, 0)
+    assert parse_fetch('RELATIVE 3 c') == ('c', 1, 2)
+    for sql in ('PRIOR c', 'BACKWARD 2 c', 'ABSOLUTE 1 c'):
+        with pytest.raises(PostgresError) as e:
+            parse_fetch(sql)
+        assert e.value.code == '55000'
+
+
+def test_parse_declare():
+    assert parse_declare('c NO SCROLL CURSOR WITH HOLD FOR select 1') == ('c', True, 'select 1')
+    with pytest.raises(PostgresError) as e:
+        parse_declare('c SCROLL CURSOR FOR select 1')
+    assert e.value.code == '0A000'
+
+
+class LazyRowsHandler(PostgresRequestHandler):
+    def query_tables(self, stmt_info):
+        def rows():
+            for i in range(1000):
+                self.server.produced += 1
+                yield {'id': i}
+        return rows(), ['id']
+
+
+def test_rows_are_read_as_fetched():
+    with serve(LazyRowsHandler, produced=0) as server, Connection(server) as conn:
+        assert conn.query('DECLARE c CURSOR FOR select id from t').error_codes == ['25P01']
+        conn.query('BEGIN')
+        assert conn.query('DECLARE c CURSOR FOR select id from t').tags == ['DECLARE CURSOR']
+        assert server.produced == 0
+        response = conn.query('FETCH 2 FROM c')
+        assert response.rows == [['0'], ['1']] and response.tags == ['FETCH 2']
+        assert server.produced == 2
+        assert conn.query('MOVE FORWARD 10 IN c').tags == ['MOVE 10']
+        assert conn.query('FETCH NEXT FROM c').rows == [['12']]
+        assert server.produced < 20
+        response = conn.query('FETCH ALL FROM c')
+        assert len(response.rows) == 987 and response.tags == ['FETCH 987']
+        assert conn.query('FETCH c').tags == ['FETCH 0']
+        assert conn.query('FETCH BACKWARD 1 c').error_codes == ['55000']
+        conn.query('ROLLBACK')
+        assert conn.query('FETCH c').error_codes == ['34000']
+
+
+def test_cursors_are_closed_at_transaction_end_unless_held():
+    with serve(LazyRowsHandler, produced=0) as server, Connection(server) as conn:
+        conn.query('BEGIN')
+        conn.query('DECLARE a CURSOR FOR select id from t')
+        conn.query('DECLARE b CURSOR WITH HOLD FOR select id from t')
+        conn.query('FETCH 5 b')
+        assert conn.query('COMMIT').errors == []
+        assert conn.query('FETCH a').error_codes == ['34000']
+        assert conn.query('FETCH 2 b').rows == [['5'], ['6']]
+        assert conn.query('CLOSE b').tags == ['CLOSE CURSOR']
+        assert conn.query('FETCH b').error_codes == ['34000']
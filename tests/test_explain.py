@@ -0,0 +1,71 @@
+import re
+import pytest
+from postgres_proto.flow import PostgresError
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.explain import parse_explain_options
+from wire import serve, Connection
+
+
+class RowsHandler(PostgresRequestHandler):
+    def query_tables(self, stmt_info):
+        return [{'id': i, 'name': f"n{i % 3}"} for i in range(10)], ['id', 'name']
+
+    def insert_rows(self, table, rows, stmt_info):
+        self.server.inserts.append(rows)
+        return len(rows)
+
+    def explain_pushdown(self, stmt_info):
+        return [f"scan of {table.name}" for table in stmt_info.tables]
+
+
+def plan(response):
+    # timings vary between runs
+    return [re.sub(r'(time[=:] ?)[\d.]+ ms', r'\1*', row[0], flags=re.I) for row in response.rows]
+
+
+def test_parse_explain_options():
+    assert parse_explain_options('analyse verbose select 1') == ({'ANALYSE', 'ANALYZE', 'VERBOSE'}, 'select 1')
+    assert parse_explain_options('(analyze true, costs off) select 1') == ({'ANALYZE'}, 'select 1')
+    with pytest.raises(PostgresError) as e:
+        parse_explain_options('analyze')
+    assert e.value.code == '42601'
+
+
+def test_explain_lists_stages():
+    with serve(RowsHandler, inserts=[]) as server, Connection(server) as conn:
+        response = conn.query('explain select name, count(*) from t where id > 2 group by name order by name limit 2')
+        assert response.errors == []
+        assert plan(response) == ['SELECT', '  ->  query_tables', '  ->  aggregate_results', '  ->  sort_results',
+                                  '  ->  format_select_results', 'Pushed down: scan of t']
+        assert plan(conn.query('explain select * from information_schema.tables')) == ['SELECT', '  ->  information_schema']
+
+
+def test_explain_analyze_counts_rows_and_bytes():
+    with serve(RowsHandler, inserts=[]) as server, Connection(server) as conn:
+        response = conn.query('explain analyze select id, name from t order by id desc limit 3')
+        assert response.errors == []
+        lines = plan(response)
+        assert lines[0] == 'SELECT  (actual time=*, rows=3)'
+        assert '  ->  query_tables  (time=*, rows out=10)' in lines
+        assert '  ->  sort_results  (time=*, rows in=10, rows out=3)' in lines
+        assert '  ->  format_select_results  (time=*, rows in=3, rows out=3)' in lines
+        # 3 DataRow messages of 18 bytes: header, field count, 1 byte id and 2 bytes name
+        assert '  ->  encode  (time=*, rows in=3, bytes=54)' in lines
+        assert lines[-2:] == ['Pushed down: scan of t', 'Execution Time: *']
+        assert [line.split('(')[0].strip() for line in lines[1:-2]] == \
+            ['->  split_sql', '->  parse_sql', '->  query_tables', '->  sort_results', '->  format_select_results', '->  encode']
+
+
+def test_explain_of_other_statements():
+    with serve(RowsHandler, inserts=[]) as server, Connection(server) as conn:
+        assert plan(conn.query('explain insert into t (id) values (1)')) == ['INSERT', '  ->  handle_insert']
+        assert server.inserts == []
+        response = conn.query('explain (analyze) insert into t (id) values (1)')
+        assert response.errors == []
+        lines = plan(response)
+        assert lines[0].startswith('INSERT 0 1  (actual time=*')
+        assert '  ->  encode  (time=*, rows in=0, bytes=0)' in lines
+        # EXPLAIN ANALYZE executes the statement
+        assert server.inserts == [[{'id': 1}]]
+        assert conn.query('explain').error_codes == ['42601']
+        assert conn.query('select 1').errors == []
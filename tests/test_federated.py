@@ -0,0 +1,105 @@
+import threading
+import time
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.federated import FederatedQueryMixin, TableSource
+from wire import serve, Connection
+
+
+class ListSource(TableSource):
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.wheres = []
+
+    def fetch_table(self, table, stmt_info):
+        self.wheres.append(stmt_info.where)
+        return self.rows, self.cols
+
+
+class HangingSource(TableSource):
+    max_workers = 1
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def fetch_table(self, table, stmt_info):
+        self.started.set()
+        self.release.wait(10)
+        return [], ['id']
+
+
+SOURCES = {
+    'a': ListSource([{'id': i, 'name': f"a{i}"} for i in range(5)], ['id', 'name']),
+    'b': ListSource([{'aid': i % 5, 'v': f"v{i}"} for i in range(10)], ['aid', 'v']),
+    'slow': HangingSource(timeout=0.2),
+    'blocked': HangingSource()
+}
+
+
+class FederatedHandler(FederatedQueryMixin, PostgresRequestHandler):
+    table_sources = SOURCES
+
+
+def test_sources_get_the_comparisons_on_their_table():
+    with serve(FederatedHandler) as server, Connection(server) as conn:
+        response = conn.query("select a.id, b.v from a join b on a.id = b.aid where a.id = 2 and b.v != 'v2'")
+        assert response.errors == []
+        assert response.rows == [['2', 'v7']]
+        assert SOURCES['a'].wheres[-1] == 'id = 2'
+        assert SOURCES['b'].wheres[-1] == "v != 'v2'"
+
+
+def test_where_is_evaluated_on_merged_tables():
+    with serve(FederatedHandler) as server, Connection(server) as conn:
+        response = conn.query("select a.name, b.v from a, b where a.id = b.aid and b.v < 'v2'")
+        assert sorted(response.rows) == [['a0', 'v0'], ['a1', 'v1']]
+        response = conn.query("select a.name from a, b where a.id = b.aid or b.v = 'v1'")
+        assert response.error_codes == ['0A000']
+
+
+def test_hanging_source_does_not_block_other_tables():
+    source = SOURCES['blocked']
+    try:
+        with serve(FederatedHandler) as server:
+            conns = [Connection(server) for _ in range(2)]
+            results = []
+            threads = [threading.Thread(target=lambda c=c: results.append(c.query('select * from blocked'))) for c in conns]
+            for thread in threads:
+                thread.start()
+            assert source.started.wait(10)
+            with Connection(server) as conn:
+                assert conn.query('select * from a').errors == []
+            # the other sessions are still waiting for the hanging source
+            assert results == [] and all(thread.is_alive() for thread in threads)
+            source.release.set()
+            for thread in threads:
+                thread.join()
+            assert [r.errors for r in results] == [[], []]
+            for conn in conns:
+                conn.close()
+    finally:
+        source.release.set()
+
+
+def test_hanging_source_times_out():
+    source = SOURCES['slow']
+    try:
+        with serve(FederatedHandler) as server:
+            conns = [Connection(server) for _ in range(3)]
+            start = time.monotonic()
+            results = []
+            threads = [threading.Thread(target=lambda c=c: results.append(c.query('select * from slow'))) for c in conns]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # queued fetches time out too, while the first one still occupies the only worker
+            assert [r.error_codes for r in results] == [['57014']] * 3
+            assert not source.release.is_set()
+            assert time.monotonic() - start < 5
+            for conn in conns:
+                conn.close()
+    finally:
+        source.release.set()
@@ -0,0 +1,50 @@
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.spill import SpillFile
+from wire import serve, Connection
+
+
+TABLES = {
+    'a': [{'id': i, 'name': f"a{i}"} for i in range(5)],
+    'b': [{'aid': i % 5, 'v': f"v{i}"} for i in range(10)]
+}
+
+
+class TablesHandler(PostgresRequestHandler):
+    def query_tables(self, stmt_info):
+        # ignores WHERE, which is then only evaluated on joined rows
+        rows = TABLES[stmt_info.tables[0].name]
+        return rows, list(rows[0].keys())
+
+
+def test_join_with_where():
+    with serve(TablesHandler) as server, Connection(server) as conn:
+        response = conn.query('select a.id, b.v from a join b on a.id = b.aid where a.id = 2')
+        assert response.errors == []
+        assert sorted(response.rows) == [['2', 'v2'], ['2', 'v7']]
+
+
+def test_join_with_where_on_both_tables_and_aliases():
+    with serve(TablesHandler) as server, Connection(server) as conn:
+        response = conn.query("select x.name, y.v from a x join b y on x.id = y.aid where x.id >= 3 and y.v <> 'v8'")
+        assert sorted(response.rows) == [['a3', 'v3'], ['a4', 'v4'], ['a4', 'v9']]
+
+
+def test_left_join_with_where_on_joined_table():
+    with serve(TablesHandler) as server, Connection(server) as conn:
+        response = conn.query("select a.id, b.v from a left join b on a.id = b.aid where b.v = 'v1'")
+        assert response.rows == [['1', 'v1']]
+
+
+def test_join_with_unsupported_where():
+    with serve(TablesHandler) as server, Connection(server) as conn:
+        response = conn.query('select a.id from a join b on a.id = b.aid where a.id = 2 or b.v = 1')
+        assert response.error_codes == ['0A000']
+
+
+def test_spilled_records_with_repeated_objects():
+    spill = SpillFile()
+    for value in ('a', 'b', 'c'):
+        value = value * 3
+        spill.write({'x': value, 'y': value})
+    assert list(spill) == [{'x': v * 3, 'y': v * 3} for v in 'abc']
+    spill.close()
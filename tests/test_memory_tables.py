@@ -0,0 +1,54 @@
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.memory_tables import MemoryTablesMixin, MemoryTable
+from wire import serve, Connection
+
+
+def create_tables():
+    return {
+        'a': MemoryTable(['id', 'name'], [{'id': i, 'name': f"a{i}"} for i in range(5)], hash_indexes=['id']),
+        'b': MemoryTable(['aid', 'v'], [{'aid': i % 5, 'v': i} for i in range(10)], sorted_indexes=['v'])
+    }
+
+
+class MemoryHandler(MemoryTablesMixin, PostgresRequestHandler):
+    def get_memory_tables(self):
+        return self.server.tables
+
+
+def connect(server):
+    server.tables = create_tables()
+    return Connection(server)
+
+
+def test_where_uses_indexes():
+    with serve(MemoryHandler) as server, connect(server) as conn:
+        assert conn.query('select name from a where id = 3').rows == [['a3']]
+        assert conn.query('select v from b where v >= 8 and aid = 3').rows == [['8']]
+        assert conn.query("select name from a where name = 'a1' and id > 0").rows == [['a1']]
+
+
+def test_unsupported_where_is_rejected():
+    with serve(MemoryHandler) as server, connect(server) as conn:
+        assert conn.query('select * from a where id = 1 or id = 2').error_codes == ['0A000']
+        assert conn.query("select * from a where lower(name) = 'a1'").error_codes == ['0A000']
+        assert conn.query('delete from a where id = 1 or id = 2').error_codes == ['0A000']
+        assert len(conn.query('select * from a').rows) == 5
+
+
+def test_where_on_multiple_tables():
+    with serve(MemoryHandler) as server, connect(server) as conn:
+        response = conn.query('select a.name, b.v from a, b where a.id = b.aid and b.v > 6')
+        assert response.errors == []
+        assert sorted(response.rows) == [['a2', '7'], ['a3', '8'], ['a4', '9']]
+        response = conn.query('select a.name, b.v from a join b on a.id = b.aid where a.id = 1')
+        assert sorted(response.rows) == [['a1', '1'], ['a1', '6']]
+        assert conn.query('select * from a, b where a.id = 1 or b.v = 2').error_codes == ['0A000']
+
+
+def test_writes():
+    with serve(MemoryHandler) as server, connect(server) as conn:
+        assert conn.query("insert into a (id, name) values (5, 'a5'), (6, 'a6')").tags == ['INSERT 0 2']
+        assert conn.query("update a set name = 'x' where id >= 5").tags == ['UPDATE 2']
+        assert conn.query('select name from a where id = 6').rows == [['x']]
+        assert conn.query('delete from a where id = 6').tags == ['DELETE 1']
+        assert conn.query('select id from a where id = 6').rows == []
@@ -0,0 +1,54 @@
+import struct
+import threading
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.notifications import notify
+from wire import serve, Connection
+
+
+class ThreadCheckingHandler(PostgresRequestHandler):
+    def handle_session_ready(self):
+        self.thread_ident = threading.get_ident()
+        super().handle_session_ready()
+
+    def send_pending_notifications(self):
+        if self.pending_notifications:
+            self.server.sent_by_session_thread.append(threading.get_ident() == self.thread_ident)
+        super().send_pending_notifications()
+
+
+def read_notification(conn):
+    code, data = conn.read_message()
+    assert code == b'A'
+    pid = struct.unpack('!i', data[:4])[0]
+    return [pid] + [value.decode() for value in data[4:].split(b'\x00')[:2]]
+
+
+def test_idle_sessions_receive_notifications_from_their_thread():
+    with serve(ThreadCheckingHandler, sent_by_session_thread=[]) as server:
+        with Connection(server) as listener, Connection(server) as publisher:
+            assert listener.query('LISTEN "Orders"').errors == []
+            assert publisher.query("NOTIFY \"Orders\", 'it''s new'").errors == []
+            assert read_notification(listener)[1:] == ['Orders', "it's new"]
+            notify(server, 'Orders')
+            assert read_notification(listener) == [0, 'Orders', '']
+            assert server.sent_by_session_thread and all(server.sent_by_session_thread)
+            # the session keeps answering queries
+            assert listener.query('UNLISTEN *').errors == []
+
+
+def test_notifications_are_sent_on_commit():
+    with serve(PostgresRequestHandler) as server:
+        with Connection(server) as listener, Connection(server) as publisher:
+            listener.query('LISTEN t')
+            publisher.query('BEGIN')
+            publisher.query("NOTIFY t, 'rolled back'")
+            publisher.query('ROLLBACK')
+            publisher.query('BEGIN')
+            publisher.query("NOTIFY t, 'committed'")
+            # not sent until COMMIT
+            assert listener.query('LISTEN other').notifications == []
+            assert publisher.query('COMMIT').errors == []
+            assert read_notification(listener)[1:] == ['t', 'committed']
+            # notifications of a session are sent to itself after its command
+            assert listener.query("NOTIFY t, 'self'").errors == []
+            assert read_notification(listener)[1:] == ['t', 'self']
@@ -0,0 +1,105 @@
+from functools import partial
+import pytest
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler import parallel
+from postgres_proto.socket_handler.parallel import ParallelScanMixin, ScanSource, split_file, read_csv_header, read_csv_range
+from wire import serve, Connection
+
+
+ROWS = [{'id': i, 'grp': f"g{i % 4}", 'val': (i * 37) % 101} for i in range(300)]
+
+
+class CsvScanHandler(ParallelScanMixin, PostgresRequestHandler):
+    scan_workers = 2
+    scan_chunk_size = 512 # bytes, about 40 rows per range
+    sort_max_memory_rows = 50
+
+    def get_scan_source(self, table):
+        fieldnames, start = read_csv_header(self.server.csv_path)
+        return ScanSource(partial(read_csv_range, fieldnames=fieldnames),
+                          split_file(self.server.csv_path, self.scan_chunk_size, start), fieldnames)
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    path = tmp_path_factory.mktemp('parallel') / 'data.csv'
+    path.write_text('id,grp,val\n' + ''.join(f"{r['id']},{r['grp']},{r['val']}\n" for r in ROWS))
+    with serve(CsvScanHandler, csv_path=str(path)) as server:
+        yield server
+        server.scan_executor.shutdown()
+
+
+def test_split_file_at_line_boundaries(server):
+    fieldnames, start = read_csv_header(server.csv_path)
+    ranges = split_file(server.csv_path, 512, start)
+    assert len(ranges) > 5
+    assert [r.start for r in ranges[1:]] == [r.end for r in ranges[:-1]]
+    rows = [row for r in ranges for row in read_csv_range(*r, fieldnames=fieldnames)]
+    assert [int(row['id']) for row in rows] == list(range(300))
+
+
+def test_aggregates_are_merged(server):
+    with Connection(server) as conn:
+        response = conn.query('select grp, count(*), sum(val), max(id) from t where id >= 100 group by grp order by grp')
+        assert response.errors == []
+        expected = []
+        for grp in ('g0', 'g1', 'g2', 'g3'):
+            rows = [r for r in ROWS if r['grp'] == grp and r['id'] >= 100]
+            expected.append([grp, str(len(rows)), str(sum(r['val'] for r in rows)), str(max(r['id'] for r in rows))])
+        assert response.rows == expected
+        assert conn.query('select count(*) from t where id < 0').rows == [['0']]
+
+
+def test_ordered_merge_spills(server, monkeypatch):
+    spills = []
+
+    class CountedSpillFile(parallel.SpillFile):
+        def __init__(self, *args):
+            super().__init__(*args)
+            spills.append(self)
+
+    monkeypatch.setattr(parallel, 'SpillFile', CountedSpillFile)
+    with Connection(server) as conn:
+        response = conn.query('select id, val from t where grp != \'g3\' order by val desc, id')
+        assert response.errors == []
+        expected = sorted((r for r in ROWS if r['grp'] != 'g3'), key=lambda r: (-r['val'], r['id']))
+        assert response.rows == [[str(r['id']), str(r['val'])] for r in expected]
+        assert spills and all(spill.file.closed for spill in spills)
+
+
+def test_unordered_rows_are_streamed(server):
+    with Connection(server) as conn:
+        response = conn.query('select id from t where val < 50')
+        assert response.errors == []
+        assert sorted(int(row[0]) for row in response.rows) == [r['id'] for r in ROWS if r['val'] < 50]
+
+
+def test_limit_and_offset(server):
+    with Connection(server) as conn:
+        response = conn.query('select id from t order by id desc limit 5 offset 3')
+        assert response.rows == [[str(i)] for i in range(296, 291, -1)]
+        response = conn.query('select id from t limit 7 offset 2')
+        assert len(response.rows) == 7
+        assert conn.query('select grp, count(*) from t group by grp order by grp limit 1 offset 1').rows == [['g1', '75']]
+        assert conn.query('select id from t limit -1').error_codes == ['2201W']
+        assert conn.query('select id from t order by id offset -1').error_codes == ['2201X']
+        assert conn.query('select count(*) from t limit -1').error_codes == ['2201W']
+        assert conn.query('select id from t where id = 1').rows == [['1']]
+
+
+def test_explain(server):
+    with Connection(server) as conn:
+        ranges = len(split_file(server.csv_path, 512, read_csv_header(server.csv_path)[1]))
+        response = conn.query('explain select id from t where id > 3 order by id limit 2')
+        assert [row[0] for row in response.rows] == [
+            'SELECT', '  ->  parallel_scan', '  ->  format_select_results',
+            f"Pushed down: {ranges} ranges scanned by 2 workers (WHERE, ORDER BY with LIMIT in workers)"]
+        response = conn.query('explain select grp, count(*) from t group by grp order by grp')
+        assert [row[0] for row in response.rows] == [
+            'SELECT', '  ->  parallel_scan', '  ->  sort_results', '  ->  format_select_results',
+            f"Pushed down: {ranges} ranges scanned by 2 workers (partial aggregates in workers)"]
+        response = conn.query('explain analyze select id from t where id < 10')
+        lines = [row[0] for row in response.rows]
+        assert lines[0].startswith('SELECT  (actual time=') and lines[0].endswith('rows=10)')
+        assert lines[3].startswith('  ->  parallel_scan  (time=') and lines[3].endswith('rows out=10)')
+        assert lines[-2] == f"Pushed down: {ranges} ranges scanned by 2 workers (WHERE in workers)"
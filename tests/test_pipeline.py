@@ -0,0 +1,56 @@
+import struct
+from postgres_proto.flow import PostgresError
+from postgres_proto.socket_handler import PostgresRequestHandler
+from wire import serve, Connection, parse, bind, describe, execute, sync
+
+
+class FailingHandler(PostgresRequestHandler):
+    def query_tables(self, stmt_info):
+        if stmt_info.params and stmt_info.params[0] == 2:
+            raise PostgresError("cannot query 2", code="XX000")
+        return [{'id': stmt_info.params[0] if stmt_info.params else 0}], ['id']
+
+
+class UnbatchedHandler(FailingHandler):
+    batch_executions = False
+
+
+QUERY = 'select id from t where id = $1'
+
+
+def test_results_before_an_error_are_sent():
+    with serve(FailingHandler) as server, Connection(server) as conn:
+        response = conn.extended(parse('s', QUERY, [23]),
+                                 bind('', 's', [1]), execute(''),
+                                 bind('', 's', [2]), execute(''),
+                                 bind('', 's', [3]), execute(''))
+        assert response.codes == [b'1', b'2', b'D', b'C', b'2', b'E', b'Z']
+        assert response.rows == [['1']]
+        assert response.error_codes == ['XX000']
+
+
+def test_messages_are_discarded_until_sync():
+    for handler in (FailingHandler, UnbatchedHandler):
+        with serve(handler) as server, Connection(server) as conn:
+            response = conn.extended(parse('s', QUERY, [23]), bind('', 's', [2]), execute(''),
+                                     parse('other', 'select 1'), bind('', 's', [1]), describe(b'P', ''), execute(''))
+            assert response.error_codes == ['XX000']
+            assert response.rows == []
+            assert b'1' not in response.codes[1:]
+            # the session is usable after Sync
+            response = conn.extended(bind('', 's', [3]), execute(''))
+            assert response.errors == []
+            assert response.rows == [['3']]
+
+
+def test_failed_bind_does_not_execute_previous_portal():
+    for handler in (FailingHandler, UnbatchedHandler):
+        with serve(handler) as server, Connection(server) as conn:
+            response = conn.extended(parse('s', QUERY, [23]), bind('p', 's', [1]), execute('p'))
+            assert response.rows == [['1']]
+            response = conn.extended(bind('p', 's', [b'x']), execute('p'))
+            assert response.codes == [b'E', b'Z']
+            assert response.error_codes == ['22P02']
+            conn.send(execute('p'), sync())
+            response = conn.read_response()
+            assert response.error_codes != [] and response.rows == []
@@ -0,0 +1,137 @@
+import threading
+import time
+import pytest
+from postgres_proto.flow import PostgresError
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.pooling import ResourcePool
+from wire import serve, Connection, parse, bind, execute, sync, flush
+
+
+class Resource(object):
+    def __init__(self, n):
+        self.n = n
+        self.broken = False
+        self.closed = False
+        self.rollbacks = 0
+
+    def close(self):
+        self.closed = True
+
+
+class PoolHandler(PostgresRequestHandler):
+    def create_pooled_resource(self):
+        resource = Resource(len(self.server.resources))
+        self.server.resources.append(resource)
+        return resource
+
+    def reset_pooled_resource(self, resource):
+        if resource.broken:
+            raise ValueError('broken resource')
+
+    def rollback_transaction(self):
+        self.pooled_resource.rollbacks += 1
+
+    def query_tables(self, stmt_info):
+        resource = self.pooled_resource
+        if stmt_info.tables[0].name == 'broken':
+            resource.broken = True
+        return [{'n': resource.n}], ['n']
+
+
+def wait_until(predicate):
+    deadline = time.monotonic() + 10
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_waiters_are_served_in_arrival_order():
+    pool = ResourcePool(1, timeout=10)
+    resource = pool.acquire(object)
+    served = []
+
+    def wait(i):
+        served.append((i, pool.acquire(object)))
+        pool.release(served[-1][1])
+
+    threads = []
+    for i in range(4):
+        threads.append(threading.Thread(target=wait, args=(i,)))
+        threads[-1].start()
+        wait_until(lambda: pool.stats()['waiting'] == i + 1)
+    pool.release(resource)
+    for thread in threads:
+        thread.join()
+    assert [i for i, _ in served] == [0, 1, 2, 3]
+    assert all(r is resource for _, r in served)
+    assert pool.stats()['size'] == 1 and pool.stats()['waits'] == 4
+
+
+def test_waiting_times_out():
+    pool = ResourcePool(1, timeout=0.05)
+    pool.acquire(object)
+    with pytest.raises(PostgresError) as e:
+        pool.acquire(object)
+    assert e.value.code == '53300'
+    with pytest.raises(PostgresError):
+        pool.acquire(object, timeout=0)
+    assert pool.stats()['timeouts'] == 2
+    assert pool.stats()['waiting'] == 0
+
+
+def test_resource_is_held_until_the_end_of_the_transaction():
+    with serve(PoolHandler, resources=[], pool_size=1, pool_timeout=0) as server, \
+            Connection(server) as conn, Connection(server) as other:
+        assert conn.query('select n from t').rows == [['0']]
+        # resources are returned once ReadyForQuery is sent
+        wait_until(lambda: server.resource_pool.stats()['idle'] == 1)
+        conn.query('BEGIN')
+        assert conn.query('select n from t').rows == [['0']]
+        assert server.resource_pool.stats()['active'] == 1
+        # pool_timeout=0 does not wait for the resource
+        assert other.query('select n from t').error_codes == ['53300']
+        assert conn.query('COMMIT').errors == []
+        wait_until(lambda: server.resource_pool.stats()['idle'] == 1)
+        assert other.query('select n from t').rows == [['0']]
+        wait_until(lambda: server.resource_pool.stats()['idle'] == 1)
+        # released on Sync, not Flush
+        other.send(parse('', 'select n from t'), bind('', ''), execute(''), flush())
+        wait_until(lambda: server.resource_pool.stats()['active'] == 1)
+        other.send(sync())
+        assert other.read_response().rows == [['0']]
+        wait_until(lambda: server.resource_pool.stats()['idle'] == 1)
+        assert len(server.resources) == 1
+
+
+def test_resources_failing_reset_are_discarded():
+    with serve(PoolHandler, resources=[], pool_size=1) as server, Connection(server) as conn:
+        assert conn.query('select n from broken').rows == [['0']]
+        wait_until(lambda: server.resource_pool.stats()['size'] == 0)
+        assert server.resources[0].closed
+        assert conn.query('select n from t').rows == [['1']]
+
+
+def test_session_end_rolls_back_and_releases():
+    with serve(PoolHandler, resources=[], pool_size=1) as server:
+        with Connection(server) as conn:
+            conn.query('BEGIN')
+            conn.query('select n from t')
+        wait_until(lambda: server.resource_pool.stats()['idle'] == 1)
+        assert server.resources[0].rollbacks == 1
+        with Connection(server) as conn:
+            conn.query('BEGIN')
+            conn.query('select n from broken')
+        wait_until(lambda: server.resource_pool.stats()['size'] == 0)
+        assert server.resources[0].closed
+
+
+class NoPoolHandler(PostgresRequestHandler):
+    def query_tables(self, stmt_info):
+        return [{'n': self.pooled_resource}], ['n']
+
+
+def test_missing_create_pooled_resource():
+    with serve(NoPoolHandler) as server, Connection(server) as conn:
+        assert conn.query('select n from t').errors[0][b'M'] == 'resource pooling not supported'
+        assert conn.query('BEGIN').errors == []
+        assert server.resource_pool.stats()['size'] == 0
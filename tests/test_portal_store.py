@@ -0,0 +1,65 @@
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.portal_store import PortalResultStore, MemoryBudget
+from postgres_proto.stream import PostgresBuffer
+from wire import serve, Connection, parse, bind, describe, execute
+
+
+ROWS = [{'id': i, 'name': f"name {i}"} for i in range(2000)]
+
+
+def encoded(rows):
+    buf = PostgresBuffer()
+    buf.write_data_rows([list(row.values()) for row in rows])
+    return buf.getvalue()
+
+
+def test_results_within_budget_stay_in_memory():
+    budget = MemoryBudget(1024 * 1024)
+    store = PortalResultStore(budget)
+    store['p'] = ('SELECT', [list(row.values()) for row in ROWS[:10]], ['id', 'name'])
+    assert not store['p'].spilled
+    assert store['p'].nb_rows == 10
+    assert store['p'].open_rows().read() == encoded(ROWS[:10])
+    assert budget.used == store['p'].reserved > 0
+    store.pop('p')
+    assert budget.used == 0
+
+
+def test_results_over_budget_are_spilled(tmp_path):
+    server_budget = MemoryBudget(None)
+    budget = MemoryBudget(4096, server_budget)
+    store = PortalResultStore(budget, str(tmp_path))
+    store['p'] = ('SELECT', [list(row.values()) for row in ROWS], ['id', 'name'])
+    result = store['p']
+    assert result.spilled
+    assert result.nb_rows == len(ROWS)
+    assert result.open_rows().read() == encoded(ROWS)
+    assert budget.used == server_budget.used == 0
+    store.clear()
+    assert result.data.closed
+
+
+def test_server_budget_is_shared_by_sessions():
+    server_budget = MemoryBudget(1000)
+    first = PortalResultStore(MemoryBudget(None, server_budget))
+    second = PortalResultStore(MemoryBudget(None, server_budget))
+    first['p'] = ('SELECT', [[1, 'x' * 600]], ['id', 'name'])
+    second['p'] = ('SELECT', [[1, 'x' * 600]], ['id', 'name'])
+    assert not first['p'].spilled
+    assert second['p'].spilled
+
+
+class RowsHandler(PostgresRequestHandler):
+    portal_results_memory_limit = 4096
+
+    def query_tables(self, stmt_info):
+        return ROWS, ['id', 'name']
+
+
+def test_spilled_portal_results_are_sent():
+    with serve(RowsHandler) as server, Connection(server) as conn:
+        response = conn.extended(parse('', 'select id, name from t'), bind('', ''), describe(b'P', ''), execute(''))
+        assert response.errors == []
+        assert response.rows == [[str(row['id']), row['name']] for row in ROWS]
+        assert response.tags == ['SELECT']
+        assert server.portal_results_budget.used == 0
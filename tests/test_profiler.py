@@ -0,0 +1,29 @@
+import os
+from postgres_proto.socket_handler import PostgresRequestHandler
+from wire import serve, Connection
+
+
+class AuthHandler(PostgresRequestHandler):
+    def is_authentication_needed(self, username, database):
+        return True
+
+    def authenticate(self, username, password, database):
+        return username if password == 'secret' else None
+
+
+def test_authenticated_admin_users_control_the_profiler(tmp_path):
+    with serve(AuthHandler, admin_users=['admin'], profile_dir=str(tmp_path)) as server:
+        with Connection(server, user='admin', password='secret') as admin, \
+                Connection(server, user='other', password='secret') as other:
+            assert other.query('select pg_profiler_start()').error_codes == ['42501']
+            assert admin.query('select pg_profiler_start()').rows == [[str(tmp_path)]]
+            assert server.profiler.running
+            path = admin.query('select pg_profiler_stop()').rows[0][0]
+            assert os.path.dirname(path) == str(tmp_path) and os.path.exists(path)
+
+
+def test_profiler_cannot_be_controlled_without_authentication(tmp_path):
+    with serve(PostgresRequestHandler, admin_users=['admin'], profile_dir=str(tmp_path)) as server:
+        with Connection(server, user='admin') as admin:
+            assert admin.query('select pg_profiler_start()').error_codes == ['42501']
+            assert getattr(server, 'profiler', None) is None or not server.profiler.running
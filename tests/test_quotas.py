@@ -0,0 +1,53 @@
+import threading
+import time
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.quotas import TokenBucket
+from wire import serve, Connection, parse, bind, describe, execute
+
+
+def test_token_bucket_capacity_is_at_least_one():
+    bucket = TokenBucket(0.5)
+    assert bucket.consume()
+    assert not bucket.consume()
+    bucket = TokenBucket(10, 2)
+    assert bucket.consume() and bucket.consume()
+    assert not bucket.consume()
+
+
+class SlowRowsHandler(PostgresRequestHandler):
+    def query_tables(self, stmt_info):
+        def rows():
+            # results are generated while being sent
+            self.server.sending.set()
+            time.sleep(0.3)
+            yield {'id': 1}
+        return rows(), ['id']
+
+
+def test_rate_limit():
+    with serve(SlowRowsHandler, queries_per_second=0.5, sending=threading.Event()) as server, Connection(server) as conn:
+        assert conn.query('select id from t').errors == []
+        assert conn.query('select id from t').error_codes == ['53400']
+
+
+def test_connections_per_user():
+    with serve(SlowRowsHandler, max_connections_per_user=1) as server, Connection(server) as conn:
+        with Connection(server) as other:
+            assert [e[b'C'] for e in other.startup.errors] == ['53300']
+        with Connection(server, user='other') as other:
+            assert other.startup.errors == []
+
+
+def test_statement_slots_are_held_while_sending_results():
+    with serve(SlowRowsHandler, max_inflight_statements=1, sending=threading.Event()) as server:
+        with Connection(server) as first, Connection(server) as second:
+            thread = threading.Thread(target=lambda: first.query('select id from t'))
+            thread.start()
+            assert server.sending.wait(5)
+            assert second.query('select id from t').error_codes == ['53300']
+            thread.join()
+            assert second.query('select id from t').rows == [['1']]
+            # slots are also released once portal results are stored
+            response = second.extended(parse('', 'select id from t'), bind('', ''), describe(b'P', ''), execute(''))
+            assert response.rows == [['1']]
+            assert first.query('select id from t').rows == [['1']]
@@ -0,0 +1,77 @@
+import pytest
+from postgres_proto.flow import PostgresError
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.sorting import OrderByExpr, parse_limit, sort_rows
+from wire import serve, Connection, parse, bind, execute
+
+
+ROWS = [{'id': i, 'name': f"name {i % 7}", 'v': None if i % 5 == 0 else i % 3} for i in range(50)]
+
+
+def ids(rows):
+    return [row['id'] for row in rows]
+
+
+def test_order_by_mixed_directions_and_nulls():
+    order_by = [OrderByExpr('v', False, False), OrderByExpr('id', True, False)]
+    expected = sorted(ROWS, key=lambda r: (r['v'] is None, r['v'] or 0, -r['id']))
+    assert ids(sort_rows(ROWS, order_by)) == ids(expected)
+    nulls_first = ids(sort_rows(ROWS, [OrderByExpr('v', False, True), OrderByExpr('id', False, False)]))
+    assert nulls_first[:10] == [i for i in range(50) if i % 5 == 0]
+
+
+def test_top_k_matches_full_sort():
+    order_by = [OrderByExpr('name', True, True), OrderByExpr('id', False, False)]
+    full = ids(sort_rows(ROWS, order_by))
+    assert ids(sort_rows(ROWS, order_by, limit=5)) == full[:5]
+    assert ids(sort_rows(ROWS, order_by, limit=5, offset=3)) == full[3:8]
+    assert ids(sort_rows(ROWS, order_by, limit=0)) == []
+
+
+def test_external_sort_spills_runs(tmp_path):
+    order_by = [OrderByExpr('name', False, False), OrderByExpr('id', True, False)]
+    expected = ids(sort_rows(ROWS, order_by))
+    assert ids(sort_rows(iter(ROWS), order_by, max_memory_rows=8, spill_dir=str(tmp_path))) == expected
+    assert ids(sort_rows(iter(ROWS), order_by, offset=45, max_memory_rows=8, spill_dir=str(tmp_path))) == expected[45:]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_limit_and_offset_without_order_by():
+    assert ids(sort_rows(iter(ROWS), [], limit=3, offset=2)) == [2, 3, 4]
+    assert ids(sort_rows(iter(ROWS), [], offset=48)) == [48, 49]
+
+
+def test_invalid_limits():
+    assert parse_limit('ALL', 'LIMIT') is None
+    assert parse_limit('0', 'OFFSET') == 0
+    for value, clause, code in (('-1', 'LIMIT', '2201W'), ('-2', 'OFFSET', '2201X'), ('x', 'LIMIT', '42601')):
+        with pytest.raises(PostgresError) as e:
+            parse_limit(value, clause)
+        assert e.value.code == code
+
+
+class RowsHandler(PostgresRequestHandler):
+    sort_max_memory_rows = 8
+
+    def query_tables(self, stmt_info):
+        return iter(ROWS), ['id', 'name', 'v']
+
+
+def test_order_by_limit_offset_queries():
+    with serve(RowsHandler) as server, Connection(server) as conn:
+        response = conn.query('select id from t order by name desc, id limit 3 offset 1')
+        assert response.errors == []
+        assert response.rows == [['13'], ['20'], ['27']]
+        response = conn.query('select id, name from t order by 2, id desc offset 48')
+        assert response.rows == [['13', 'name 6'], ['6', 'name 6']]
+        response = conn.extended(parse('', 'select id from t order by id limit $1 offset $2'), bind('', '', [2, 10]),
+                                 execute(''))
+        assert response.rows == [['10'], ['11']]
+
+
+def test_negative_limits_are_errors():
+    with serve(RowsHandler) as server, Connection(server) as conn:
+        assert conn.query('select id from t order by id limit -1').error_codes == ['2201W']
+        assert conn.query('select id from t order by id offset -1').error_codes == ['2201X']
+        assert conn.query('select id from t offset -2').error_codes == ['2201X']
+        assert conn.query('select id from t order by id limit 1').rows == [['0']]
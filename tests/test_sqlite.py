@@ -0,0 +1,75 @@
+import sqlite3
+import pytest
+from postgres_proto.backends.sqlite import SQLiteRequestHandler, translate_select
+from postgres_proto.sql import parse_sql
+from wire import serve, Connection, parse, bind, describe, execute
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'test.db')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT NOT NULL, team_id INTEGER);
+        CREATE TABLE teams (id INTEGER PRIMARY KEY, name TEXT);
+        INSERT INTO teams VALUES (1, 'Red'), (2, 'Blue');
+        INSERT INTO users VALUES (1, 'Ann', 1), (2, 'Bob', 2), (3, 'Cid', 1), (4, 'Dee', NULL);
+    """)
+    conn.close()
+    return path
+
+
+def test_select_is_pushed_down():
+    stmt_type, stmt_info = parse_sql("select 'Hello', lower('ABC'), \"Name\" as n from users where id > 1 order by id limit 2")
+    sql, args = translate_select(stmt_info)
+    assert sql == "SELECT 'Hello', lower('ABC') AS \"lower\", \"Name\" AS \"n\" FROM \"users\" WHERE id > 1 ORDER BY id LIMIT 2"
+
+
+def test_select(database):
+    with serve(SQLiteRequestHandler, sqlite_database=database) as server, Connection(server) as conn:
+        response = conn.query("select 'Hello', lower('ABC') from users where id = 1")
+        assert response.errors == []
+        assert response.rows == [['Hello', 'abc']]
+        response = conn.query('select t.name, count(*) as members from users u join teams t on u.team_id = t.id '
+                              'group by t.name order by members desc, t.name')
+        assert response.rows == [['Red', '2'], ['Blue', '1']]
+        response = conn.query('select name from users order by id limit 2 offset 1')
+        assert response.rows == [['Bob'], ['Cid']]
+        assert conn.query('select team_id from users where id = 4').rows == [[None]]
+
+
+def test_bound_parameters(database):
+    with serve(SQLiteRequestHandler, sqlite_database=database) as server, Connection(server) as conn:
+        response = conn.extended(parse('', 'select name from users where team_id = $1 and id > $2 order by id limit $3'),
+                                 bind('', '', [1, 0, 5]), describe(b'P', ''), execute(''))
+        assert response.errors == []
+        assert response.rows == [['Ann'], ['Cid']]
+
+
+def test_writes(database):
+    with serve(SQLiteRequestHandler, sqlite_database=database) as server, Connection(server) as conn:
+        assert conn.query("insert into users (id, name) values (5, 'Eve')").tags == ['INSERT 0 1']
+        response = conn.extended(parse('', 'update users set team_id = $1 where id = $2'), bind('', '', [2, 5]), execute(''))
+        assert response.tags == ['UPDATE 1']
+        assert conn.query('delete from users where team_id = 2 returning name').rows == [['Bob'], ['Eve']]
+        conn.query('BEGIN')
+        assert conn.query('delete from users').tags == ['DELETE 3']
+        assert conn.query('ROLLBACK').errors == []
+        assert conn.query('select count(*) from users').rows == [['3']]
+
+
+def test_errors(database):
+    with serve(SQLiteRequestHandler, sqlite_database=database) as server, Connection(server) as conn:
+        assert conn.query('select name from nope').error_codes == ['42P01']
+        assert conn.query('select nope from users').error_codes == ['42703']
+        assert conn.query("insert into users (id, name) values (1, 'Ann')").error_codes == ['23505']
+        assert conn.query('insert into users (id) values (6)').error_codes == ['23502']
+        assert conn.query('select name from users where id = 1').rows == [['Ann']]
+
+
+def test_information_schema(database):
+    with serve(SQLiteRequestHandler, sqlite_database=database) as server, Connection(server) as conn:
+        response = conn.query('select table_name from information_schema.tables')
+        assert sorted(response.rows) == [['teams'], ['users']]
+        response = conn.query("select column_name from information_schema.columns where table_name = 'users'")
+        assert response.rows == [['id'], ['name'], ['team_id']]
@@ -0,0 +1,39 @@
+from postgres_proto.socket_handler import PostgresRequestHandler
+from wire import serve, Connection
+
+
+class RowsHandler(PostgresRequestHandler):
+    def is_authentication_needed(self, username, database):
+        return True
+
+    def authenticate(self, username, password, database):
+        return username if password == 'secret' else None
+
+    def query_tables(self, stmt_info):
+        return [{'id': 1}], ['id']
+
+
+ACTIVITY = "select usename, query from pg_stat_activity where usename = 'alice'"
+
+
+def test_queries_of_other_users_are_hidden():
+    with serve(RowsHandler, admin_users=['admin']) as server:
+        with Connection(server, user='alice', password='secret') as alice, Connection(server, user='bob', password='secret') as bob, \
+                Connection(server, user='admin', password='secret') as admin:
+            assert alice.query('select id from t').errors == []
+            assert alice.query(ACTIVITY).rows == [['alice', ACTIVITY]]
+            assert bob.query(ACTIVITY).rows == [['alice', '<insufficient privilege>']]
+            assert admin.query(ACTIVITY).rows == [['alice', ACTIVITY]]
+            statements = "select query from pg_stat_statements where userid = 'alice'"
+            assert set(map(tuple, bob.query(statements).rows)) == {('<insufficient privilege>',)}
+            assert ['select id from t'] in admin.query(statements).rows
+
+
+def test_only_admin_users_reset_statistics():
+    with serve(RowsHandler, admin_users=['admin']) as server:
+        with Connection(server, user='alice', password='secret') as alice, Connection(server, user='admin', password='secret') as admin:
+            alice.query('select id from t')
+            assert alice.query('select pg_stat_statements_reset()').error_codes == ['42501']
+            assert admin.query("select count(*) from pg_stat_statements where userid = 'alice'").rows != [['0']]
+            assert admin.query('select pg_stat_statements_reset()').errors == []
+            assert admin.query("select count(*) from pg_stat_statements where userid = 'alice'").rows == [['0']]
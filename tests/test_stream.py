@@ -0,0 +1,47 @@
+import struct
+from array import array
+from io import BytesIO
+import pytest
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.stream import PostgresBuffer, ColumnBatch
+from wire import serve, Connection, decode_row
+
+
+def test_read_strings_of_payload():
+    body = b'portal\x00\x00stmt\x00' + struct.pack('!h', 2)
+    buf = PostgresBuffer(BytesIO(struct.pack('!i', len(body) + 4) + body))
+    payload = buf.read_payload()
+    assert [payload.read_string(), payload.read_string(), payload.read_string()] == ['portal', '', 'stmt']
+    assert payload.read_int16() == 2
+    assert payload.read_string() == ''
+
+
+def test_unsigned_64_bits_columns_are_numeric():
+    numpy = pytest.importorskip('numpy')
+    values = [0, 2 ** 63, 2 ** 64 - 1]
+    batch = ColumnBatch(['q', 'u8', 'u4'], [array('Q', values), numpy.array(values, dtype=numpy.uint64),
+                                            numpy.array([1, 2, 3], dtype=numpy.uint32)])
+    assert [(c.type_id, c.type_size) for c in batch.column_defs()] == [(1700, -1), (1700, -1), (20, 8)]
+    buf = PostgresBuffer()
+    buf.write_data_rows(batch)
+    data = buf.getvalue()
+    rows = []
+    while data:
+        length = struct.unpack('!i', data[1:5])[0]
+        rows.append(decode_row(data[5:length + 1]))
+        data = data[length + 1:]
+    assert rows == [['0', '0', '1'], [str(2 ** 63)] * 2 + ['2'], [str(2 ** 64 - 1)] * 2 + ['3']]
+
+
+class BatchHandler(PostgresRequestHandler):
+    def query_tables(self, stmt_info):
+        return ColumnBatch(['id', 'name'], [array('q', [1, 2]), ['a', 'b']]), ['id', 'name']
+
+
+def test_unknown_column_of_batch():
+    with serve(BatchHandler) as server, Connection(server) as conn:
+        assert conn.query('select name, id from b').rows == [['a', '1'], ['b', '2']]
+        response = conn.query('select nope from b')
+        assert response.error_codes == ['42703']
+        assert response.errors[0][b'M'] == 'column "nope" does not exist'
+        assert conn.query('select id from b').rows == [['1'], ['2']]
@@ -0,0 +1,83 @@
+import json
+import time
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler import tracing
+from postgres_proto.socket_handler.explain import NULL_STAGE
+from postgres_proto.socket_handler.tracing import NULL_SPAN
+from wire import serve, Connection
+
+
+class RowsHandler(PostgresRequestHandler):
+    def query_tables(self, stmt_info):
+        return [{'id': i} for i in range(3)], ['id']
+
+
+def read_lines(path, predicate):
+    # spans and statements are written once the response is sent
+    deadline = time.monotonic() + 10
+    while True:
+        lines = [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+        if predicate(lines):
+            return lines
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_spans_are_exported(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    with serve(RowsHandler, trace_file=str(path)) as server, Connection(server, user='tracer') as conn:
+        assert conn.query('select id from t').rows == [['0'], ['1'], ['2']]
+        spans = read_lines(path, lambda spans: any(s['name'] == 'execute_command' and s['attributes']['command'] == 'Q'
+                                                   for s in spans))
+    by_name = {s['name']: s for s in spans}
+    assert by_name['session_init']['parent_id'] is None
+    assert by_name['session_init']['attributes'] == {'user': 'tracer', 'database': 'test'}
+    command = by_name['execute_command']
+    assert command['parent_id'] is None and command['attributes']['user'] == 'tracer'
+    parents = {s['name']: next((p['name'] for p in spans if p['span_id'] == s['parent_id']), None) for s in spans}
+    assert parents == {
+        'session_init': None,
+        'execute_command': None,
+        'execute_query': 'execute_command',
+        'split_sql': 'execute_query',
+        'parse_sql': 'execute_query',
+        'execute_handler': 'execute_query',
+        'query_tables': 'execute_handler',
+        'format_select_results': 'execute_handler',
+        'send_results': 'execute_command'
+    }
+    assert {s['trace_id'] for s in spans if s['name'] != 'session_init'} == {command['trace_id']}
+    assert by_name['format_select_results']['attributes']['rows'] == 3
+    assert by_name['send_results']['attributes']['bytes'] > 0
+    assert all(s['duration_ms'] >= 0 for s in spans)
+
+
+def test_slow_query_log(tmp_path):
+    path = tmp_path / 'slow.jsonl'
+    with serve(RowsHandler, slow_query_log=str(path), slow_query_threshold=0) as server, \
+            Connection(server, user='slow', application_name='app') as conn:
+        conn.query('select id from t')
+        records = read_lines(path, lambda records: len(records) == 1)
+    record = records[0]
+    assert record['query'] == 'select id from t'
+    assert (record['user'], record['database'], record['application_name']) == ('slow', 'test', 'app')
+    assert record['rows'] == 3
+    assert record['bytes'] > 0
+    stages = [name for name, elapsed in record['stages']]
+    assert 'query_tables' in stages and stages[-1] == 'send_results'
+    assert record['trace_id'] is not None
+
+
+def test_tracing_is_disabled_by_default(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('span created')
+
+    monkeypatch.setattr(tracing, 'Span', fail)
+    with serve(RowsHandler) as server:
+        with Connection(server) as conn:
+            assert conn.query('select id from t').errors == []
+        handler = RowsHandler.__new__(RowsHandler)
+        handler.server = server
+        assert type(handler.tracer) is tracing.Tracer
+        assert handler.trace_span('execute_query') is NULL_SPAN
+        assert handler.stage('query_tables') is NULL_STAGE
@@ -0,0 +1,55 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+import struct
+import uuid
+import pytest
+from postgres_proto.socket_handler import PostgresRequestHandler
+from postgres_proto.socket_handler.predicates import parse_where_predicates, filter_rows
+from postgres_proto.types import decode_params, TEXT_FORMAT, BINARY_FORMAT
+from wire import serve, Connection, parse, bind, execute
+
+
+def test_decode_text_params():
+    params = [b't', b'42', b'1.5', b'12.30', b'2024-02-29', b'2024-02-29 10:00:00+00:00', b'{"a": 1}', b'\\x0aff', b'x', None]
+    types = [16, 23, 701, 1700, 1082, 1184, 114, 17, 0, 23]
+    assert decode_params(params, [], types) == [
+        True, 42, 1.5, Decimal('12.30'), date(2024, 2, 29), datetime(2024, 2, 29, 10, tzinfo=timezone.utc),
+        {'a': 1}, b'\n\xff', 'x', None]
+
+
+def test_decode_binary_params():
+    value = uuid.uuid4()
+    # numeric 12345.67: digits 1, 2345, 6700 with weight 1 and 2 decimals
+    numeric = struct.pack('!hhHh3h', 3, 1, 0x4000, 2, 1, 2345, 6700)
+    params = [b'\x01', struct.pack('!q', -7), struct.pack('!d', 0.25), numeric, struct.pack('!i', 1), value.bytes]
+    types = [16, 20, 701, 1700, 1082, 2950]
+    assert decode_params(params, [BINARY_FORMAT], types) == [True, -7, 0.25, Decimal('-12345.67'), date(2000, 1, 2), value]
+    # per parameter formats
+    assert decode_params([b'5', struct.pack('!h', 5)], [TEXT_FORMAT, BINARY_FORMAT], [21, 21]) == [5, 5]
+
+
+def test_malformed_params():
+    with pytest.raises(ValueError):
+        decode_params([b'abc'], [], [23])
+    with pytest.raises(ValueError):
+        decode_params([b'\x00\x01'], [BINARY_FORMAT], [20])
+
+
+class ParamsHandler(PostgresRequestHandler):
+    def query_tables(self, stmt_info):
+        self.server.params.append(stmt_info.params)
+        rows = [{'id': i, 'day': date(2024, 1, i)} for i in range(1, 11)]
+        predicates = parse_where_predicates(stmt_info.where, stmt_info.tables[0], stmt_info.params)
+        return list(filter_rows(rows, predicates)), ['id', 'day']
+
+
+def test_bound_parameters_are_typed_values():
+    with serve(ParamsHandler, params=[]) as server, Connection(server) as conn:
+        response = conn.extended(parse('s', 'select id from t where id > $1 and day <= $2 limit $3', [23, 1082, 20]),
+                                 bind('', 's', [struct.pack('!i', 5), b'2024-01-08', struct.pack('!q', 2)], [1, 0, 1]),
+                                 execute(''))
+        assert response.errors == []
+        assert server.params == [[5, date(2024, 1, 8), 2]]
+        assert response.rows == [['6'], ['7']]
+        response = conn.extended(parse('', 'select id from t where id = $1', [23]), bind('', '', [b'one']))
+        assert response.error_codes == ['22P02']
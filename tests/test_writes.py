@@ -0,0 +1,61 @@
+from postgres_proto.socket_handler import PostgresRequestHandler
+from wire import serve, Connection, parse, bind, execute
+
+
+class InsertHandler(PostgresRequestHandler):
+    def insert_rows(self, table, rows, stmt_info):
+        self.server.inserts.append(rows)
+        return len(rows)
+
+
+def insert_many(conn, values):
+    messages = [parse('s', 'insert into t (id, name) values ($1, $2)', [23, 25])]
+    for value in values:
+        messages += [bind('', 's', [value, f"name {value}"]), execute('')]
+    return conn.extended(*messages)
+
+
+def test_executions_of_an_insert_are_merged():
+    with serve(InsertHandler, inserts=[]) as server, Connection(server, user='writer') as conn:
+        response = insert_many(conn, [1, 2, 3])
+        assert response.errors == []
+        assert response.tags == ['INSERT 0 1'] * 3
+        assert server.inserts == [[{'id': 1, 'name': 'name 1'}, {'id': 2, 'name': 'name 2'}, {'id': 3, 'name': 'name 3'}]]
+        response = conn.query("select query, calls, rows from pg_stat_statements where userid = 'writer'")
+        assert ['insert into t (id, name) values ($1, $2)', '3', '3'] in response.rows
+
+
+def test_merged_insert_checks_transaction_status():
+    with serve(InsertHandler, inserts=[]) as server, Connection(server) as conn:
+        conn.query('BEGIN')
+        assert conn.query('VACUUM t').errors != []
+        response = insert_many(conn, [1, 2])
+        assert response.error_codes == ['25P02']
+        assert server.inserts == []
+        assert conn.query('ROLLBACK').errors == []
+        assert insert_many(conn, [1, 2]).errors == []
+        assert len(server.inserts) == 1
+
+
+def test_merged_insert_errors_abort_transaction():
+    with serve(InsertHandler, inserts=[]) as server, Connection(server) as conn:
+        conn.query('BEGIN')
+        # two values for a single column
+        response = conn.extended(parse('s', 'insert into t (id) values ($1, $2)', [23, 23]),
+                                 bind('', 's', [1, 2]), execute(''), bind('', 's', [3, 4]), execute(''))
+        assert response.error_codes != []
+        assert response.status == b'E'
+
+
+class UnbatchedInsertHandler(InsertHandler):
+    batch_executions = False
+
+
+def test_repeated_executions_of_a_portal_run_once():
+    for handler in (InsertHandler, UnbatchedInsertHandler):
+        with serve(handler, inserts=[]) as server, Connection(server) as conn:
+            response = conn.extended(parse('s', 'insert into t (id) values ($1)', [23]), bind('p', 's', [1]),
+                                     execute('p'), execute('p'), execute('p'), bind('q', 's', [2]), execute('q'))
+            assert response.errors == []
+            assert response.tags == ['INSERT 0 1'] * 4
+            assert server.inserts == [[{'id': 1}], [{'id': 2}]]
@@ -0,0 +1,190 @@
+"""Minimal frontend speaking the postgres protocol, used to test handlers over a socket
+"""
+import socket
+import struct
+import threading
+from contextlib import contextmanager
+from postgres_proto.server import create_server
+from postgres_proto.scram import ScramClientExchange, SCRAM_MECHANISM
+
+
+@contextmanager
+def serve(handler, **server_properties):
+    server = create_server(handler, 0, '127.0.0.1')
+    server.daemon_threads = True
+    for prop, value in server_properties.items():
+        setattr(server, prop, value)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def message(code, payload=b''):
+    return code + struct.pack('!i', len(payload) + 4) + payload
+
+
+def cstring(value):
+    return (value if isinstance(value, bytes) else value.encode()) + b'\x00'
+
+
+def parse(name, query, param_types=()):
+    return message(b'P', cstring(name) + cstring(query) + struct.pack('!h', len(param_types)) +
+                   b''.join(struct.pack('!i', oid) for oid in param_types))
+
+
+def bind(portal, stmt, params=(), formats=()):
+    payload = cstring(portal) + cstring(stmt) + struct.pack('!h', len(formats))
+    payload += b''.join(struct.pack('!h', f) for f in formats) + struct.pack('!h', len(params))
+    for value in params:
+        if value is None:
+            payload += struct.pack('!i', -1)
+        else:
+            value = value if isinstance(value, bytes) else str(value).encode()
+            payload += struct.pack('!i', len(value)) + value
+    return message(b'B', payload + struct.pack('!h', 0))
+
+
+def describe(kind, name):
+    return message(b'D', kind + cstring(name))
+
+
+def execute(portal='', max_rows=0):
+    return message(b'E', cstring(portal) + struct.pack('!i', max_rows))
+
+
+def sync():
+    return message(b'S')
+
+
+def flush():
+    return message(b'H')
+
+
+def decode_row(data):
+    row = []
+    pos = 2
+    for _ in range(struct.unpack('!h', data[:2])[0]):
+        length = struct.unpack('!i', data[pos:pos + 4])[0]
+        pos += 4
+        if length == -1:
+            row.append(None)
+        else:
+            row.append(data[pos:pos + length].decode())
+            pos += length
+    return row
+
+
+def decode_fields(data):
+    return {f[:1]: f[1:].decode() for f in data.split(b'\x00') if f}
+
+
+class Response(object):
+    """Backend messages received up to ReadyForQuery
+    """
+    def __init__(self, messages):
+        self.messages = messages
+
+    @property
+    def codes(self):
+        return [code for code, _ in self.messages]
+
+    @property
+    def rows(self):
+        return [decode_row(data) for code, data in self.messages if code == b'D']
+
+    @property
+    def tags(self):
+        return [data.rstrip(b'\x00').decode() for code, data in self.messages if code == b'C']
+
+    @property
+    def errors(self):
+        return [decode_fields(data) for code, data in self.messages if code == b'E']
+
+    @property
+    def error_codes(self):
+        return [e[b'C'] for e in self.errors]
+
+    @property
+    def notifications(self):
+        return [data[4:].split(b'\x00')[:2] for code, data in self.messages if code == b'A']
+
+    @property
+    def auth_requests(self):
+        return [struct.unpack('!i', data[:4])[0] for code, data in self.messages if code == b'R']
+
+    @property
+    def status(self):
+        return self.messages[-1][1] if self.messages and self.messages[-1][0] == b'Z' else None
+
+
+class Connection(object):
+    def __init__(self, server, user='test', database='test', password=None, **params):
+        self.sock = socket.create_connection(server.server_address[:2], timeout=10)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile('rb')
+        self.password = password
+        params = dict(user=user, database=database, **params)
+        body = struct.pack('!i', 196608) + b''.join(cstring(k) + cstring(v) for k, v in params.items()) + b'\x00'
+        self.sock.sendall(struct.pack('!i', len(body) + 4) + body)
+        self.startup = self.read_response()
+
+    def send(self, *messages):
+        self.sock.sendall(b''.join(messages))
+
+    def read_message(self):
+        code = self.rfile.read(1)
+        if not code:
+            return None, None
+        length = struct.unpack('!i', self.rfile.read(4))[0]
+        return code, self.rfile.read(length - 4)
+
+    def read_response(self):
+        messages = []
+        while True:
+            code, data = self.read_message()
+            if code is None:
+                return Response(messages)
+            if code == b'R':
+                self.handle_authentication_request(data)
+            messages.append((code, data))
+            if code == b'Z':
+                return Response(messages)
+
+    def handle_authentication_request(self, data):
+        request = struct.unpack('!i', data[:4])[0]
+        if request == 3: # AuthenticationCleartextPassword
+            self.send(message(b'p', cstring(self.password or '')))
+        elif request == 10: # AuthenticationSASL
+            self.scram = ScramClientExchange(self.password or '')
+            client_first = self.scram.client_first().encode()
+            self.send(message(b'p', cstring(SCRAM_MECHANISM) + struct.pack('!i', len(client_first)) + client_first))
+        elif request == 11: # AuthenticationSASLContinue
+            self.send(message(b'p', self.scram.handle_server_first(data[4:].decode()).encode()))
+        elif request == 12: # AuthenticationSASLFinal
+            self.scram.verify_server_final(data[4:].decode())
+
+    def query(self, sql):
+        self.send(message(b'Q', cstring(sql)))
+        return self.read_response()
+
+    def extended(self, *messages):
+        self.send(*messages, sync())
+        return self.read_response()
+
+    def close(self):
+        try:
+            self.sock.sendall(message(b'X'))
+        except OSError:
+            pass
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()